@@ -0,0 +1,6 @@
+"""
+Benchmarks of sqlalchemy_mixins hot paths.
+
+Run them with
+    python -m benchmarks --help
+"""
@@ -0,0 +1,126 @@
+"""
+Run benchmarks against SQLite and print ops/sec, allocations and
+SQL statements per operation.
+
+Examples:
+    python -m benchmarks
+    python -m benchmarks --db file --filter smart_query --json new.json
+    python -m benchmarks --compare old.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import sqlalchemy
+
+from . import async_cases, cases
+from .runner import StatementCounter, measure
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def database_urls(db, directory):
+    if db == 'memory':
+        return 'sqlite://', 'sqlite+aiosqlite://'
+    return ('sqlite:///' + os.path.join(directory, 'sync.db'),
+            'sqlite+aiosqlite:///' + os.path.join(directory, 'async.db'))
+
+
+def run(args):
+    counter = StatementCounter()
+    results = {}
+    loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory() as directory:
+        sync_url, async_url = database_urls(args.db, directory)
+
+        engine = cases.make_engine(sync_url, counter)
+        selected = [case for case in cases.cases()
+                    if args.filter in case.name]
+        if not args.no_async:
+            async_engine = loop.run_until_complete(
+                async_cases.make_engine(async_url, counter))
+            selected += [case for case in async_cases.cases()
+                         if args.filter in case.name]
+
+        for case in selected:
+            results[case.name] = measure(case, counter, args.iterations,
+                                         loop=loop)
+            print_result(case.name, results[case.name], args.baseline)
+
+        if not args.no_async:
+            loop.run_until_complete(async_engine.dispose())
+        engine.dispose()
+    loop.close()
+    return results
+
+
+def print_header():
+    print('{:<30} {:>12} {:>12} {:>10} {:>10}'.format(
+        'benchmark', 'ops/sec', 'alloc, B', 'SQL/op', 'change'))
+
+
+def print_result(name, result, baseline):
+    change = ''
+    if baseline and name in baseline:
+        old = baseline[name]['ops_per_sec']
+        change = '{:+.1f}%'.format((result['ops_per_sec'] - old) / old * 100)
+    print('{:<30} {:>12.1f} {:>12.0f} {:>10.2f} {:>10}'.format(
+        name, result['ops_per_sec'], result['alloc_bytes'],
+        result['statements'], change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark sqlalchemy_mixins hot paths on SQLite')
+    parser.add_argument('--db', choices=['memory', 'file'], default='memory',
+                        help='SQLite database kind (default: memory)')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='measured iterations per benchmark')
+    parser.add_argument('--filter', default='',
+                        help='run only benchmarks containing this string')
+    parser.add_argument('--no-async', action='store_true',
+                        help='skip aiosqlite benchmarks')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write machine-readable results to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='show change against results saved by --json')
+    args = parser.parse_args(argv)
+
+    args.baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            args.baseline = json.load(f)['results']
+
+    print_header()
+    results = run(args)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'sqlalchemy': sqlalchemy.__version__,
+                    'db': args.db,
+                    'iterations': args.iterations,
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
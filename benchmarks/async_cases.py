@@ -0,0 +1,62 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from sqlalchemy_mixins.eagerload import JOINED, SELECTIN
+
+from .cases import hops_filter
+from .models import AsyncBase, AsyncBaseModel, AsyncPost, AsyncComment, \
+    HOPS, seed
+from .runner import Case
+
+
+async def make_engine(url, counter):
+    engine = create_async_engine(url)
+    event.listen(engine.sync_engine, 'before_cursor_execute', counter)
+    async with engine.begin() as connection:
+        await connection.run_sync(AsyncBase.metadata.drop_all)
+        await connection.run_sync(AsyncBase.metadata.create_all)
+        await connection.run_sync(seed, AsyncBase.metadata)
+    AsyncBaseModel.set_session(
+        async_sessionmaker(engine, expire_on_commit=False))
+    return engine
+
+
+def cases():
+    result = []
+    for hops in (0, len(HOPS)):
+        filters = hops_filter(hops)
+
+        async def where(i, f=filters):
+            return (await AsyncComment.select_async(filters=f)).all()
+        result.append(Case('where_async[hops={}]'.format(hops), where,
+                           is_async=True))
+
+    async def with_(i):
+        return (await AsyncPost.with_async({
+            AsyncPost.user: JOINED,
+            AsyncPost.comments: SELECTIN,
+        })).all()
+
+    async def create(i):
+        return await AsyncPost.create_async(body='new post', user_id=1)
+
+    async def find(i):
+        return await AsyncPost.find_async(i % 100 + 1)
+
+    first_id = [0]
+
+    async def setup_destroy(iterations):
+        posts = [await AsyncPost.create_async(body='to destroy')
+                 for _ in range(iterations)]
+        first_id[0] = posts[0].id
+
+    async def destroy(i):
+        await AsyncPost.destroy_async(first_id[0] + i)
+
+    result += [
+        Case('with_async', with_, is_async=True),
+        Case('create_async', create, is_async=True),
+        Case('find_async', find, is_async=True),
+        Case('destroy_async', destroy, setup=setup_destroy, is_async=True),
+    ]
+    return result
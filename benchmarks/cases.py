@@ -0,0 +1,97 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from sqlalchemy_mixins.eagerload import JOINED, SELECTIN, SUBQUERY
+
+from .models import Base, BaseModel, Post, Comment, User, HOPS, seed
+from .runner import Case
+
+
+def hops_filter(hops):
+    """Filter on a column `hops` relations away from Comment"""
+    return {'___'.join(HOPS[:hops] + ['id']) + '__ge': 1}
+
+
+def make_engine(url, counter):
+    engine = create_engine(url)
+    event.listen(engine, 'before_cursor_execute', counter)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        seed(connection, Base.metadata)
+    BaseModel.set_session(Session(engine))
+    return engine
+
+
+def cases():
+    session = lambda: BaseModel.session
+
+    def fresh(fn):
+        # every iteration loads from database, not from identity map
+        def wrapped(i):
+            session().expunge_all()
+            return fn(i)
+        return wrapped
+
+    result = [
+        Case('filter_expr', lambda i: Post.filter_expr(
+            id__gt=1, body__like='post%', user_id__in=[1, 2, 3],
+            archived=False)),
+        Case('order_expr', lambda i: Post.order_expr('-id', 'body')),
+    ]
+
+    for hops in range(len(HOPS) + 1):
+        filters = hops_filter(hops)
+        sort_attrs = ['-' + '___'.join(HOPS[:hops] + ['id'])]
+        result.append(Case(
+            'smart_query_build[hops={}]'.format(hops),
+            lambda i, f=filters, s=sort_attrs: Comment.smart_query(f, s)))
+        result.append(Case(
+            'smart_query_all[hops={}]'.format(hops),
+            fresh(lambda i, f=filters, s=sort_attrs:
+                  Comment.smart_query(f, s).limit(20).all())))
+
+    schemas = {
+        'joined': {Post.user: JOINED},
+        'subquery': {Post.comments: SUBQUERY},
+        'selectin': {Post.comments: SELECTIN},
+        'nested': {Post.user: (SELECTIN, {User.company: JOINED}),
+                   Post.comments: SELECTIN},
+    }
+    for name, schema in schemas.items():
+        result.append(Case('with_build[{}]'.format(name),
+                           lambda i, s=schema: Post.with_(s)))
+        result.append(Case('with_all[{}]'.format(name),
+                           fresh(lambda i, s=schema:
+                                 Post.with_(s).limit(20).all())))
+
+    posts = Post.with_({Post.user: JOINED, Post.comments: SELECTIN}).all()
+    result += [
+        Case('to_dict[flat]', lambda i: posts[i % len(posts)].to_dict()),
+        Case('to_dict[nested]',
+             lambda i: posts[i % len(posts)].to_dict(nested=True)),
+        Case('to_dict[hybrid]', lambda i: posts[i % len(posts)].to_dict(
+            hybrid_attributes=True)),
+        Case('repr', lambda i: repr(posts[i % len(posts)])),
+        Case('fill', lambda i: Post().fill(body='post', archived=True,
+                                           user_id=1, public=False)),
+        Case('fill_many[100]', lambda i: Post.fill_many(
+            [Post() for _ in range(100)],
+            [{'body': 'post', 'archived': True, 'user_id': 1}] * 100)),
+    ]
+
+    first_id = [0]
+
+    def setup_destroy(iterations):
+        rows = [Post(body='to destroy') for _ in range(iterations)]
+        session().add_all(rows)
+        session().commit()
+        first_id[0] = rows[0].id
+
+    result += [
+        Case('create', lambda i: Post.create(body='new post', user_id=1)),
+        Case('find', fresh(lambda i: Post.find(i % 100 + 1))),
+        Case('destroy', lambda i: Post.destroy(first_id[0] + i),
+             setup=setup_destroy),
+    ]
+    return result
@@ -0,0 +1,122 @@
+import sqlalchemy as sa
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import DeclarativeBase, relationship
+
+from sqlalchemy_mixins import ActiveRecordMixin, ActiveRecordMixinAsync, \
+    SmartQueryMixin, ReprMixin, SerializeMixin
+
+# Comment -> Post -> User -> Company -> Country -> Region
+# so smart_query can be measured with 0 to 5 relation hops
+HOPS = ['post', 'user', 'company', 'country', 'region']
+
+
+def make_models(base, *mixins):
+    class BaseModel(base, *mixins):
+        __abstract__ = True
+        __repr__ = ReprMixin.__repr__
+
+    class Region(BaseModel):
+        __tablename__ = 'region'
+        __repr_attrs__ = ['name']
+        id = sa.Column(sa.Integer, primary_key=True)
+        name = sa.Column(sa.String)
+
+    class Country(BaseModel):
+        __tablename__ = 'country'
+        __repr_attrs__ = ['name']
+        id = sa.Column(sa.Integer, primary_key=True)
+        name = sa.Column(sa.String)
+        region_id = sa.Column(sa.Integer, sa.ForeignKey('region.id'))
+        region = relationship('Region')
+
+    class Company(BaseModel):
+        __tablename__ = 'company'
+        __repr_attrs__ = ['name']
+        id = sa.Column(sa.Integer, primary_key=True)
+        name = sa.Column(sa.String)
+        country_id = sa.Column(sa.Integer, sa.ForeignKey('country.id'))
+        country = relationship('Country')
+
+    class User(BaseModel):
+        __tablename__ = 'user'
+        __repr_attrs__ = ['name']
+        id = sa.Column(sa.Integer, primary_key=True)
+        name = sa.Column(sa.String)
+        company_id = sa.Column(sa.Integer, sa.ForeignKey('company.id'))
+        company = relationship('Company')
+        posts = relationship('Post', back_populates='user')
+
+    class Post(BaseModel):
+        __tablename__ = 'post'
+        __repr_attrs__ = ['body']
+        id = sa.Column(sa.Integer, primary_key=True)
+        body = sa.Column(sa.String)
+        archived = sa.Column(sa.Boolean, default=False)
+        user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+        user = relationship('User', back_populates='posts')
+        comments = relationship('Comment', back_populates='post')
+
+        @hybrid_property
+        def public(self):
+            return not self.archived
+
+        @public.setter
+        def public(self, public):
+            self.archived = not public
+
+    class Comment(BaseModel):
+        __tablename__ = 'comment'
+        __repr_attrs__ = ['body']
+        id = sa.Column(sa.Integer, primary_key=True)
+        body = sa.Column(sa.String)
+        rating = sa.Column(sa.Integer)
+        post_id = sa.Column(sa.Integer, sa.ForeignKey('post.id'))
+        post = relationship('Post', back_populates='comments')
+
+    return BaseModel, Region, Country, Company, User, Post, Comment
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+
+
+class AsyncBase(DeclarativeBase):
+    __abstract__ = True
+
+
+BaseModel, Region, Country, Company, User, Post, Comment = make_models(
+    Base, ActiveRecordMixin, SmartQueryMixin, ReprMixin, SerializeMixin)
+
+AsyncBaseModel, AsyncRegion, AsyncCountry, AsyncCompany, AsyncUser, \
+    AsyncPost, AsyncComment = make_models(
+        AsyncBase, ActiveRecordMixinAsync, SmartQueryMixin, ReprMixin,
+        SerializeMixin)
+
+
+def seed_rows(users=20, posts_per_user=5, comments_per_post=4):
+    """Rows to insert (table name, list of dicts), parents first"""
+    rows = [
+        ('region', [{'id': 1, 'name': 'Europe'}]),
+        ('country', [{'id': 1, 'name': 'Ukraine', 'region_id': 1}]),
+        ('company', [{'id': 1, 'name': 'ACME', 'country_id': 1}]),
+    ]
+    user_rows, post_rows, comment_rows = [], [], []
+    for u in range(1, users + 1):
+        user_rows.append({'id': u, 'name': 'user %d' % u, 'company_id': 1})
+        for p in range(posts_per_user):
+            post_id = len(post_rows) + 1
+            post_rows.append({'id': post_id, 'body': 'post %d' % post_id,
+                              'archived': p % 2 == 0, 'user_id': u})
+            for c in range(comments_per_post):
+                comment_id = len(comment_rows) + 1
+                comment_rows.append({'id': comment_id,
+                                     'body': 'comment %d' % comment_id,
+                                     'rating': c, 'post_id': post_id})
+    rows += [('user', user_rows), ('post', post_rows),
+             ('comment', comment_rows)]
+    return rows
+
+
+def seed(connection, metadata):
+    for table_name, rows in seed_rows():
+        connection.execute(metadata.tables[table_name].insert(), rows)
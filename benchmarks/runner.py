@@ -0,0 +1,90 @@
+import asyncio
+import gc
+import time
+import tracemalloc
+
+
+class Case(object):
+    """
+    One benchmark: `fn(i)` is called for every iteration i.
+    `setup(iterations)` runs before measuring (not measured).
+    Coroutine functions are awaited.
+    """
+
+    def __init__(self, name, fn, setup=None, is_async=False):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+        self.is_async = is_async
+
+
+class StatementCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context,
+                 executemany):
+        self.count += 1
+
+
+def _run_sync(case, start, stop):
+    fn = case.fn
+    for i in range(start, stop):
+        fn(i)
+
+
+async def _run_async(case, start, stop):
+    fn = case.fn
+    for i in range(start, stop):
+        await fn(i)
+
+
+def _run(case, start, stop, loop):
+    if case.is_async:
+        loop.run_until_complete(_run_async(case, start, stop))
+    else:
+        _run_sync(case, start, stop)
+
+
+def _setup(case, iterations, loop):
+    if case.setup is None:
+        return
+    if case.is_async:
+        loop.run_until_complete(case.setup(iterations))
+    else:
+        case.setup(iterations)
+
+
+def measure(case, counter, iterations, warmup=10, alloc_samples=20,
+            loop=None):
+    """
+    :return: dict with ops_per_sec, alloc_bytes (average peak memory
+     allocated by one operation) and statements (SQL statements
+     per operation)
+    """
+    loop = loop or asyncio.new_event_loop()
+    total = warmup + iterations + alloc_samples
+    _setup(case, total, loop)
+    _run(case, 0, warmup, loop)
+
+    gc.collect()
+    counter.count = 0
+    started = time.perf_counter()
+    _run(case, warmup, warmup + iterations, loop)
+    elapsed = time.perf_counter() - started
+    statements = counter.count / iterations
+
+    tracemalloc.start()
+    peaks = []
+    for i in range(warmup + iterations, total):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        _run(case, i, i + 1, loop)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return {
+        'ops_per_sec': iterations / elapsed,
+        'alloc_bytes': sum(peaks) / len(peaks) if peaks else 0,
+        'statements': statements,
+    }
@@ -6,7 +6,8 @@ from .inspection import InspectionMixin
 from .activerecord import ActiveRecordMixin, ModelNotFoundError
 from .activerecordasync import ActiveRecordMixinAsync
 from .smartquery import SmartQueryMixin, smart_query
-from .eagerload import EagerLoadMixin, JOINED, SUBQUERY
+from .eagerload import EagerLoadMixin, JOINED, SUBQUERY, SELECTIN, RAISE, \
+    NOLOAD, IMMEDIATE, LAZY, RAISE_ON_SQL
 from .repr import ReprMixin
 from .serialize import SerializeMixin
 from .timestamp import TimestampsMixin
@@ -23,10 +24,16 @@ __all__ = [
     "ActiveRecordMixinAsync",
     "AllFeaturesMixin",
     "EagerLoadMixin",
+    "IMMEDIATE",
     "InspectionMixin",
     "JOINED",
+    "LAZY",
     "ModelNotFoundError",
+    "NOLOAD",
+    "RAISE",
+    "RAISE_ON_SQL",
     "ReprMixin",
+    "SELECTIN",
     "SerializeMixin",
     "SessionMixin",
     "smart_query",
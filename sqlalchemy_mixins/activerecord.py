@@ -1,27 +1,124 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from . import cache as _cache
+from .instrumentation import tag
 from .utils import classproperty
 from .session import SessionMixin
-from .inspection import InspectionMixin
+from .inspection import InspectionMixin, settable_setters
+
+
+# Batch started by ActiveRecordMixin.batch() in current context
+_current_batch = ContextVar('sqlalchemy_mixins_batch', default=None)
+
+# sessions with savepoints started by savepoint() in current context
+_savepoint_sessions = ContextVar('sqlalchemy_mixins_savepoints', default=())
+
+
+def _fill(obj, setters, values):
+    unknown = values.keys() - setters.keys()
+    if unknown:
+        name = next(name for name in values if name in unknown)
+        raise KeyError("Attribute '{}' doesn't exist".format(name))
+    for name, value in values.items():
+        setters[name](obj, value)
+    return obj
+
+
+def _fill_many(cls, instances, rows):
+    setters = settable_setters(cls)
+    instances, rows = list(instances), list(rows)
+    if len(instances) != len(rows):
+        raise ValueError('Got {} instances and {} rows'
+                         .format(len(instances), len(rows)))
+    for obj, values in zip(instances, rows):
+        _fill(obj, setters, values)
+    return instances
+
+
+@contextmanager
+def _in_savepoint(session):
+    token = _savepoint_sessions.set(_savepoint_sessions.get() + (session,))
+    try:
+        yield
+    finally:
+        _savepoint_sessions.reset(token)
+
+
+def _is_in_savepoint(session):
+    return any(s is session for s in _savepoint_sessions.get())
 
 
 class ModelNotFoundError(ValueError):
     pass
 
 
+class Batch(object):
+    """
+    State of ActiveRecordMixin.batch(): commits requested by
+    save/create/update/delete are replaced with a flush per `size`
+    operations and one commit at the end.
+    """
+
+    def __init__(self, session, size):
+        self.session = session
+        self.size = size
+        self.operations = 0
+        self.flushes = 0
+        self.commits = 0
+        self._pending = 0
+
+    def add(self, flush=False):
+        self.operations += 1
+        self._pending += 1
+        if flush or self._pending >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.session.flush()
+            self.flushes += 1
+            self._pending = 0
+
+    @property
+    def saved_commits(self):
+        """Commits (and transactions) saved compared to commit per call"""
+        return self.operations - self.commits
+
+    @property
+    def saved_flushes(self):
+        """Flushes saved compared to commit (which flushes) per call"""
+        return self.operations - self.flushes
+
+    def __repr__(self):
+        return ('<Batch operations:{} flushes:{} commits:{}>'
+                .format(self.operations, self.flushes, self.commits))
+
+
 class ActiveRecordMixin(InspectionMixin, SessionMixin):
     __abstract__ = True
 
+    # cache of find() results, see set_pk_cache()
+    _pk_cache = None
+
     @classproperty
     def settable_attributes(cls):
         return cls.columns + cls.hybrid_properties + cls.settable_relations
 
     def fill(self, **kwargs):
-        for name in kwargs.keys():
-            if name in self.settable_attributes:
-                setattr(self, name, kwargs[name])
-            else:
-                raise KeyError("Attribute '{}' doesn't exist".format(name))
+        return _fill(self, settable_setters(type(self)), kwargs)
 
-        return self
+    @classmethod
+    def fill_many(cls, instances, rows):
+        """
+        Fills instances with dicts of attributes (pairwise), like
+        calling fill() for each, but with setters looked up once:
+            users = User.fill_many([User() for _ in rows], rows)
+
+        :raises KeyError: if some attribute is not settable
+        :return: list of instances
+        """
+        return _fill_many(cls, instances, rows)
 
     def save(self, commit=True):
         """Saves the updated model to the current entity db.
@@ -56,12 +153,91 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
             self._commit_or_fail()
 
     def _commit_or_fail(self):
+        # inside savepoint, flush at once so errors are raised (and rolled
+        # back) in the savepoint, the transaction is committed later
+        in_savepoint = _is_in_savepoint(self.session)
+        batch = _current_batch.get()
+        if batch is not None and batch.session is self.session:
+            batch.add(flush=in_savepoint)
+            return
+        if in_savepoint:
+            self.session.flush()
+            return
         try:
             self.session.commit()
         except:
             self.session.rollback()
             raise
 
+    @classmethod
+    @contextmanager
+    def batch(cls, size=100):
+        """
+        Unit of work: inside it, save/create/update/delete calls
+        with commit=True don't commit. Changes are flushed every `size`
+        calls and committed once at exit, or all rolled back on error.
+
+        Example:
+            with User.batch(size=500) as batch:
+                for name in names:
+                    User.create(name=name)
+            print(batch.saved_commits)
+
+        Nested batches are a part of the outer one.
+        It's bound to the current thread/asyncio task (see contextvars).
+
+        :param size: number of calls per flush
+        :rtype: Batch
+        """
+        batch = _current_batch.get()
+        if batch is not None and batch.session is cls.session:
+            yield batch
+            return
+
+        batch = Batch(cls.session, size)
+        token = _current_batch.set(batch)
+        try:
+            yield batch
+            batch.flush()
+            batch.session.commit()
+            batch.commits += 1
+        except:
+            batch.session.rollback()
+            raise
+        finally:
+            _current_batch.reset(token)
+
+    @classmethod
+    @contextmanager
+    def savepoint(cls, collect=None):
+        """
+        Nested transaction (SAVEPOINT). On error, only changes made inside
+        it are rolled back, so one bad row doesn't spoil the whole import.
+        Inside it, save/create/update/delete calls flush instead of commit,
+        so commit the session after (or use it inside batch()).
+
+        Example:
+            errors = []
+            with User.batch():
+                for row in rows:
+                    with User.savepoint(collect=errors):
+                        User.create(**row)
+            print('{} rows failed'.format(len(errors)))
+
+        :param collect: list to append an exception to instead of raising it
+        """
+        session = cls.session
+        transaction = session.begin_nested()
+        try:
+            with _in_savepoint(session):
+                yield transaction
+            transaction.commit()
+        except Exception as e:
+            transaction.rollback()
+            if collect is None:
+                raise
+            collect.append(e)
+
     @classmethod
     def destroy(cls, *ids, commit=True):
         """Delete the records with the given ids
@@ -77,18 +253,51 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
 
     @classmethod
     def all(cls):
-        return cls.query.all()
+        return tag(cls.query, cls, 'all').all()
 
     @classmethod
     def first(cls):
-        return cls.query.first()
+        return tag(cls.query, cls, 'first').first()
+
+    @classmethod
+    def set_pk_cache(cls, cache):
+        """
+        Enables cache of find() results for this model and its subclasses.
+        It keeps loaded column attributes (not relations) of instances,
+        so hot rarely changed rows (tenant, config) are found without SQL
+        in new sessions. Instances are dropped from the cache when they
+        are changed by any session (on flush, UPDATE/DELETE statements
+        and commit/rollback).
+
+        Example:
+            Tenant.set_pk_cache(MemoryCache(maxsize=1000, ttl=300))
+            Tenant.find(1)
+            Tenant._pk_cache.hit_rate
+
+        :type cache: sqlalchemy_mixins.cache.Cache | None
+        """
+        cls._pk_cache = cache
+        if cache is not None:
+            _cache.register_pk_cache(cache)
 
     @classmethod
     def find(cls, id_):
         """Find record by the id
         :param id_: the primary key
         """
-        return cls.query.get(id_)
+        cache = cls._pk_cache
+        version = None
+        if cache is not None:
+            key = _cache.instance_key(cls, id_, cls.session)
+            if key is not None:
+                obj = _cache.load_instance(cache, key, cls.session)
+                if obj is not None:
+                    return obj
+                version = _cache.instance_version(cache, key)
+        obj = tag(cls.query, cls, 'find').get(id_)
+        if version is not None and obj is not None:
+            _cache.save_instance(cache, obj, cls.session, version)
+        return obj
 
     @classmethod
     def find_or_fail(cls, id_):
@@ -1,5 +1,8 @@
-from typing import List, Any, Optional
+from typing import List, Any, Optional, ContextManager, Dict, Iterable
 
+from sqlalchemy.orm import Session, SessionTransaction
+
+from sqlalchemy_mixins.cache import Cache
 from sqlalchemy_mixins.inspection import InspectionMixin
 from sqlalchemy_mixins.session import SessionMixin
 from sqlalchemy_mixins.utils import classproperty
@@ -7,6 +10,27 @@ from sqlalchemy_mixins.utils import classproperty
 
 class ModelNotFoundError(ValueError): ...
 
+
+class Batch:
+    session: Session
+    size: int
+    operations: int
+    flushes: int
+    commits: int
+
+    def __init__(self, session: Session, size: int) -> None: ...
+
+    def add(self, flush: bool = False) -> None: ...
+
+    def flush(self) -> None: ...
+
+    @property
+    def saved_commits(self) -> int: ...
+
+    @property
+    def saved_flushes(self) -> int: ...
+
+
 class ActiveRecordMixin(InspectionMixin, SessionMixin):
 
     @classproperty
@@ -14,6 +38,13 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
 
     def fill(self, **kwargs: Any) -> "ActiveRecordMixin": ...
 
+    @classmethod
+    def fill_many(
+            cls,
+            instances: Iterable["ActiveRecordMixin"],
+            rows: Iterable[Dict[str, Any]]
+    ) -> List["ActiveRecordMixin"]: ...
+
     def save(self) -> "ActiveRecordMixin": ...
 
     @classmethod
@@ -23,6 +54,15 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
 
     def delete(self) -> None: ...
 
+    @classmethod
+    def batch(cls, size: int = 100) -> ContextManager[Batch]: ...
+
+    @classmethod
+    def savepoint(
+            cls,
+            collect: Optional[List[Exception]] = None
+    ) -> ContextManager[SessionTransaction]: ...
+
     @classmethod
     def destroy(cls, *ids: list) -> None: ...
 
@@ -32,6 +72,9 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
     @classmethod
     def first(cls) -> Optional["ActiveRecordMixin"]: ...
 
+    @classmethod
+    def set_pk_cache(cls, cache: Optional[Cache]) -> None: ...
+
     @classmethod
     def find(cls, id_: Any) -> Optional["ActiveRecordMixin"]: ...
 
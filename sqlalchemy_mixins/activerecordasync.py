@@ -1,11 +1,29 @@
+import asyncio
+from contextlib import asynccontextmanager
+try:
+    from contextlib import aclosing
+except ImportError:  # pragma: no cover, python < 3.10
+    @asynccontextmanager
+    async def aclosing(thing):
+        try:
+            yield thing
+        finally:
+            await thing.aclose()
+
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Query
 from sqlalchemy.exc import InvalidRequestError
 from .utils import classproperty
 from .session import SessionMixin
-from .inspection import InspectionMixin
-from .activerecord import ModelNotFoundError
+from .inspection import InspectionMixin, settable_setters
+from .activerecord import ModelNotFoundError, _in_savepoint, \
+    _is_in_savepoint, _fill, _fill_many
+from .instrumentation import tag
+from .eagerload import async_schema, JOINED, SUBQUERY, SELECTIN
 from . import smartquery as SmaryQuery
+from . import cache as _cache
+from . import scan as _scan
 
 get_root_cls = SmaryQuery._get_root_cls
 def async_root_cls(query: Query):
@@ -21,9 +39,18 @@ def async_root_cls(query: Query):
 SmaryQuery._get_root_cls = lambda query: async_root_cls(query)
 
 
+@asynccontextmanager
+async def _borrowed_session(session):
+    # session is owned by the caller, so it's not closed here
+    yield session
+
+
 class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
     __abstract__ = True
 
+    # cache of find_async() results, see set_pk_cache()
+    _pk_cache = None
+
     @classmethod
     def _get_primary_key_name(cls) -> str:
         """
@@ -44,18 +71,90 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
 
         return primary_keys[0].name
 
+    @classmethod
+    def _session_scope(cls):
+        """
+        Session for async methods: a new one from the sessionmaker
+        set by set_session(), or the AsyncSession passed to
+        using_session(), which is left open.
+        """
+        session = cls.session
+        if isinstance(session, AsyncSession):
+            return _borrowed_session(session)
+        return session()
+
+    @classmethod
+    async def _commit_or_fail_async(cls, session):
+        # inside savepoint_async(), flush only: the savepoint rolls back
+        # on error and the caller commits the transaction
+        if _is_in_savepoint(session):
+            await session.flush()
+            return
+        try:
+            await session.commit()
+        except:
+            await session.rollback()
+            raise
+
+    @classmethod
+    @asynccontextmanager
+    async def savepoint_async(cls, collect=None):
+        """
+        Async version of :meth:`savepoint` method. Session should be
+        an AsyncSession set by using_session(), so async methods inside
+        share its transaction.
+
+        Example:
+            async with async_session() as session:
+                with User.using_session(session):
+                    for row in rows:
+                        async with User.savepoint_async(collect=errors):
+                            await User.create_async(**row)
+                    await session.commit()
+
+        :see: :meth:`savepoint`
+        """
+        session = cls.session
+        if not isinstance(session, AsyncSession):
+            raise ValueError('savepoint_async() needs AsyncSession, '
+                             'pass it to using_session()')
+        transaction = await session.begin_nested()
+        try:
+            with _in_savepoint(session):
+                yield transaction
+            await transaction.commit()
+        except Exception as e:
+            await transaction.rollback()
+            if collect is None:
+                raise
+            collect.append(e)
+
+    @classmethod
+    def set_pk_cache(cls, cache):
+        """
+        Enables cache of find_async() results.
+
+        :see: :meth:`ActiveRecordMixin.set_pk_cache`
+        """
+        cls._pk_cache = cache
+        if cache is not None:
+            _cache.register_pk_cache(cache)
+
     @classproperty
     def settable_attributes(cls):
         return cls.columns + cls.hybrid_properties + cls.settable_relations
 
     def fill(self, **kwargs):
-        for name in kwargs.keys():
-            if name in self.settable_attributes:
-                setattr(self, name, kwargs[name])
-            else:
-                raise KeyError("Attribute '{}' doesn't exist".format(name))
+        return _fill(self, settable_setters(type(self)), kwargs)
+
+    @classmethod
+    def fill_many(cls, instances, rows):
+        """
+        Fills instances with dicts of attributes (pairwise).
 
-        return self
+        :see: :meth:`ActiveRecordMixin.fill_many`
+        """
+        return _fill_many(cls, instances, rows)
     
     @classproperty
     def query(cls):
@@ -73,14 +172,10 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
 
         :see: :meth:`save` method for more information.
         """
-        async with self.session() as session:
-            try:
-                session.add(self)
-                await session.commit()
-                return self
-            except:
-                await session.rollback()
-                raise
+        async with self._session_scope() as session:
+            session.add(self)
+            await self._commit_or_fail_async(session)
+            return self
 
     @classmethod
     async def create_async(cls, **kwargs):
@@ -105,16 +200,10 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
 
         :see: :meth:`delete`
         """
-        async with self.session() as session:
-            try:
-                session.sync_session.delete(self)
-                await session.commit()
-                return self
-            except:
-                await session.rollback()
-                raise
-            finally:
-                await session.flush()
+        async with self._session_scope() as session:
+            session.sync_session.delete(self)
+            await self._commit_or_fail_async(session)
+            return self
 
     @classmethod
     async def destroy_async(cls, *ids):
@@ -125,24 +214,181 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
         """
         primary_key = cls._get_primary_key_name()
         if primary_key:
-            async with cls.session() as session:
-                try:
-                    for row in await cls.where_async(**{f"{primary_key}__in": ids}):
-                        session.sync_session.delete(row)
-                    await session.commit()
-                except:
-                    await session.rollback()
-                    raise
-                await session.flush()
+            async with cls._session_scope() as session:
+                for row in await cls.where_async(**{f"{primary_key}__in": ids}):
+                    session.sync_session.delete(row)
+                await cls._commit_or_fail_async(session)
 
     @classmethod
     async def select_async(cls, stmt=None, filters=None, sort_attrs=None, schema=None):
-        async with cls.session() as session:
+        """
+        Objects of smart_query() with filters, sorting and eager load
+        schema, or of given statement.
+
+        The schema is made async-safe (see eagerload.async_schema):
+        nested schemas are loaded with SELECTIN and relationships
+        that would be lazy loaded raise instead, also when no schema
+        is given:
+            users = (await User.select_async(
+                filters={'posts___rating__gt': 3}, sort_attrs=['name'],
+                schema={User.posts: {Post.comments: SELECTIN}})).all()
+        """
+        async with cls._session_scope() as session:
             if stmt is None:
                 stmt = SmaryQuery.smart_query(query=cls.query,
-                    filters=filters, sort_attrs=sort_attrs, schema=schema)
+                    filters=filters, sort_attrs=sort_attrs,
+                    schema=async_schema(schema or {}, cls))
+                stmt = tag(stmt, cls, 'select_async', filters)
             return (await session.execute(stmt)).scalars()
 
+    @classmethod
+    async def stream_batches_async(cls, filters=None, sort_attrs=None,
+                                   size=1000, schema=None, stmt=None):
+        """
+        Async generator of objects in lists of `size`, fetched from
+        a server side cursor with AsyncSession.stream(), so rows are
+        not buffered. Session stays open while iterating, and the next
+        batch is fetched only when the caller asks for it:
+            async for users in User.stream_batches_async(
+                    {'active': True}, ['id'], size=500):
+                await write_csv(users)
+
+        Use `selectin` (not `joined`) loading for collections in
+        the schema, as joined rows can't be split into batches.
+
+        :param size: number of objects in batch
+        :see: :meth:`pipe_batches_async` to fetch the next batch while
+         the current one is processed
+        """
+        if size < 1:
+            raise ValueError('Batch size should be positive, not {}'
+                             .format(size))
+        async with cls._session_scope() as session:
+            if stmt is None:
+                stmt = SmaryQuery.smart_query(query=cls.query,
+                    filters=filters, sort_attrs=sort_attrs,
+                    schema=async_schema(schema or {}, cls))
+                stmt = tag(stmt, cls, 'stream_batches_async', filters)
+            result = await session.stream(
+                stmt.execution_options(yield_per=size))
+            try:
+                async for batch in result.scalars().partitions(size):
+                    yield batch
+            finally:
+                await result.close()
+
+    @classmethod
+    async def pipe_batches_async(cls, consumer, filters=None,
+                                 sort_attrs=None, size=1000, schema=None,
+                                 stmt=None, buffer=1):
+        """
+        Passes batches of :meth:`stream_batches_async` to `consumer`
+        coroutine (say, one writing to socket or file). Next batches
+        are fetched while consumer works, but no more than `buffer`
+        of them are kept waiting, so slow consumer slows down reading
+        instead of filling the memory.
+
+        Example:
+            total = await User.pipe_batches_async(send, sort_attrs=['id'])
+
+        :param consumer: async function called with each batch
+        :param buffer: number of fetched batches waiting for consumer
+        :return: number of objects passed to consumer
+        """
+        queue = asyncio.Queue(maxsize=buffer)
+        done = object()
+
+        async def produce():
+            # stream (and its session) is closed right away when
+            # the producer is cancelled, not when garbage collected
+            async with aclosing(cls.stream_batches_async(
+                    filters, sort_attrs, size, schema, stmt)) as batches:
+                async for batch in batches:
+                    await queue.put(batch)
+            await queue.put(done)
+
+        producer = asyncio.ensure_future(produce())
+        total = 0
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait([getter, producer],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    # producer failed before putting anything else
+                    getter.cancel()
+                    producer.result()
+                batch = getter.result()
+                if batch is done:
+                    break
+                await consumer(batch)
+                total += len(batch)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+        return total
+
+    @classmethod
+    async def parallel_scan_async(cls, fn, filters=None, workers=4,
+                                  batch_size=1000, shards=None,
+                                  method=_scan.MINMAX, checkpoint=None,
+                                  progress=None, schema=None, engine=None):
+        """
+        Async version of parallel_scan: shards are read by asyncio tasks,
+        each with its own AsyncSession. fn may be a coroutine function.
+
+        :see: sqlalchemy_mixins.scan.parallel_scan_async
+        """
+        return await _scan.parallel_scan_async(
+            cls, fn, filters, workers, batch_size, shards, method,
+            checkpoint, progress, schema, engine)
+
+    @classmethod
+    async def select_cached_async(cls, filters=None, sort_attrs=None,
+                                  schema=None, ttl=None):
+        """
+        Async version of :meth:`smart_query_cached` method.
+
+        :see: :meth:`smart_query_cached`
+        """
+        cache = getattr(cls, '_cache', None)
+        if cache is None:
+            return (await cls.select_async(
+                filters=filters, sort_attrs=sort_attrs, schema=schema)).all()
+        async with cls._session_scope() as session:
+            if session.autoflush:
+                await session.flush()
+            key = _cache.query_key(cls, filters, sort_attrs, schema)
+            rows = _cache.load(cache, key, session.sync_session)
+            if rows is None:
+                stmt = SmaryQuery.smart_query(query=cls.query, filters=filters,
+                    sort_attrs=sort_attrs,
+                    schema=async_schema(schema or {}, cls))
+                stmt = tag(stmt, cls, 'select_cached_async', filters)
+                snapshot = _cache.generations(
+                    cache, _cache.statement_tables(stmt))
+                rows = (await session.execute(stmt)).scalars().all()
+                _cache.save(cache, key, rows, snapshot, session.sync_session,
+                            ttl)
+            return rows
+
+    @classmethod
+    async def aggregate_async(cls, filters=None, group_by=None, metrics=None,
+                              sort_attrs=None, as_columns=False):
+        """
+        Async version of aggregate method.
+
+        :see: :meth:`aggregate` method for more details.
+        """
+        stmt = SmaryQuery.aggregate_expr(cls, filters, group_by, metrics,
+                                         sort_attrs)
+        stmt = tag(stmt, cls, 'aggregate_async', filters)
+        async with cls._session_scope() as session:
+            return SmaryQuery.aggregate_result(await session.execute(stmt),
+                                               as_columns)
+
     @classmethod
     async def where_async(cls, **filters):
         """
@@ -189,9 +435,27 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
         :see: :meth:`find` method for more details.
         """
         primary_key = cls._get_primary_key_name()
-        if primary_key:
+        if not primary_key:
+            return None
+        cache = cls._pk_cache
+        if cache is None:
             return (await cls.where_async(**{primary_key: id_})).first()
-        return None
+        async with cls._session_scope() as session:
+            key = _cache.instance_key(cls, id_, session.sync_session)
+            version = None
+            if key is not None:
+                obj = _cache.load_instance(cache, key, session.sync_session)
+                if obj is not None:
+                    return obj
+                version = _cache.instance_version(cache, key)
+            obj = (await session.execute(
+                SmaryQuery.smart_query(cls.query, {primary_key: id_},
+                                       schema=async_schema({}, cls))
+            )).scalars().first()
+            if version is not None and obj is not None:
+                _cache.save_instance(cache, obj, session.sync_session,
+                                     version)
+            return obj
 
     @classmethod
     async def find_or_fail_async(cls, id_):
@@ -210,11 +474,12 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
     @classmethod
     async def with_async(cls, schema):
         """
-        Async version of with method.
+        Async version of with method. Nested schemas are loaded with
+        SELECTIN and unlisted relationships raise instead of lazy load.
 
-        :see: :meth:`with` method for more details.
+        :see: :meth:`with` method and :meth:`select_async`
         """
-        return await cls.select_async(cls.with_(schema))
+        return await cls.select_async(schema=schema or {})
 
     @classmethod
     async def with_joined_async(cls, *paths):
@@ -223,13 +488,26 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
 
         :see: :meth:`with_joined` method for more details.
         """
-        return await cls.select_async(cls.with_joined(*paths))
+        return await cls.select_async(
+            schema={path: JOINED for path in paths})
 
     @classmethod
     async def with_subquery_async(cls, *paths):
         """
-        Async version of with_subquery method.
+        Async version of with_subquery method. Relations are loaded
+        with SELECTIN, which suits async sessions better.
 
         :see: :meth:`with_subquery` method for more details.
         """
-        return await cls.select_async(cls.with_subquery(*paths))
+        return await cls.select_async(
+            schema={path: SUBQUERY for path in paths})
+
+    @classmethod
+    async def with_selectin_async(cls, *paths):
+        """
+        Async version of with_selectin method.
+
+        :see: :meth:`with_selectin` method for more details.
+        """
+        return await cls.select_async(
+            schema={path: SELECTIN for path in paths})
@@ -1,16 +1,32 @@
-from typing import Dict, Iterable, List, Any, Optional
+from typing import AsyncContextManager, AsyncIterator, Awaitable, \
+    Callable, Dict, Iterable, List, Any, Optional, Union
 
+from sqlalchemy_mixins.cache import Cache
+from sqlalchemy_mixins.scan import Checkpoint, ScanProgress
 from sqlalchemy_mixins.inspection import InspectionMixin
 from sqlalchemy_mixins.session import SessionMixin
 from sqlalchemy_mixins.utils import classproperty
 from sqlalchemy.orm import Query, QueryableAttribute
+from sqlalchemy.ext.asyncio import AsyncSessionTransaction
 
 
 class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
 
+    @classmethod
+    def set_pk_cache(cls, cache: Optional[Cache]) -> None: ...
+
     @classproperty
     def settable_attributes(cls) -> List[str]: ...
 
+    def fill(self, **kwargs: Any) -> "ActiveRecordMixinAsync": ...
+
+    @classmethod
+    def fill_many(
+            cls,
+            instances: Iterable["ActiveRecordMixinAsync"],
+            rows: Iterable[Dict[str, Any]]
+    ) -> List["ActiveRecordMixinAsync"]: ...
+
     async def save_async(self) -> "ActiveRecordMixinAsync": ...
 
     @classmethod
@@ -23,6 +39,12 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
     @classmethod
     async def destroy_async(cls, *ids: list) -> None: ...
 
+    @classmethod
+    def savepoint_async(
+            cls,
+            collect: Optional[List[Exception]] = None
+    ) -> AsyncContextManager[AsyncSessionTransaction]: ...
+
     @classmethod
     async def all_async(cls) -> List["ActiveRecordMixinAsync"]: ...
 
@@ -40,9 +62,66 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
         stmt:Optional[str] = None, 
         filters: Optional[Dict[str, Any]] = None,
         sort_attrs: Optional[Iterable[str]] = None,
-        schema: Optional[dict] = None
+        schema: Optional[Union[dict, str]] = None
     ) -> "ActiveRecordMixinAsync": ...
 
+    @classmethod
+    def stream_batches_async(
+            cls,
+            filters: Optional[Union[dict, list]] = None,
+            sort_attrs: Optional[Iterable[str]] = None,
+            size: int = 1000,
+            schema: Optional[Union[dict, str]] = None,
+            stmt: Optional[Any] = None
+    ) -> AsyncIterator[List["ActiveRecordMixinAsync"]]: ...
+
+    @classmethod
+    async def pipe_batches_async(
+            cls,
+            consumer: Callable[[List["ActiveRecordMixinAsync"]],
+                               Awaitable[Any]],
+            filters: Optional[Union[dict, list]] = None,
+            sort_attrs: Optional[Iterable[str]] = None,
+            size: int = 1000,
+            schema: Optional[Union[dict, str]] = None,
+            stmt: Optional[Any] = None,
+            buffer: int = 1
+    ) -> int: ...
+
+    @classmethod
+    async def parallel_scan_async(
+            cls,
+            fn: Callable[[List[Any]], Any],
+            filters: Optional[Union[dict, list]] = None,
+            workers: int = 4,
+            batch_size: int = 1000,
+            shards: Optional[int] = None,
+            method: str = 'minmax',
+            checkpoint: Optional[Union[Checkpoint, str]] = None,
+            progress: Optional[Callable[[ScanProgress], Any]] = None,
+            schema: Optional[Union[dict, str]] = None,
+            engine: Optional[Any] = None
+    ) -> List[Any]: ...
+
+    @classmethod
+    async def select_cached_async(
+            cls,
+            filters: Optional[Dict[str, Any]] = None,
+            sort_attrs: Optional[Iterable[str]] = None,
+            schema: Optional[Union[dict, str]] = None,
+            ttl: Optional[float] = None
+    ) -> List["ActiveRecordMixinAsync"]: ...
+
+    @classmethod
+    async def aggregate_async(
+            cls,
+            filters: Optional[Union[dict, list]] = None,
+            group_by: Optional[Iterable[str]] = None,
+            metrics: Optional[Dict[str, Any]] = None,
+            sort_attrs: Optional[Iterable[str]] = None,
+            as_columns: bool = False
+    ) -> Union[List[Dict[str, Any]], Dict[str, List[Any]]]: ...
+
     @classmethod
     async def where_async(cls, **filters: Any) -> Query: ...
 
@@ -50,10 +129,13 @@ class ActiveRecordMixinAsync(InspectionMixin, SessionMixin):
     async def sort_async(cls, *columns: str) -> Query: ...
 
     @classmethod
-    async def with_async(cls, schema: dict) -> Query: ...
+    async def with_async(cls, schema: Union[dict, str]) -> Query: ...
 
     @classmethod
     async def with_joined_async(cls, *paths: List[QueryableAttribute]) -> Query: ...
 
     @classmethod
     async def with_subquery_async(cls, *paths: List[QueryableAttribute]) -> Query: ...
+
+    @classmethod
+    async def with_selectin_async(cls, *paths: List[QueryableAttribute]) -> Query: ...
@@ -0,0 +1,493 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from sqlalchemy import Table, event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.sql import visitors
+
+from .normalize import filters_hash
+
+# keys of cached query results and table generations
+KEY_PREFIX = 'sqlalchemy_mixins:'
+
+# tables and instances changed by not yet committed/rolled back
+# session transaction
+_INFO_KEY = 'sqlalchemy_mixins_cache_tables'
+_PK_INFO_KEY = 'sqlalchemy_mixins_cache_instances'
+
+# caches set by SmartQueryMixin.set_cache(), invalidated on writes
+# (until they're replaced and garbage collected).
+# Session listeners are registered with the first cache,
+# so there's no overhead until caching is used
+_caches = weakref.WeakSet()
+# caches set by set_pk_cache() of active record mixins
+_pk_caches = weakref.WeakSet()
+_listening = False
+
+
+class Cache(object):
+    """
+    Cache backend: key-value store with optional expiration.
+    Subclasses implement get/set/delete/clear.
+
+    `hits` and `misses` count query result lookups.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def _expires(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return None if ttl is None else time.time() + ttl
+
+    @property
+    def hit_rate(self):
+        """Share of lookups served from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return '<{} hits:{} misses:{} hit_rate:{:.2f}>'.format(
+            type(self).__name__, self.hits, self.misses, self.hit_rate)
+
+
+class MemoryCache(Cache):
+    """In-process LRU cache with TTL"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (self._expires(ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCache(Cache):
+    """
+    Cache in files of a directory, shared by processes of the host.
+    Directory on tmpfs (like /dev/shm) makes it shared memory store.
+    """
+
+    def __init__(self, directory, ttl=None):
+        super().__init__(ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        path = self._path(key)
+        # write and rename, so readers never see a partial file
+        tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp, 'wb') as f:
+            pickle.dump((self._expires(ttl), value), f,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def _class_name(cls):
+    # models of different modules (or registries) may share __name__
+    return '{}.{}'.format(cls.__module__, cls.__qualname__)
+
+
+def _criteria_sql(attr):
+    """
+    .and_() criteria of relationship attribute as SQL with bound values,
+    stable across processes (unlike SQLAlchemy cache keys)
+    """
+    result = []
+    for criteria in getattr(attr, '_extra_criteria', ()):
+        compiled = criteria.compile()
+        result.append((str(compiled), tuple(sorted(
+            (name, repr(value)) for name, value in compiled.params.items()))))
+    return tuple(result)
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted(
+            ((_normalize(k), _normalize(v)) for k, v in value.items()),
+            key=repr)))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_normalize(v) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted((_normalize(v) for v in value),
+                                    key=repr)))
+    if callable(value) and hasattr(value, '__name__'):
+        # sqlalchemy.or_ / and_ in filters
+        return ('fn', value.__name__)
+    if hasattr(value, 'class_') and hasattr(value, 'key'):
+        # relationship attribute in schema, maybe with .of_type() target
+        # and .and_() criteria
+        of_type = getattr(value, '_of_type', None)
+        return ('attr', _class_name(value.class_), value.key,
+                None if of_type is None else
+                (_class_name(of_type.class_), getattr(of_type, 'name', None)),
+                _criteria_sql(value))
+    return (type(value).__name__, repr(value))
+
+
+def query_key(model, filters=None, sort_attrs=None, schema=None):
+    """
+    Cache key of smart_query() result: same for equivalent filters
+    (see normalize_filters()) and equal sorting and schema
+    """
+    parts = (filters_hash(filters), _normalize(list(sort_attrs or [])),
+             _normalize(schema))
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return '{}query:{}:{}'.format(KEY_PREFIX, _class_name(model), digest)
+
+
+def _generation_key(table):
+    return '{}generation:{}'.format(KEY_PREFIX, table)
+
+
+def generations(cache, tables):
+    """
+    Current generation of each table. Generation is a random token
+    replaced on every write, so entries made before the write don't match.
+    Missing (evicted or expired) generation is created, so it doesn't
+    match old entries either.
+    """
+    result = {}
+    for table in tables:
+        key = _generation_key(table)
+        generation = cache.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            cache.set(key, generation)
+        result[table] = generation
+    return result
+
+
+def statement_tables(statement):
+    """Names of tables used by statement, including joined ones"""
+    return {element.fullname for element in visitors.iterate(statement)
+            if isinstance(element, Table)}
+
+
+def _mapper_tables(mapper):
+    tables = {t.fullname for t in mapper.tables}
+    for relationship in mapper.relationships:
+        if relationship.secondary is not None:
+            tables.add(relationship.secondary.fullname)
+    return tables
+
+
+def _graph_tables(objects):
+    """Tables of objects and their loaded (eager or lazy) relations"""
+    tables = set()
+    seen = set()
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        state = inspect(obj)
+        tables.update(_mapper_tables(state.mapper))
+        for relationship in state.mapper.relationships:
+            value = state.dict.get(relationship.key)
+            if value is None:
+                continue
+            if relationship.uselist:
+                stack.extend(value)
+            else:
+                stack.append(value)
+    return tables
+
+
+def load(cache, key, session):
+    """
+    Cached objects merged into the session (without SQL)
+    or None if there's no valid entry
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        snapshot, payload = entry
+        if generations(cache, snapshot) == snapshot:
+            cache.hits += 1
+            return [session.merge(obj, load=False)
+                    for obj in pickle.loads(payload)]
+    cache.misses += 1
+    return None
+
+
+def save(cache, key, objects, snapshot, session, ttl=None):
+    """
+    Stores objects loaded by statement with generations of its tables
+    taken before execution (see statement_tables() and generations()).
+    Tables of loaded relations are added too.
+    Objects are not stored if the session has changes of these tables
+    which are not committed, so other sessions don't see them.
+    """
+    snapshot = dict(snapshot)
+    extra = _graph_tables(objects) - set(snapshot)
+    if (set(snapshot) | extra) & session.info.get(_INFO_KEY, set()):
+        return
+    snapshot.update(generations(cache, extra))
+    payload = pickle.dumps(list(objects), pickle.HIGHEST_PROTOCOL)
+    cache.set(key, (snapshot, payload), ttl)
+
+
+def invalidate(*tables):
+    """
+    Drop cached results depending on tables in all caches.
+    Called on flush, commit and rollback of changes automatically,
+    call it after writes made outside of the ORM session.
+
+    :param tables: table names, Table objects or model classes
+     (instances cached by their find() are dropped too)
+    """
+    names = set()
+    for table in tables:
+        if isinstance(table, str):
+            names.add(table)
+        elif isinstance(table, Table):
+            names.add(table.fullname)
+        else:
+            names.update(_mapper_tables(inspect(table)))
+            _invalidate_instances([(table, None)])
+    for cache in list(_caches):
+        for name in names:
+            cache.set(_generation_key(name), uuid.uuid4().hex)
+
+
+def register(cache):
+    """Invalidate the cache on writes of all sessions"""
+    _caches.add(cache)
+    _listen()
+
+
+def register_pk_cache(cache):
+    """Invalidate cached instances (see set_pk_cache()) on writes"""
+    _pk_caches.add(cache)
+    _listen()
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'do_orm_execute', _do_orm_execute)
+        event.listen(Session, 'after_commit', _after_transaction)
+        event.listen(Session, 'after_rollback', _after_transaction)
+        _listening = True
+
+
+def _pk_key(identity):
+    return '{}pk:{}:{!r}'.format(KEY_PREFIX, _class_name(identity[0]),
+                                 identity[1])
+
+
+def instance_key(cls, id_, session):
+    """
+    Cache key of instance with primary key id_, or None if the session
+    already has it (then it's returned from the session as is)
+    """
+    identity = identity_key(cls, id_)
+    if identity in session.identity_map:
+        return None
+    return _pk_key(identity)
+
+
+def _version_key(key):
+    return key + ':version'
+
+
+def instance_version(cache, key):
+    """
+    Current version of instance key: a random token dropped on every
+    write of the instance. Take it before loading the instance and pass
+    to save_instance(), so instance changed meanwhile isn't used later.
+    """
+    version = cache.get(_version_key(key))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(_version_key(key), version)
+    return version
+
+
+def load_instance(cache, key, session):
+    """
+    Instance restored from cached attributes and merged into the session
+    (without SQL) or None
+    """
+    entry = cache.get(key)
+    if entry is None or instance_version(cache, key) != entry[0]:
+        cache.misses += 1
+        return None
+    cache.hits += 1
+    cls, values = pickle.loads(entry[1])
+    obj = inspect(cls).class_manager.new_instance()
+    for name, value in values.items():
+        set_committed_value(obj, name, value)
+    # not loaded attributes (like deferred ones) are expired,
+    # so they're loaded on access
+    make_transient_to_detached(obj)
+    return session.merge(obj, load=False)
+
+
+def save_instance(cache, obj, session, version, ttl=None):
+    """
+    Stores loaded column attributes of the instance (detached snapshot,
+    without relations) with its version taken before loading
+    (see instance_version()). Instances with changes not committed
+    by the session are not stored.
+    """
+    state = inspect(obj)
+    if state.key is None or state.modified or \
+            _mapper_tables(state.mapper) & session.info.get(_INFO_KEY, set()):
+        return
+    values = {prop.key: state.dict[prop.key]
+              for prop in state.mapper.column_attrs
+              if prop.key in state.dict}
+    cache.set(_pk_key(state.key),
+              (version, pickle.dumps((state.class_, values),
+                                     pickle.HIGHEST_PROTOCOL)),
+              ttl)
+
+
+def _invalidate_instances(keys):
+    for cls, key in keys:
+        cache = getattr(cls, '_pk_cache', None)
+        if cache is None:
+            continue
+        if key is None:
+            cache.clear()
+        else:
+            # new version makes entries saved by loads in progress stale
+            cache.delete(key)
+            cache.delete(_version_key(key))
+
+
+def _changed(session, tables, instances=()):
+    # invalidate now so the session doesn't read cached results,
+    # and after commit/rollback so nobody keeps results of
+    # not committed changes
+    if tables:
+        session.info.setdefault(_INFO_KEY, set()).update(tables)
+        invalidate(*tables)
+    if instances:
+        session.info.setdefault(_PK_INFO_KEY, set()).update(instances)
+        _invalidate_instances(instances)
+
+
+def _after_flush(session, flush_context):
+    if not _caches and not _pk_caches:
+        return
+    tables = set()
+    instances = set()
+    for obj in list(session.new) + list(session.dirty) + \
+            list(session.deleted):
+        state = inspect(obj)
+        tables.update(_mapper_tables(state.mapper))
+        if state.key is not None and \
+                getattr(state.class_, '_pk_cache', None) is not None:
+            instances.add((state.class_, _pk_key(state.key)))
+    _changed(session, tables, instances)
+
+
+def _do_orm_execute(orm_execute_state):
+    if (not _caches and not _pk_caches) or orm_execute_state.is_select:
+        return
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        return
+    tables = set()
+    instances = set()
+    for mapper in orm_execute_state.all_mappers:
+        tables.update(_mapper_tables(mapper))
+        if getattr(mapper.class_, '_pk_cache', None) is not None:
+            # rows are unknown, so drop all instances
+            instances.add((mapper.class_, None))
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if isinstance(table, Table):
+        tables.add(table.fullname)
+    _changed(orm_execute_state.session, tables, instances)
+
+
+def _after_transaction(session):
+    tables = session.info.pop(_INFO_KEY, None)
+    if tables and _caches:
+        invalidate(*tables)
+    instances = session.info.pop(_PK_INFO_KEY, None)
+    if instances:
+        _invalidate_instances(instances)
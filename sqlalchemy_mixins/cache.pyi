@@ -0,0 +1,78 @@
+from typing import Any, Dict, Iterable, List, Optional, Set, Type, Union
+
+from sqlalchemy import Table
+from sqlalchemy.orm import Session
+
+KEY_PREFIX: str
+
+
+class Cache:
+    ttl: Optional[float]
+    hits: int
+    misses: int
+
+    def __init__(self, ttl: Optional[float] = None) -> None: ...
+
+    def get(self, key: str, default: Any = None) -> Any: ...
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def clear(self) -> None: ...
+
+    @property
+    def hit_rate(self) -> float: ...
+
+
+class MemoryCache(Cache):
+    maxsize: int
+
+    def __init__(self, maxsize: int = 1024,
+                 ttl: Optional[float] = None) -> None: ...
+
+    def __len__(self) -> int: ...
+
+
+class FileCache(Cache):
+    directory: str
+
+    def __init__(self, directory: str, ttl: Optional[float] = None) -> None: ...
+
+
+def query_key(
+        model: type,
+        filters: Optional[Union[dict, list]] = None,
+        sort_attrs: Optional[Iterable[str]] = None,
+        schema: Optional[Union[dict, str]] = None
+) -> str: ...
+
+def generations(cache: Cache, tables: Iterable[str]) -> Dict[str, str]: ...
+
+def statement_tables(statement: Any) -> Set[str]: ...
+
+def load(cache: Cache, key: str, session: Session) -> Optional[List[Any]]: ...
+
+def save(
+        cache: Cache,
+        key: str,
+        objects: List[Any],
+        snapshot: Dict[str, str],
+        session: Session,
+        ttl: Optional[float] = None
+) -> None: ...
+
+def instance_key(cls: type, id_: Any, session: Session) -> Optional[str]: ...
+
+def instance_version(cache: Cache, key: str) -> str: ...
+
+def load_instance(cache: Cache, key: str, session: Session) -> Optional[Any]: ...
+
+def save_instance(cache: Cache, obj: Any, session: Session, version: str,
+                  ttl: Optional[float] = None) -> None: ...
+
+def invalidate(*tables: Union[str, Table, Type[Any]]) -> None: ...
+
+def register(cache: Cache) -> None: ...
+
+def register_pk_cache(cache: Cache) -> None: ...
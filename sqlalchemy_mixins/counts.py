@@ -0,0 +1,122 @@
+from sqlalchemy import and_, event, func, inspect, select
+from sqlalchemy.orm import Mapper, aliased, join, query_expression, \
+    with_expression
+
+# attribute name in paths like 'comments___count' or 'comments___count__gt'
+COUNT_ATTR = 'count'
+# instance attribute holding loaded count, e.g. post.comments_count
+COUNT_SUFFIX = '_count'
+
+# relations which counts can be loaded, declared on model:
+#   __counts__ = ('comments', 'likes')
+COUNTS_DECLARATION = '__counts__'
+
+# marks query_expression attributes declared by __counts__
+_INFO_KEY = 'sqlalchemy_mixins_count'
+
+
+@event.listens_for(Mapper, 'mapper_configured')
+def _declare_counts(mapper, cls):
+    """
+    Adds count attributes for relations in `__counts__` when mapper is
+    configured (under configuration lock), so queries never change mappers
+    """
+    for relation_name in getattr(cls, COUNTS_DECLARATION, ()):
+        name = relation_name + COUNT_SUFFIX
+        prop = mapper.attrs.get(name)
+        if prop is None:
+            mapper.add_property(name, query_expression(
+                info={_INFO_KEY: relation_name}))
+        elif prop.info.get(_INFO_KEY) != relation_name:
+            raise ValueError('Cant load count of `{}` to {}.{}: attribute '
+                             'already exists'.format(relation_name, cls,
+                                                     name))
+
+
+def is_count_attr(prop):
+    """Whether mapper property is count attribute declared by __counts__"""
+    return _INFO_KEY in prop.info
+
+
+def declared_counts(cls):
+    """Names of relations in `__counts__` of model"""
+    return [prop.info[_INFO_KEY]
+            for prop in inspect(cls).mapper.column_attrs
+            if is_count_attr(prop)]
+
+
+def is_count_path(cls, relation_name, attr):
+    """
+    Whether `<relation_name>___<attr>` means count of related objects,
+    like 'comments___count__gt'. Real `count` attribute of the related
+    class takes precedence.
+
+    :param cls: model class
+    :param attr: 'count' or 'count__<operator>'
+    """
+    if attr.split('__', 1)[0] != COUNT_ATTR:
+        return False
+    relationship = cls.__mapper__.relationships.get(relation_name)
+    if relationship is None:
+        return False
+    return COUNT_ATTR not in relationship.mapper.all_orm_descriptors \
+        and COUNT_ATTR not in relationship.mapper.attrs
+
+
+def count_expr(entity, relation_name):
+    """
+    Correlated scalar subquery counting related objects of entity:
+        SELECT count(*) FROM post AS post_1
+        JOIN comment AS comment_1 ON post_1.id = comment_1.post_id
+        WHERE post_1.id = post.id
+    It works for any relationship (including many-to-many) and
+    for aliased entities.
+
+    :param entity: model class or alias
+    """
+    mapper = inspect(entity).mapper
+    if relation_name not in mapper.relationships:
+        raise KeyError('{} doesnt have `{}` relationship'
+                       .format(mapper.class_, relation_name))
+    owner = aliased(mapper.class_)
+    target = aliased(mapper.relationships[relation_name].mapper.class_)
+    pk_names = [mapper.get_property_by_column(c).key
+                for c in mapper.primary_key]
+    # join() builds the ON clause right away, so the statement can be
+    # used in with_expression() which strips ORM annotations
+    return select(func.count()) \
+        .select_from(join(owner, target,
+                          getattr(owner, relation_name).of_type(target))) \
+        .where(and_(*[getattr(owner, pk) == getattr(entity, pk)
+                      for pk in pk_names])) \
+        .correlate(entity) \
+        .scalar_subquery()
+
+
+def count_attr(cls, relation_name):
+    """
+    Attribute holding loaded count of related objects, e.g.
+    Post.comments_count for `comments` relation. It's a query_expression
+    declared by `__counts__`, so it's None unless loaded by with_counts().
+    """
+    mapper = cls.__mapper__
+    if relation_name not in mapper.relationships:
+        raise KeyError('{} doesnt have `{}` relationship'
+                       .format(cls, relation_name))
+    name = relation_name + COUNT_SUFFIX
+    prop = mapper.attrs.get(name)
+    if prop is None or prop.info.get(_INFO_KEY) != relation_name:
+        raise KeyError('Count of `{}` is not declared, add it to {}.{}'
+                       .format(relation_name, cls, COUNTS_DECLARATION))
+    return getattr(cls, name)
+
+
+def count_options(cls, relations):
+    """
+    with_expression() options loading counts of given relations
+
+    :param relations: relationship attributes or names
+    """
+    names = [r if isinstance(r, str) else r.key for r in relations]
+    return [with_expression(count_attr(cls, name), count_expr(cls, name))
+            for name in names]
@@ -0,0 +1,25 @@
+from typing import Any, Iterable, List, Type, Union
+
+from sqlalchemy.orm import MapperProperty, QueryableAttribute
+from sqlalchemy.orm.strategy_options import Load
+from sqlalchemy.sql.selectable import ScalarSelect
+
+COUNT_ATTR: str
+COUNT_SUFFIX: str
+COUNTS_DECLARATION: str
+
+
+def is_count_path(cls: Type, relation_name: str, attr: str) -> bool: ...
+
+def is_count_attr(prop: MapperProperty) -> bool: ...
+
+def declared_counts(cls: Type) -> List[str]: ...
+
+def count_expr(entity: Any, relation_name: str) -> ScalarSelect: ...
+
+def count_attr(cls: Type, relation_name: str) -> QueryableAttribute: ...
+
+def count_options(
+        cls: Type,
+        relations: Iterable[Union[QueryableAttribute, str]]
+) -> List[Load]: ...
@@ -1,3 +1,7 @@
+from functools import partial
+
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
 from sqlalchemy.orm.strategy_options import _AbstractLoad
 
 try:
@@ -6,19 +10,216 @@ except ImportError: # pragma: no cover
     pass
 
 from sqlalchemy.orm import joinedload, Load
-from sqlalchemy.orm import subqueryload
+from sqlalchemy.orm import subqueryload, selectinload, raiseload, noload, \
+    immediateload, lazyload, load_only, defer
 
+from .counts import count_options
+from .instrumentation import tag
 from .session import SessionMixin
+from .utils import LRUCache, relation_graph
 
 JOINED = 'joined'
 SUBQUERY = 'subquery'
+SELECTIN = 'selectin'
+RAISE = 'raise'
+NOLOAD = 'noload'
+IMMEDIATE = 'immediate'
+LAZY = 'lazy'
+# raise only if loading needs SQL (not for many-to-one in identity map)
+RAISE_ON_SQL = 'raise_on_sql'
+
+# schema key that sets loading strategy for all relationships
+# not listed in the schema, e.g. {DEFAULT: RAISE, Post.user: JOINED}
+DEFAULT = '*'
+
+# schema keys that set columns to load (or not to load) for the entity,
+# e.g. {COLUMNS: ['id', 'title'], Post.comments: {DEFERRED: ['body']}}
+COLUMNS = '__columns__'
+DEFERRED = '__defer__'
+
+# schema key that loads counts of related objects for the entity,
+# e.g. {COUNTS: ['comments'], Post.user: {COUNTS: [User.posts]}}.
+# Counts are available as <relation>_count attributes (post.comments_count)
+COUNTS = '__counts__'
+
+_loaders = {
+    JOINED: joinedload,
+    SUBQUERY: subqueryload,
+    SELECTIN: selectinload,
+    RAISE: raiseload,
+    NOLOAD: noload,
+    IMMEDIATE: immediateload,
+    LAZY: lazyload,
+    RAISE_ON_SQL: partial(raiseload, sql_only=True),
+}
+
+# methods that don't load related objects
+_NOT_LOADING = (RAISE, RAISE_ON_SQL, NOLOAD, LAZY)
 
+# compiled options by schema structure (see _schema_key) and entity
+_compiled_schemas = LRUCache(maxsize=1024)
 
-def eager_expr(schema):
+# schemas converted by async_schema() by schema structure and entity
+_async_schemas = LRUCache(maxsize=1024)
+
+# schemas registered with EagerLoadMixin.register_schema().
+# name -> (schema, token). Token changes on re-registration, so
+# options compiled for the previous schema are not used anymore
+_registered_schemas = {}
+
+
+def eager_expr(schema, entity=None):
     """
-    :type schema: dict
+    :type schema: dict|str
+    :param entity: class the schema is applied to. Needed only to resolve
+     column names in root COLUMNS/DEFERRED lists
+
+    Compiled options are cached by schema structure, so equal schemas
+     give lists of the same options (and stable SQLAlchemy cache keys).
+    Schema can also be a name of schema registered with
+     EagerLoadMixin.register_schema()
+    """
+    if isinstance(schema, str):
+        try:
+            schema, token = _registered_schemas[schema]
+        except KeyError:
+            raise KeyError('Schema `{}` is not registered'.format(schema))
+        key = (token, entity)
+    else:
+        try:
+            key = (_schema_key(schema), entity)
+            hash(key)
+        except TypeError:
+            # unhashable values, e.g. bad join methods. Don't cache
+            return _eager_expr_from_schema(schema, entity)
+
+    options = _compiled_schemas.get(key)
+    if options is None:
+        options = tuple(_eager_expr_from_schema(schema, entity))
+        _compiled_schemas.set(key, options)
+    return list(options)
+
+
+def async_schema(schema, entity):
+    """
+    Schema for async sessions, where implicit lazy loads fail
+     with MissingGreenlet:
+      * nested schemas and SUBQUERY are loaded with SELECTIN
+      * relationships not listed in the schema that would be lazy loaded
+        (lazy='select') are set to RAISE_ON_SQL, on every level of
+        the schema and for objects it loads. Levels with DEFAULT key
+        are left as is.
+
+    :type schema: dict|str
+    :param entity: class the schema is applied to
+    """
+    if isinstance(schema, str):
+        try:
+            schema, token = _registered_schemas[schema]
+        except KeyError:
+            raise KeyError('Schema `{}` is not registered'.format(schema))
+        key = (token, entity)
+    else:
+        try:
+            key = (_schema_key(schema), entity)
+            hash(key)
+        except TypeError:
+            return _async_schema(schema, entity)
+
+    result = _async_schemas.get(key)
+    if result is None:
+        result = _async_schema(schema, entity)
+        _async_schemas.set(key, result)
+    return result
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _clear_async_schemas():
+    # new mappers may add relationships (backrefs) to be raised
+    _async_schemas.clear()
+
+
+def _async_schema(schema, entity):
+    result, listed = {}, set()
+    for path, value in schema.items():
+        if _is_column_key(path) or \
+                isinstance(path, str) and path == DEFAULT:
+            result[path] = value
+            continue
+        listed.add(path if isinstance(path, str) else path.key)
+
+        if isinstance(value, tuple):
+            join_method, inner_schema = value[0], value[1]
+        elif isinstance(value, dict):
+            join_method, inner_schema = SELECTIN, value
+        else:
+            join_method, inner_schema = value, None
+        if join_method == SUBQUERY:
+            join_method = SELECTIN
+
+        if join_method not in _NOT_LOADING:
+            target = None if isinstance(path, str) \
+                else path.property.mapper.class_
+            inner_schema = _async_schema(inner_schema or {}, target) or None
+        result[path] = join_method if inner_schema is None \
+            else (join_method, inner_schema)
+
+    if entity is not None and not any(isinstance(path, str) and
+                                      path == DEFAULT for path in schema):
+        for key, edge in relation_graph(entity).items():
+            if key not in listed and edge.property.lazy in ('select', True):
+                result[getattr(entity, key)] = RAISE_ON_SQL
+    return result
+
+
+def _criteria_key(attr):
     """
-    return _eager_expr_from_schema(schema)
+    Hashable representation of .and_() criteria of relationship attribute:
+    SQLAlchemy cache key of the structure with bound values
+    """
+    result = []
+    for criteria in getattr(attr, '_extra_criteria', ()):
+        cache_key = criteria._generate_cache_key()
+        if cache_key is None:
+            # not cacheable construct, equal only to itself
+            result.append(criteria)
+        else:
+            result.append((cache_key.key, tuple(
+                repr(bind.effective_value) for bind in cache_key.bindparams)))
+    return tuple(result)
+
+
+def _attr_key(attr):
+    # parent is a mapper or aliased class inspection, both are hashable.
+    # .of_type() target and .and_() criteria change the loaded objects
+    if isinstance(attr, str):
+        return attr
+    return (attr.parent, attr.key, getattr(attr, '_of_type', None),
+            _criteria_key(attr))
+
+
+def _schema_key(schema):
+    """
+    Hashable representation of schema structure.
+    We can't use schema keys (class properties) as is: their == operator
+     builds SQL expressions
+    """
+    items = []
+    for path, value in schema.items():
+        if _is_column_key(path):
+            value = tuple(_attr_key(column) for column in value)
+        elif isinstance(value, tuple):
+            join_method, inner_schema = value[0], value[1]
+            value = (join_method, _schema_key(inner_schema)
+                     if inner_schema is not None else None)
+        elif isinstance(value, dict):
+            value = (JOINED, _schema_key(value))
+        items.append((_attr_key(path), value))
+    return tuple(items)
+
+
+def _is_column_key(key):
+    return isinstance(key, str) and key in (COLUMNS, DEFERRED, COUNTS)
 
 
 def _flatten_schema(schema):
@@ -30,10 +231,12 @@ def _flatten_schema(schema):
         :type schema: dict
         """
         for path, value in schema.items():
+            if _is_column_key(path):
+                continue
             # for supporting schemas like Product.user: {...},
             # we transform, say, Product.user to 'user' string
             attr = path
-            path = path.key
+            path = path if isinstance(path, str) else path.key
 
 
             if isinstance(value, tuple):
@@ -58,55 +261,99 @@ def _eager_expr_from_flat_schema(flat_schema):
     """
     :type flat_schema: dict
     """
+    return [_create_eager_load_option(path, join_method)
+            for path, join_method in flat_schema.items()]
+
+def _eager_expr_from_schema(schema, entity=None):
     result = []
-    for path, join_method in flat_schema.items():
-        if join_method == JOINED:
-            result.append(joinedload(path))
-        elif join_method == SUBQUERY:
-            result.append(subqueryload(path))
+    for path, value in schema.items():
+        if _is_column_key(path):
+            result.extend(_create_column_options(entity, path, value))
+            continue
+
+        if isinstance(value, tuple):
+            join_method, inner_schema = value[0], value[1]
+        elif isinstance(value, dict):
+            join_method, inner_schema = JOINED, value
         else:
-            raise ValueError('Bad join method `{}` in `{}`'
-                             .format(join_method, path))
+            join_method, inner_schema = value, None
+
+        load_option = _create_eager_load_option(path, join_method)
+        if inner_schema is not None:
+            load_option = load_option.options(
+                *_eager_expr_from_schema(inner_schema, _path_target(path)))
+        result.append(load_option)
     return result
 
-def _eager_expr_from_schema(schema):
-    def _get_expr(schema, result):
-        for path, value in schema.items():
-            if isinstance(value, tuple):
-                join_method, inner_schema = value[0], value[1]
-                load_option = _create_eager_load_option(path, join_method)
-                result.append(load_option.options(*_eager_expr_from_schema(inner_schema)))
-            elif isinstance(value, dict):
-                join_method, inner_schema = JOINED, value
-                load_option = _create_eager_load_option(path, join_method)
-                result.append(load_option.options(*_eager_expr_from_schema(inner_schema)))
-                # load_option = _create_eager_load_option(path, value)
-            else:
-                result.append(_create_eager_load_option(path, value))
+def _path_target(path):
+    """Entity loaded by relationship attribute: .of_type() target
+    (e.g. alias) or related class. None for string paths"""
+    if isinstance(path, str):
+        return None
+    of_type = getattr(path, '_of_type', None)
+    return of_type.entity if of_type is not None \
+        else path.property.mapper.class_
 
-    result = []
-    _get_expr(schema, result)
-    return result
+def _create_column_options(entity, key, columns):
+    if key == COUNTS:
+        if entity is None:
+            raise ValueError("Can't load counts of `{}`: entity is unknown"
+                             .format(columns))
+        return count_options(entity, columns)
+
+    attrs = []
+    for column in columns:
+        if isinstance(column, str):
+            if entity is None:
+                raise ValueError("Can't resolve column `{}` of `{}`: "
+                                 "entity is unknown".format(column, key))
+            if not hasattr(entity, column):
+                raise KeyError('{} has no column `{}` in `{}`'
+                               .format(entity, column, key))
+            column = getattr(entity, column)
+        attrs.append(column)
+
+    if key == COLUMNS:
+        return [load_only(*attrs)]
+    return [defer(attr) for attr in attrs]
 
 def _create_eager_load_option(path, join_method):
-    if join_method == JOINED:
-        return joinedload(path)
-    elif join_method == SUBQUERY:
-        return subqueryload(path)
-    else:
+    try:
+        loader = _loaders[join_method]
+    except (KeyError, TypeError):
         raise ValueError('Bad join method `{}` in `{}`'
                          .format(join_method, path))
+    return loader(path)
 
 
 
 class EagerLoadMixin(SessionMixin):
     __abstract__ = True
 
+    @classmethod
+    def register_schema(cls, name, schema):
+        """
+        Register schema under the name, so it can be used in with_()
+         and smart_query() by name.
+        If called on a model class, options are compiled at once,
+         so call it after all related models are declared.
+
+        Example:
+            Post.register_schema('post_list', {
+                Post.user: JOINED,
+                Post.comments: SELECTIN
+            })
+            Post.with_('post_list').all()
+        """
+        _registered_schemas[name] = (schema, object())
+        if getattr(cls, '__mapper__', None) is not None:
+            eager_expr(name, cls)
+
     @classmethod
     def with_(cls, schema):
         """
         Query class and eager load schema at once.
-        :type schema: dict
+        :type schema: dict|str
 
         Example:
             schema = {
@@ -116,8 +363,41 @@ class EagerLoadMixin(SessionMixin):
                 })
             }
             User.with_(schema).first()
+
+        Columns to load can be set for every entity with COLUMNS key
+         (and columns not to load with DEFERRED key):
+            schema = {
+                COLUMNS: ['id', 'title'],
+                Post.comments: (SELECTIN, {DEFERRED: ['body']})
+            }
+
+        Available methods: JOINED, SUBQUERY, SELECTIN, RAISE, NOLOAD,
+         IMMEDIATE and LAZY. Use DEFAULT key to set the method for all
+         relationships not listed in the schema (on the same level), e.g.
+         to forbid any lazy load:
+            schema = {
+                DEFAULT: RAISE,
+                Post.comments: (SELECTIN, {DEFAULT: RAISE})
+            }
+        """
+        return tag(cls.query.options(*eager_expr(schema or {}, cls)),
+                   cls, 'with_')
+
+    @classmethod
+    def with_counts(cls, *relations):
+        """
+        Load counts of related objects in the same query
+         (as correlated subqueries), without loading the objects.
+        Counts are available as <relation>_count attributes
+
+        :type relations: *List[QueryableAttribute|str]
+
+        Example 1:
+            post = Post.with_counts(Post.comments, 'likes').first()
+            print(post.comments_count, post.likes_count)
         """
-        return cls.query.options(*eager_expr(schema or {}))
+        return tag(cls.query.options(*count_options(cls, relations)),
+                   cls, 'with_counts')
 
     @classmethod
     def with_joined(cls, *paths):
@@ -132,7 +412,7 @@ class EagerLoadMixin(SessionMixin):
             Comment.with_joined(Comment.user, Comment.post).first()
         """
         options = [joinedload(path) for path in paths]
-        return cls.query.options(*options)
+        return tag(cls.query.options(*options), cls, 'with_joined')
 
     @classmethod
     def with_subquery(cls, *paths):
@@ -147,4 +427,19 @@ class EagerLoadMixin(SessionMixin):
             User.with_subquery(User.posts, User.comments).all()
         """
         options = [subqueryload(path) for path in paths]
-        return cls.query.options(*options)
+        return tag(cls.query.options(*options), cls, 'with_subquery')
+
+    @classmethod
+    def with_selectin(cls, *paths):
+        """
+        Eagerload for simple cases where we need to just
+         selectin load some relations
+        You can only load direct relationships.
+
+        :type paths: *List[QueryableAttribute]
+
+        Example 1:
+            User.with_selectin(User.posts, User.comments).all()
+        """
+        options = [selectinload(path) for path in paths]
+        return tag(cls.query.options(*options), cls, 'with_selectin')
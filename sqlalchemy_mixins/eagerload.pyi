@@ -1,4 +1,4 @@
-from typing import List, Type
+from typing import List, Optional, Type, Union
 
 from sqlalchemy.orm import Query, QueryableAttribute
 from sqlalchemy.orm.strategy_options import Load
@@ -8,9 +8,23 @@ from sqlalchemy_mixins.session import SessionMixin
 
 JOINED: str
 SUBQUERY: str
+SELECTIN: str
+RAISE: str
+NOLOAD: str
+IMMEDIATE: str
+LAZY: str
+RAISE_ON_SQL: str
+DEFAULT: str
+COLUMNS: str
+DEFERRED: str
+COUNTS: str
 
 
-def eager_expr(schema: dict) -> List[Load]: ...
+def eager_expr(schema: Union[dict, str],
+               entity: Optional[type] = None) -> List[Load]: ...
+
+def async_schema(schema: Union[dict, str],
+                 entity: Optional[type]) -> dict: ...
 
 def _flatten_schema(schema: dict) -> dict: ...
 
@@ -20,10 +34,22 @@ def _eager_expr_from_flat_schema(flat_schema: dict) -> List[Load]: ...
 class EagerLoadMixin(SessionMixin):
 
     @classmethod
-    def with_(cls, schema: dict) -> Query: ...
+    def register_schema(cls, name: str, schema: dict) -> None: ...
+
+    @classmethod
+    def with_(cls, schema: Union[dict, str]) -> Query: ...
+
+    @classmethod
+    def with_counts(
+            cls,
+            *relations: Union[QueryableAttribute, str]
+    ) -> Query: ...
 
     @classmethod
     def with_joined(cls, *paths: List[QueryableAttribute]) -> Query: ...
 
     @classmethod
-    def with_subquery(cls, *paths: List[QueryableAttribute]) -> Query: ...
\ No newline at end of file
+    def with_subquery(cls, *paths: List[QueryableAttribute]) -> Query: ...
+
+    @classmethod
+    def with_selectin(cls, *paths: List[QueryableAttribute]) -> Query: ...
\ No newline at end of file
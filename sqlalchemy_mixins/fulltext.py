@@ -0,0 +1,218 @@
+from sqlalchemy import event, bindparam, Boolean, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+# PostgreSQL text search configuration used if not set in fulltext_index()
+DEFAULT_CONFIG = 'english'
+
+
+def _fts_table_name(table):
+    return '{}_fts'.format(table.name)
+
+
+def _fts5_phrase_query(text):
+    """
+    Plain text to FTS5 query: every word is quoted, so FTS5 syntax
+    in user input (AND, *, :, quotes) is searched literally
+    """
+    words = text.split() or ['']
+    return ' '.join('"{}"'.format(w.replace('"', '""')) for w in words)
+
+
+class _FullTextMatch(ColumnElement):
+    """
+    Full-text match of one column. Compiles to
+      * SQLite: `pk IN (SELECT rowid FROM <table>_fts
+                        WHERE <table>_fts.col MATCH :query)`
+        where <table>_fts is FTS5 table created by fulltext_index()
+      * PostgreSQL: `to_tsvector(config, col) @@ plainto_tsquery(config, :query)`
+        (to_tsquery for raw queries)
+      * MySQL: `MATCH (col) AGAINST (:query IN NATURAL LANGUAGE MODE)`
+        (IN BOOLEAN MODE for raw queries)
+      * other dialects: SQLAlchemy's generic column.match(query)
+    """
+    __visit_name__ = 'fulltext_match'
+    inherit_cache = True
+    _is_implicitly_boolean = True
+    type = Boolean()
+
+    _traverse_internals = [
+        ('column', InternalTraversal.dp_clauseelement),
+        ('pk', InternalTraversal.dp_clauseelement),
+        ('query', InternalTraversal.dp_clauseelement),
+        ('sqlite_query', InternalTraversal.dp_clauseelement),
+        ('plain', InternalTraversal.dp_boolean),
+        ('config', InternalTraversal.dp_string),
+        ('fts_table', InternalTraversal.dp_string),
+        ('fts_column', InternalTraversal.dp_string),
+    ]
+
+    def __init__(self, column, pk, fts_table, fts_column, config, text,
+                 plain=True):
+        self.column = column.__clause_element__()
+        self.pk = pk.__clause_element__()
+        self.fts_table = fts_table
+        self.fts_column = fts_column
+        self.config = config
+        self.plain = plain
+        self.query = bindparam(None, text, type_=String())
+        self.sqlite_query = bindparam(
+            None, _fts5_phrase_query(text) if plain else text,
+            type_=String())
+
+
+@compiles(_FullTextMatch)
+def _compile_fulltext(element, compiler, **kw):
+    return compiler.process(element.column.match(element.query), **kw)
+
+
+@compiles(_FullTextMatch, 'sqlite')
+def _compile_fulltext_sqlite(element, compiler, **kw):
+    fts_table = compiler.preparer.quote(element.fts_table)
+    return '{} IN (SELECT rowid FROM {} WHERE {}.{} MATCH {})'.format(
+        compiler.process(element.pk, **kw),
+        fts_table, fts_table, compiler.preparer.quote(element.fts_column),
+        compiler.process(element.sqlite_query, **kw))
+
+
+@compiles(_FullTextMatch, 'postgresql')
+def _compile_fulltext_postgresql(element, compiler, **kw):
+    # config is rendered inline so the expression matches the GIN index
+    config = compiler.render_literal_value(element.config, String())
+    return 'to_tsvector({}, {}) @@ {}({}, {})'.format(
+        config, compiler.process(element.column, **kw),
+        'plainto_tsquery' if element.plain else 'to_tsquery',
+        config, compiler.process(element.query, **kw))
+
+
+@compiles(_FullTextMatch, 'mysql')
+@compiles(_FullTextMatch, 'mariadb')
+def _compile_fulltext_mysql(element, compiler, **kw):
+    return 'MATCH ({}) AGAINST ({} IN {} MODE)'.format(
+        compiler.process(element.column, **kw),
+        compiler.process(element.query, **kw),
+        'NATURAL LANGUAGE' if element.plain else 'BOOLEAN')
+
+
+def _fulltext_op(plain):
+    def op(column, value):
+        insp = getattr(column, 'parent', None)
+        mapper = getattr(insp, 'mapper', None)
+        columns = getattr(mapper and mapper.class_, '_fulltext_columns', {})
+        if column.key not in columns:
+            raise KeyError('`{}` has no full-text index, declare it with '
+                           'fulltext_index()'.format(column))
+        pk = mapper.get_property_by_column(mapper.primary_key[0]).key
+        return _FullTextMatch(
+            column, getattr(insp.entity, pk),
+            _fts_table_name(mapper.local_table), columns[column.key],
+            mapper.class_._fulltext_config, value, plain=plain)
+    return op
+
+
+# `search` is for plain user input, `match` is for raw dialect syntax
+# (FTS5 query / tsquery / MySQL boolean mode)
+search_op = _fulltext_op(plain=True)
+match_op = _fulltext_op(plain=False)
+
+
+def _create_sqlite(table, columns, connection):
+    quote = connection.dialect.identifier_preparer.quote
+    fts = quote(_fts_table_name(table))
+    name = quote(table.name)
+    pk = quote(list(table.primary_key)[0].name)
+    cols = ', '.join(quote(c) for c in columns)
+    new = ', '.join('new.' + quote(c) for c in columns)
+    old = ', '.join('old.' + quote(c) for c in columns)
+    delete = ("INSERT INTO {fts}({fts}, rowid, {cols}) "
+              "VALUES ('delete', old.{pk}, {old});")
+    insert = "INSERT INTO {fts}(rowid, {cols}) VALUES (new.{pk}, {new});"
+    statements = [
+        "CREATE VIRTUAL TABLE {fts} USING fts5({cols}, "
+        "content={content}, content_rowid={content_rowid})",
+        "CREATE TRIGGER {ai} AFTER INSERT ON {name} BEGIN " + insert + " END",
+        "CREATE TRIGGER {ad} AFTER DELETE ON {name} BEGIN " + delete + " END",
+        "CREATE TRIGGER {au} AFTER UPDATE ON {name} BEGIN "
+        + delete + " " + insert + " END",
+        # index rows which existed before
+        "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        connection.exec_driver_sql(statement.format(
+            fts=fts, name=name, pk=pk, cols=cols, new=new, old=old,
+            content="'{}'".format(table.name),
+            content_rowid="'{}'".format(list(table.primary_key)[0].name),
+            ai=quote(_fts_table_name(table) + '_ai'),
+            ad=quote(_fts_table_name(table) + '_ad'),
+            au=quote(_fts_table_name(table) + '_au'),
+        ))
+
+
+def _create_postgresql(table, columns, config, connection):
+    quote = connection.dialect.identifier_preparer.quote
+    config = "'{}'".format(config.replace("'", "''"))
+    for column in columns:
+        connection.exec_driver_sql(
+            'CREATE INDEX {} ON {} USING gin (to_tsvector({}, {}))'.format(
+                quote('ix_{}_{}_fts'.format(table.name, column)),
+                connection.dialect.identifier_preparer.format_table(table),
+                config, quote(column)))
+
+
+def _create_mysql(table, columns, connection):
+    quote = connection.dialect.identifier_preparer.quote
+    for column in columns:
+        connection.exec_driver_sql('CREATE FULLTEXT INDEX {} ON {} ({})'.format(
+            quote('ix_{}_{}_fts'.format(table.name, column)),
+            connection.dialect.identifier_preparer.format_table(table),
+            quote(column)))
+
+
+def fulltext_index(cls, *attrs, config=DEFAULT_CONFIG):
+    """
+    Declares full-text index on text columns of the model,
+    created together with the table (metadata.create_all()):
+      * SQLite: FTS5 table <table>_fts with triggers keeping it in sync
+      * PostgreSQL: GIN index on to_tsvector(config, column) per column
+      * MySQL: FULLTEXT index per column
+
+    :type cls: sqlalchemy_mixins.SmartQueryMixin
+    """
+    if '_fulltext_columns' in cls.__dict__:
+        raise ValueError('Full-text index is already declared on {}'
+                         .format(cls))
+    mapper = cls.__mapper__
+    pks = mapper.primary_key
+    # SQLite FTS5 table refers to rows by rowid, which is the primary key
+    if len(pks) != 1 or pks[0].type.python_type is not int:
+        raise ValueError('Full-text index requires {} to have '
+                         'single integer primary key'.format(cls))
+    columns = {}
+    for attr in attrs:
+        if attr not in cls.columns:
+            raise KeyError('{} doesnt have `{}` column'.format(cls, attr))
+        columns[attr] = mapper.columns[attr].name
+    cls._fulltext_columns = columns
+    cls._fulltext_config = config
+
+    table = mapper.local_table
+    names = list(columns.values())
+
+    @event.listens_for(table, 'after_create')
+    def create(target, connection, **kw):
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            _create_sqlite(target, names, connection)
+        elif dialect == 'postgresql':
+            _create_postgresql(target, names, config, connection)
+        elif dialect in ('mysql', 'mariadb'):
+            _create_mysql(target, names, connection)
+
+    @event.listens_for(table, 'before_drop')
+    def drop(target, connection, **kw):
+        # triggers and indexes are dropped with the table itself
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('DROP TABLE IF EXISTS {}'.format(
+                connection.dialect.identifier_preparer.quote(
+                    _fts_table_name(target))))
@@ -0,0 +1,25 @@
+from typing import Any, Callable, Type
+
+from sqlalchemy.sql.expression import ColumnElement
+
+DEFAULT_CONFIG: str
+
+
+class _FullTextMatch(ColumnElement):
+    def __init__(
+            self,
+            column: Any,
+            pk: Any,
+            fts_table: str,
+            fts_column: str,
+            config: str,
+            text: str,
+            plain: bool = True
+    ) -> None: ...
+
+
+search_op: Callable[[Any, str], _FullTextMatch]
+match_op: Callable[[Any, str], _FullTextMatch]
+
+
+def fulltext_index(cls: Type, *attrs: str, config: str = ...) -> None: ...
@@ -1,15 +1,59 @@
-from sqlalchemy import inspect
+from sqlalchemy import event, inspect
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
-from sqlalchemy.orm import RelationshipProperty, DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Mapper
 
-from .utils import classproperty
+from .counts import is_count_attr
+from .utils import classproperty, relation_graph
+
+# {class: (mapper.all_orm_descriptors setters were built from,
+#          {settable attribute name: descriptor __set__})}
+_setters = {}
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _clear_setters():
+    # new mappers may add settable relationships (backrefs)
+    _setters.clear()
+
+
+def _attribute_setter(name):
+    def setter(obj, value):
+        setattr(obj, name, value)
+    return setter
+
+
+def settable_setters(cls):
+    """
+    Setters of `cls.settable_attributes` (attributes settable by fill())
+    by name, in that order. Built once per class and set of mapper
+    properties. Calling a setter is the same as setattr():
+        settable_setters(User)['name'](user, 'Bob')
+    """
+    # noinspection PyProtectedMember
+    cls.__mapper__._check_configure()
+    # memoized by mapper, replaced when add_property() changes properties
+    descriptors = inspect(cls).all_orm_descriptors
+    built = _setters.get(cls)
+    if built is not None and built[0] is descriptors:
+        return built[1]
+    setters = {}
+    for name in cls.settable_attributes:
+        descriptor = descriptors.get(name)
+        # attributes which are not mapped (e.g. plain properties) are set
+        # with setattr()
+        setters.setdefault(name, descriptor.__set__ if descriptor is not None
+                           else _attribute_setter(name))
+    _setters[cls] = (descriptors, setters)
+    return setters
 
 
 class InspectionMixin:
 
     @classproperty
     def columns(cls):
-        return inspect(cls).columns.keys()
+        # loaded counts (see __counts__) are not columns
+        return [prop.key for prop in inspect(cls).column_attrs
+                if not is_count_attr(prop)]
 
     @classproperty
     def primary_keys_full(cls):
@@ -30,15 +74,14 @@ class InspectionMixin:
     def relations(cls):
         """Return a `list` of relationship names or the given model
         """
-        return [c.key for c in cls.__mapper__.attrs
-                if isinstance(c, RelationshipProperty)]
+        return list(relation_graph(cls))
 
     @classproperty
     def settable_relations(cls):
         """Return a `list` of relationship names or the given model
         """
-        return [r for r in cls.relations
-                if getattr(cls, r).property.viewonly is False]
+        return [key for key, edge in relation_graph(cls).items()
+                if edge.property.viewonly is False]
 
     @classproperty
     def hybrid_properties(cls):
@@ -1,4 +1,4 @@
-from typing import List, Protocol, Dict
+from typing import Any, Callable, List, Protocol, Dict, Type
 
 from sqlalchemy.ext.hybrid import hybrid_method
 from sqlalchemy.orm import Mapper
@@ -7,6 +7,10 @@ from sqlalchemy.orm.interfaces import MapperProperty
 from sqlalchemy_mixins.utils import classproperty
 
 
+def settable_setters(
+        cls: Type[Any]) -> Dict[str, Callable[[Any, Any], None]]: ...
+
+
 class MappingProtocol(Protocol):
     __mapper__: Mapper
 
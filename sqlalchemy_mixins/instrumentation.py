@@ -0,0 +1,230 @@
+import logging
+import time
+from collections import namedtuple
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# execution option used to attribute statements to the mixin call
+# that built them
+CALL_OPTION = 'sqlalchemy_mixins_call'
+
+# number of enabled Instrumentation objects. Mixins only tag their queries
+# when it's non-zero, so disabled instrumentation costs one global lookup
+_enabled = 0
+
+# statements counter of the ORM execution currently being measured
+_pending = ContextVar('sqlalchemy_mixins_pending', default=None)
+
+
+MixinCall = namedtuple('MixinCall', ['model', 'method', 'shape'])
+QueryRecord = namedtuple('QueryRecord',
+                         ['call', 'statements', 'duration', 'rows'])
+
+
+def _filters_shape(filters):
+    """
+    Filter keys without values, e.g.
+    {'id__gt': 1, or_: {'name': 'Bob', 'rating__in': [1, 2]}}
+    becomes
+    ('id__gt', ('or_', ('name', 'rating__in')))
+    """
+    if isinstance(filters, dict):
+        shape = []
+        for key, value in filters.items():
+            if callable(key):
+                shape.append((key.__name__, _filters_shape(value)))
+            else:
+                shape.append(key)
+        return tuple(shape)
+    if isinstance(filters, (list, tuple)):
+        return tuple(_filters_shape(f) for f in filters)
+    return ()
+
+
+def tag(query, model, method, filters=None):
+    """
+    Attach mixin call info to the query so enabled instrumentation
+    can attribute its statements. Does nothing if instrumentation is off.
+    """
+    if not _enabled:
+        return query
+    call = MixinCall(model.__name__, method, _filters_shape(filters or {}))
+    return query.execution_options(**{CALL_OPTION: call})
+
+
+class QueryStats(object):
+    """Aggregated metrics of one mixin call signature"""
+
+    def __init__(self):
+        self.executions = 0
+        self.statements = 0
+        self.duration = 0.0
+        self.rows = 0
+
+    def add(self, record):
+        self.executions += 1
+        self.statements += record.statements
+        self.duration += record.duration
+        self.rows += record.rows
+
+    def __repr__(self):
+        return ('<QueryStats executions:{} statements:{} '
+                'duration:{:.6f} rows:{}>'.format(self.executions,
+                                                  self.statements,
+                                                  self.duration, self.rows))
+
+
+class MemorySink(object):
+    """Aggregates records in memory, per mixin call"""
+
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, record):
+        stats = self.stats.get(record.call)
+        if stats is None:
+            stats = self.stats[record.call] = QueryStats()
+        stats.add(record)
+
+    def clear(self):
+        self.stats.clear()
+
+
+class LoggingSink(object):
+    """Writes every record to a logger"""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('sqlalchemy_mixins')
+        self.level = level
+
+    def record(self, record):
+        self.logger.log(self.level,
+                        '%s: %d statement(s), %d row(s) in %.6fs',
+                        record.call, record.statements, record.rows,
+                        record.duration)
+
+
+class CallbackSink(object):
+    """Passes every record to the given callable"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, record):
+        self.callback(record)
+
+
+class Instrumentation(object):
+    """
+    Opt-in SQL metrics for mixin calls.
+
+    Statements are attributed to the mixin call that built the query
+    (where, smart_query, with_, find, ...). Statements executed outside
+    of mixin calls are recorded with call=None.
+
+    ORM SELECTs are measured as a whole: duration includes fetching rows
+    and eager loads, statements include eager load queries and rows are
+    the number of result rows. Note that results are buffered while
+    instrumentation is enabled (unless yield_per/stream_results is used).
+
+    Example:
+        sink = MemorySink()
+        with Instrumentation(sink, engine=engine):
+            Post.where(user___name='Bob').all()
+        print(sink.stats)
+    """
+
+    def __init__(self, *sinks, engine=Engine):
+        # AsyncEngine events are listened on its sync engine
+        self.engine = getattr(engine, 'sync_engine', engine)
+        self.sinks = sinks
+        self.enabled = False
+
+    def enable(self):
+        global _enabled
+        if self.enabled:
+            return self
+        event.listen(self.engine, 'before_cursor_execute',
+                     self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        event.listen(Session, 'do_orm_execute', self._do_orm_execute)
+        self.enabled = True
+        _enabled += 1
+        return self
+
+    def disable(self):
+        global _enabled
+        if not self.enabled:
+            return
+        event.remove(self.engine, 'before_cursor_execute',
+                     self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        event.remove(Session, 'do_orm_execute', self._do_orm_execute)
+        self.enabled = False
+        _enabled -= 1
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def _emit(self, record):
+        for sink in self.sinks:
+            sink.record(record)
+
+    def _uses_engine(self, session, state):
+        if self.engine is Engine:
+            return True
+        bind = session.get_bind(mapper=state.bind_mapper)
+        return getattr(bind, 'engine', bind) is self.engine
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        pending = _pending.get()
+        if pending is not None:
+            pending[0] += 1
+        else:
+            context._sqlalchemy_mixins_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        start = getattr(context, '_sqlalchemy_mixins_start', None)
+        if start is None:
+            # measured as a part of ORM execution
+            return
+        del context._sqlalchemy_mixins_start
+        self._emit(QueryRecord(
+            call=context.execution_options.get(CALL_OPTION),
+            statements=1,
+            duration=time.perf_counter() - start,
+            rows=max(cursor.rowcount, 0),
+        ))
+
+    def _do_orm_execute(self, state):
+        options = state.execution_options
+        if not state.is_select or options.get('yield_per') \
+                or options.get('stream_results') \
+                or _pending.get() is not None \
+                or not self._uses_engine(state.session, state):
+            return None
+
+        pending = [0]
+        token = _pending.set(pending)
+        start = time.perf_counter()
+        try:
+            frozen = state.invoke_statement().freeze()
+        finally:
+            _pending.reset(token)
+        self._emit(QueryRecord(
+            call=options.get(CALL_OPTION),
+            statements=pending[0],
+            duration=time.perf_counter() - start,
+            rows=len(frozen.data),
+        ))
+        return frozen()
@@ -0,0 +1,76 @@
+import logging
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+CALL_OPTION: str
+
+
+class MixinCall(NamedTuple):
+    model: str
+    method: str
+    shape: tuple
+
+
+class QueryRecord(NamedTuple):
+    call: Optional[MixinCall]
+    statements: int
+    duration: float
+    rows: int
+
+
+def tag(query: Any, model: type, method: str,
+        filters: Optional[dict] = None) -> Any: ...
+
+
+class QueryStats:
+    executions: int
+    statements: int
+    duration: float
+    rows: int
+
+    def add(self, record: QueryRecord) -> None: ...
+
+
+class MemorySink:
+    stats: Dict[Optional[MixinCall], QueryStats]
+
+    def record(self, record: QueryRecord) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class LoggingSink:
+    logger: logging.Logger
+    level: int
+
+    def __init__(self, logger: Optional[logging.Logger] = None,
+                 level: int = ...) -> None: ...
+
+    def record(self, record: QueryRecord) -> None: ...
+
+
+class CallbackSink:
+    callback: Callable[[QueryRecord], Any]
+
+    def __init__(self, callback: Callable[[QueryRecord], Any]) -> None: ...
+
+    def record(self, record: QueryRecord) -> None: ...
+
+
+class Instrumentation:
+    engine: Union[Engine, type]
+    sinks: Tuple[Any, ...]
+    enabled: bool
+
+    def __init__(self, *sinks: Any,
+                 engine: Union[Engine, AsyncEngine, type] = ...) -> None: ...
+
+    def enable(self) -> "Instrumentation": ...
+
+    def disable(self) -> None: ...
+
+    def __enter__(self) -> "Instrumentation": ...
+
+    def __exit__(self, *exc_info: Any) -> None: ...
@@ -0,0 +1,294 @@
+"""
+Canonical form of smart_query() filters, so equivalent filters
+give the same SQL and the same cache key:
+    {'id__in': [2, 1, 2], and_: {'name__exact': 'Bob'}}
+    {'name': 'Bob', 'id__in': (1, 2)}
+both become
+    {'id__in': [1, 2], 'name': 'Bob'}
+"""
+import hashlib
+from collections import abc
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, or_
+
+RELATION_SPLITTER = '___'
+OPERATOR_SPLITTER = '__'
+
+# operators replaced by their canonical form (None is equality)
+_ALIASES = {'exact': None}
+_IN_OPERATORS = ('in', 'notin')
+_LOWER = {'gt': True, 'ge': False}  # operator: is strict
+_UPPER = {'lt': True, 'le': False}
+# operators folded when they constrain the same attribute
+_FOLDED = ('in',) + tuple(_LOWER) + tuple(_UPPER)
+# values compared in Python same as in database (unlike strings,
+# which depend on collation)
+_ORDERED = (int, float, Decimal, date, datetime, time, timedelta)
+
+# node kinds of the filter tree
+_LEAF, _AND, _OR, _FN, _FALSE = 'leaf', 'and', 'or', 'fn', 'false'
+
+
+def _split_key(key):
+    """'user___name__in' -> ('user___', 'name', 'in')"""
+    path, splitter, attr = key.rpartition(RELATION_SPLITTER)
+    if OPERATOR_SPLITTER in attr:
+        name, op = attr.rsplit(OPERATOR_SPLITTER, 1)
+    else:
+        name, op = attr, None
+    return path + splitter, name, _ALIASES.get(op, op)
+
+
+def _make_key(path, name, op):
+    return path + name + ('' if op is None else OPERATOR_SPLITTER + op)
+
+
+def _value_key(value):
+    """Comparable representation of any value, stable across processes"""
+    if isinstance(value, abc.Mapping):
+        return ('dict', tuple(sorted((_value_key(k), _value_key(v))
+                                     for k, v in value.items())))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return (type(value).__name__, tuple(_value_key(v) for v in value))
+    if callable(value) and hasattr(value, '__name__'):
+        return ('fn', value.__name__)
+    return (type(value).__name__, repr(value))
+
+
+def _sorted_values(values):
+    """Deduplicated and sorted values of IN list"""
+    try:
+        return sorted(set(values))
+    except TypeError:  # not hashable or not comparable (like None)
+        unique = {_value_key(v): v for v in values}
+        return [unique[k] for k in sorted(unique)]
+
+
+def _leaves(key, value):
+    path, name, op = _split_key(key)
+    if op in _IN_OPERATORS and isinstance(value, (list, tuple, set,
+                                                  frozenset)):
+        value = _sorted_values(value)
+    elif op == 'between' and isinstance(value, (list, tuple)) \
+            and len(value) == 2:
+        return [(_LEAF, _make_key(path, name, 'ge'), value[0]),
+                (_LEAF, _make_key(path, name, 'le'), value[1])]
+    return [(_LEAF, _make_key(path, name, op), value)]
+
+
+def _parse(filters):
+    """
+    Nodes of filters: dict items and list elements are joined by
+    the operator of enclosing group (AND at the top level)
+    """
+    if isinstance(filters, abc.Mapping):
+        for key, value in filters.items():
+            if key is and_:
+                yield (_AND, tuple(_parse(value)))
+            elif key is or_:
+                yield (_OR, tuple(_parse(value)))
+            elif callable(key):
+                yield (_FN, key, tuple(_parse(value)))
+            else:
+                yield from _leaves(key, value)
+    elif isinstance(filters, abc.Sequence) and \
+            not isinstance(filters, str):
+        for f in filters:
+            yield from _parse(f)
+    else:
+        raise TypeError('Unsupported type ({}) in filters: {!r}'
+                        .format(type(filters), filters))
+
+
+def _node_key(node):
+    kind = node[0]
+    if kind == _LEAF:
+        return (kind, node[1], _value_key(node[2]))
+    if kind == _FALSE:
+        return node
+    if kind == _FN:
+        return (kind, node[1].__name__,
+                tuple(_node_key(n) for n in node[2]))
+    return (kind, tuple(_node_key(n) for n in node[1]))
+
+
+def _unique(nodes):
+    result = {}
+    for node in nodes:
+        result.setdefault(_node_key(node), node)
+    return [result[k] for k in sorted(result)]
+
+
+def _fold_attribute(path, name, leaves):
+    """
+    Leaves constraining one attribute (joined by AND) folded to
+    the tightest equivalent ones, or [(_FALSE, key)] if they contradict.
+    Raises TypeError if values can't be compared in Python.
+    """
+    equal, values, lower, upper = [], None, None, None
+    for _, key, value in leaves:
+        op = _split_key(key)[2]
+        if not all(isinstance(v, _ORDERED)
+                   for v in (value if op == 'in' else [value])):
+            raise TypeError('Cant compare {!r}'.format(value))
+        if op is None:
+            equal.append(value)
+        elif op == 'in':
+            values = set(value) if values is None else values & set(value)
+        elif op in _LOWER:
+            bound = (value, _LOWER[op])
+            if lower is None or bound > lower:
+                lower = bound
+        else:
+            bound = (value, not _UPPER[op])
+            if upper is None or bound < upper:
+                upper = bound
+
+    def fits(value):
+        if lower is not None and (value < lower[0] or
+                                  value == lower[0] and lower[1]):
+            return False
+        return upper is None or not (value > upper[0] or
+                                     value == upper[0] and not upper[1])
+
+    false = [(_FALSE, _make_key(path, name, 'in'))]
+    if equal:
+        if len(set(equal)) > 1 or not fits(equal[0]) or \
+                values is not None and equal[0] not in values:
+            return false
+        return [(_LEAF, _make_key(path, name, None), equal[0])]
+    if values is not None:
+        values = [v for v in _sorted_values(values) if fits(v)]
+        if not values:
+            return false
+        return [(_LEAF, _make_key(path, name, 'in'), values)]
+    if lower is not None and upper is not None:
+        if lower[0] > upper[0] or lower[0] == upper[0] and \
+                (lower[1] or not upper[1]):
+            return false
+        if lower[0] == upper[0]:
+            return [(_LEAF, _make_key(path, name, None), lower[0])]
+    result = []
+    if lower is not None:
+        op = 'gt' if lower[1] else 'ge'
+        result.append((_LEAF, _make_key(path, name, op), lower[0]))
+    if upper is not None:
+        op = 'le' if upper[1] else 'lt'
+        result.append((_LEAF, _make_key(path, name, op), upper[0]))
+    return result
+
+
+def _fold(nodes):
+    """Fold range, IN and equality leaves of the same attribute"""
+    by_attr = {}
+    for node in nodes:
+        if node[0] == _LEAF:
+            path, name, _ = _split_key(node[1])
+            by_attr.setdefault((path, name), []).append(node)
+
+    result = [n for n in nodes if n[0] != _LEAF]
+    for (path, name), leaves in by_attr.items():
+        foldable, other = [], []
+        for leaf in leaves:
+            op = _split_key(leaf[1])[2]
+            if op is None or op in _FOLDED and \
+                    (op != 'in' or isinstance(leaf[2], list)):
+                foldable.append(leaf)
+            else:
+                other.append(leaf)
+        result.extend(other)
+        # attribute without range/IN may be a hybrid method, which
+        # can't be reasoned about
+        if all(_split_key(leaf[1])[2] is None for leaf in foldable):
+            result.extend(foldable)
+            continue
+        try:
+            result.extend(_fold_attribute(path, name, foldable))
+        except TypeError:  # not comparable values
+            result.extend(foldable)
+    return result
+
+
+def _simplify(node):
+    kind = node[0]
+    if kind in (_LEAF, _FALSE):
+        return node
+    if kind == _FN:
+        return (_FN, node[1], tuple(_unique(map(_simplify, node[2]))))
+
+    children = []
+    for child in map(_simplify, node[1]):
+        if child[0] == kind:  # and_ in and_, or_ in or_
+            children.extend(child[1])
+        else:
+            children.append(child)
+
+    if kind == _AND:
+        children = _unique(_fold(children))
+        false = [c for c in children if c[0] == _FALSE]
+        if false:
+            return false[0]
+    else:
+        not_false = [c for c in children if c[0] != _FALSE]
+        children = _unique(not_false or children[:1])
+
+    if len(children) == 1:
+        return children[0]
+    return (kind, tuple(children))
+
+
+def _tree(filters):
+    return _simplify((_AND, tuple(_parse(filters or {}))))
+
+
+def _item(node):
+    """(key, value) of node in filters dict"""
+    kind = node[0]
+    if kind == _LEAF:
+        return node[1], node[2]
+    if kind == _FALSE:
+        return node[1], []
+    if kind == _FN:
+        return node[1], _render(node[2])
+    return (and_ if kind == _AND else or_), _render(node[1])
+
+
+def _render(nodes):
+    """Dict of nodes, or list of dicts if some keys repeat"""
+    result, extra = {}, []
+    for node in nodes:
+        key, value = _item(node)
+        if key in result:
+            extra.append({key: value})
+        else:
+            result[key] = value
+    return [result] + extra if extra else result
+
+
+def normalize_filters(filters):
+    """
+    Canonical form of smart_query() filters (same for equivalent filters):
+      * `exact` operator becomes plain equality
+      * nested and_/or_ are flattened, and_/or_ with one condition
+        is replaced with the condition
+      * IN lists are deduplicated and sorted
+      * `between` becomes `ge` and `le`
+      * ranges, IN lists and equality on the same attribute are folded,
+        e.g. {'id__gt': 1, 'id__ge': 5, 'id__lt': 10} -> {'id__ge': 5,
+        'id__lt': 10}; contradicting ones become always false `id__in=[]`
+      * duplicate conditions are removed and the order is canonical
+
+    Result is a dict, or a list of dicts if an attribute is repeated.
+    """
+    tree = _tree(filters)
+    if tree[0] == _AND:
+        return _render(tree[1])
+    return _render([tree])
+
+
+def filters_hash(filters):
+    """Stable (across processes) hash of normalized filters"""
+    key = repr(_node_key(_tree(filters)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
@@ -0,0 +1,11 @@
+from typing import Any, Dict, List, Optional, Union
+
+RELATION_SPLITTER: str
+OPERATOR_SPLITTER: str
+
+
+def normalize_filters(
+        filters: Optional[Union[dict, list]]
+) -> Union[Dict[Any, Any], List[Dict[Any, Any]]]: ...
+
+def filters_hash(filters: Optional[Union[dict, list]]) -> str: ...
@@ -0,0 +1,163 @@
+import logging
+from contextvars import ContextVar
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .eagerload import JOINED, SELECTIN
+
+try:
+    import pytest
+except ImportError:  # pragma: no cover
+    pytest = None
+
+# detectors active in the current context (thread / asyncio task)
+_detectors = ContextVar('sqlalchemy_mixins_detectors', default=())
+_listening = False
+
+logger = logging.getLogger('sqlalchemy_mixins')
+
+
+class NPlusOneError(RuntimeError):
+    pass
+
+
+def _on_execute(state):
+    detectors = _detectors.get()
+    if not detectors or state.lazy_loaded_from is None:
+        return
+    relationship = state.loader_strategy_path[-1]
+    # parent object was loaded by query of root entity, then through
+    # relationships: (root mapper, relationship, mapper, relationship, ...)
+    parent_path = state.lazy_loaded_from.load_path.path
+    root = parent_path[0].mapper if parent_path else relationship.parent
+    path = tuple(parent_path[1::2]) + (relationship,)
+    for detector in detectors:
+        detector._lazy_loaded(relationship, root, path)
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Session, 'do_orm_execute', _on_execute)
+        _listening = True
+
+
+class NPlusOneDetector(object):
+    """
+    Watches lazy loads (ones that emit SQL) per relationship.
+    When one relationship lazy-loads more than `threshold` times,
+     raises NPlusOneError or (with raise_errors=False) logs a warning.
+    Both suggest eager load schema that fixes the problem.
+
+    Example:
+        with NPlusOneDetector():
+            for post in Post.all():
+                print(post.user)  # raises NPlusOneError on 2nd post
+
+        with NPlusOneDetector():
+            for post in Post.with_({Post.user: JOINED}).all():
+                print(post.user)  # OK
+    """
+
+    def __init__(self, threshold=1, raise_errors=True):
+        self.threshold = threshold
+        self.raise_errors = raise_errors
+        self.counts = {}
+        # lazy loads by (root mapper, relationships path from root)
+        self.paths = {}
+        self._token = None
+
+    def __enter__(self):
+        _listen()
+        self._token = _detectors.set(_detectors.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _detectors.reset(self._token)
+        self._token = None
+
+    @staticmethod
+    def _suggested_method(relationship):
+        return SELECTIN if relationship.uselist else JOINED
+
+    @classmethod
+    def _nested_schema(cls, paths):
+        """{Post.user: (JOINED, {User.posts: SELECTIN})} for paths
+        of relationships like (Post.user, User.posts)"""
+        tree = {}
+        for path in paths:
+            node = tree
+            for relationship in path:
+                node = node.setdefault(relationship, {})
+
+        def to_schema(node):
+            return {rel.class_attribute:
+                    (cls._suggested_method(rel), to_schema(children))
+                    if children else cls._suggested_method(rel)
+                    for rel, children in node.items()}
+        return to_schema(tree)
+
+    @staticmethod
+    def _format_schema(schema):
+        items = []
+        for attr, value in schema.items():
+            if isinstance(value, tuple):
+                value = '({}, {})'.format(
+                    value[0].upper(),
+                    NPlusOneDetector._format_schema(value[1]))
+            else:
+                value = value.upper()
+            items.append('{}: {}'.format(attr, value))
+        return '{' + ', '.join(items) + '}'
+
+    def _lazy_loaded(self, relationship, root, path):
+        key = (root, path)
+        self.paths[key] = self.paths.get(key, 0) + 1
+        count = self.counts.get(relationship, 0) + 1
+        self.counts[relationship] = count
+        if count != self.threshold + 1:
+            return
+
+        message = ('{} was lazy loaded {} times, eager load it with '
+                   'schema {}'.format(
+                       relationship.class_attribute, count,
+                       self._format_schema(self._nested_schema([path]))))
+        if self.raise_errors:
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+    @property
+    def detected(self):
+        """Relationships that were lazy loaded more than `threshold` times"""
+        return [rel.class_attribute for rel, count in self.counts.items()
+                if count > self.threshold]
+
+    def suggested_schema(self, entity=None):
+        """
+        Eager load schema that fixes all detected problems in queries
+         of `entity` (by default, root entity of the first detected
+         problem), nested along relationships objects were loaded
+         through, e.g. for posts loaded by Post.all():
+         {Post.user: ('joined', {User.posts: 'selectin'})}
+        It can be passed to with_() or smart_query(schema=...) as is.
+        """
+        paths = [(root, path) for (root, path) in self.paths
+                 if self.counts[path[-1]] > self.threshold]
+        if not paths:
+            return {}
+        root = paths[0][0] if entity is None else inspect(entity).mapper
+        return self._nested_schema(path for path_root, path in paths
+                                   if path_root is root)
+
+
+if pytest is not None:
+    @pytest.fixture
+    def nplusone():
+        """
+        Fails the test on N+1 lazy loads. To use it, import it
+         in your conftest.py:
+            from sqlalchemy_mixins.nplusone import nplusone
+        """
+        with NPlusOneDetector() as detector:
+            yield detector
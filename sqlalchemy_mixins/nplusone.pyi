@@ -0,0 +1,33 @@
+import logging
+from typing import Dict, Iterator, List, Optional, Any, Tuple, Union
+
+from sqlalchemy.orm import Mapper, QueryableAttribute, RelationshipProperty
+
+logger: logging.Logger
+
+
+class NPlusOneError(RuntimeError): ...
+
+
+class NPlusOneDetector:
+    threshold: int
+    raise_errors: bool
+    counts: Dict[RelationshipProperty, int]
+    paths: Dict[Tuple[Mapper, Tuple[RelationshipProperty, ...]], int]
+
+    def __init__(self, threshold: int = 1,
+                 raise_errors: bool = True) -> None: ...
+
+    def __enter__(self) -> "NPlusOneDetector": ...
+
+    def __exit__(self, *exc_info: Any) -> None: ...
+
+    @property
+    def detected(self) -> List[QueryableAttribute]: ...
+
+    def suggested_schema(
+            self, entity: Optional[Any] = None
+    ) -> Dict[QueryableAttribute, Union[str, Tuple[str, dict]]]: ...
+
+
+def nplusone() -> Iterator[NPlusOneDetector]: ...
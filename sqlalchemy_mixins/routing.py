@@ -0,0 +1,137 @@
+import itertools
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# seconds to keep reading from the writer after commit of flushed changes,
+# so the session sees its own writes despite replication lag
+DEFAULT_STICKY_SECONDS = 1.0
+
+
+class RoundRobin(object):
+    """Picks read engines in turn"""
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, engines):
+        return engines[next(self._counter) % len(engines)]
+
+
+class LeastLatency(object):
+    """
+    Picks read engine with the lowest average statement duration
+    (exponentially weighted, so it follows changes in replica load).
+    Engines without measurements are tried first.
+    """
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.latencies = {}
+        # {engine: (before, after) cursor execute listeners}
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def choose(self, engines):
+        for engine in engines:
+            if engine not in self._listeners:
+                self._watch(engine)
+        return min(engines, key=lambda e: self.latencies.get(e, 0.0))
+
+    def record(self, engine, duration):
+        latency = self.latencies.get(engine)
+        self.latencies[engine] = duration if latency is None \
+            else latency + self.alpha * (duration - latency)
+
+    def unwatch(self, engines=None):
+        """
+        Stops measuring statements of engines (all measured by default)
+        and forgets their latencies
+        """
+        with self._lock:
+            for engine in list(self._listeners) if engines is None \
+                    else engines:
+                listeners = self._listeners.pop(engine, None)
+                if listeners is None:
+                    continue
+                event.remove(engine, 'before_cursor_execute', listeners[0])
+                event.remove(engine, 'after_cursor_execute', listeners[1])
+                self.latencies.pop(engine, None)
+
+    def _watch(self, engine):
+        def before(conn, cursor, statement, parameters, context,
+                   executemany):
+            context._sqlalchemy_mixins_routing_start = time.perf_counter()
+
+        def after(conn, cursor, statement, parameters, context,
+                  executemany):
+            start = getattr(context, '_sqlalchemy_mixins_routing_start', None)
+            if start is not None:
+                self.record(engine, time.perf_counter() - start)
+
+        with self._lock:
+            if engine in self._listeners:
+                return
+            event.listen(engine, 'before_cursor_execute', before)
+            event.listen(engine, 'after_cursor_execute', after)
+            self._listeners[engine] = (before, after)
+
+
+class RoutingSession(Session):
+    """
+    Session sending SELECTs to read engines (replicas) and everything
+    else to the writer (session bind).
+
+    SELECTs go to the writer too:
+      * while flushing or when there are flushed but not committed changes
+      * for `sticky_seconds` after commit of such changes
+        (so the session reads its own writes)
+      * with FOR UPDATE
+
+    Example:
+        Session = sessionmaker(class_=RoutingSession, bind=writer,
+                               readers=[replica1, replica2],
+                               policy=LeastLatency())
+    """
+
+    def __init__(self, bind=None, readers=(), policy=None,
+                 sticky_seconds=DEFAULT_STICKY_SECONDS, **kwargs):
+        super().__init__(bind=bind, **kwargs)
+        self.readers = list(readers)
+        self.policy = policy or RoundRobin()
+        self.sticky_seconds = sticky_seconds
+        self._has_writes = False
+        self._last_write = None
+
+    def _sticky(self):
+        if self._has_writes:
+            return True
+        return self._last_write is not None and \
+            time.monotonic() - self._last_write < self.sticky_seconds
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.readers and clause is not None \
+                and getattr(clause, 'is_select', False) \
+                and getattr(clause, '_for_update_arg', None) is None \
+                and not self._flushing and not self._sticky():
+            return self.policy.choose(self.readers)
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    session._has_writes = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if session._has_writes:
+        session._has_writes = False
+        session._last_write = time.monotonic()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(session):
+    session._has_writes = False
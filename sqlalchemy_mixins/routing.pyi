@@ -0,0 +1,38 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+DEFAULT_STICKY_SECONDS: float
+
+
+class RoundRobin:
+    def choose(self, engines: Sequence[Engine]) -> Engine: ...
+
+
+class LeastLatency:
+    alpha: float
+    latencies: Dict[Engine, float]
+
+    def __init__(self, alpha: float = 0.2) -> None: ...
+
+    def choose(self, engines: Sequence[Engine]) -> Engine: ...
+
+    def record(self, engine: Engine, duration: float) -> None: ...
+
+    def unwatch(self, engines: Optional[Iterable[Engine]] = None) -> None: ...
+
+
+class RoutingSession(Session):
+    readers: List[Engine]
+    policy: Any
+    sticky_seconds: float
+
+    def __init__(
+            self,
+            bind: Optional[Engine] = None,
+            readers: Iterable[Engine] = (),
+            policy: Optional[Any] = None,
+            sticky_seconds: float = ...,
+            **kwargs: Any
+    ) -> None: ...
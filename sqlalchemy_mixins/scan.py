@@ -0,0 +1,366 @@
+"""
+Parallel scans of a model split into primary key ranges (shards).
+Every shard is read by its own session (connection) in batches ordered
+by primary key (keyset pagination), so scans can be resumed from
+a checkpoint file.
+"""
+import asyncio
+import inspect as _inspect
+import json
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from sqlalchemy import and_, create_engine, func, select
+from sqlalchemy.orm import Session
+
+from . import smartquery as _smartquery
+
+THREAD = 'thread'
+PROCESS = 'process'
+MODES = (THREAD, PROCESS)
+
+# ways to split primary key range
+MINMAX = 'minmax'
+QUANTILES = 'quantiles'
+
+# primary key range [lo, hi)
+Shard = namedtuple('Shard', 'number lo hi')
+# reported to `progress` callback
+ScanProgress = namedtuple('ScanProgress', 'shards done rows')
+
+
+def _pk_column(cls):
+    pks = cls.__mapper__.primary_key
+    if len(pks) != 1 or pks[0].type.python_type is not int:
+        raise ValueError('{} should have single integer primary key '
+                         'to be scanned in parallel'.format(cls.__name__))
+    return pks[0]
+
+
+def _pk_key(cls):
+    """Name of mapped primary key attribute (may differ from column name)"""
+    return cls.__mapper__.get_property_by_column(_pk_column(cls)).key
+
+
+def make_shards(cls, session, shards, method=MINMAX):
+    """
+    Primary key ranges of the table:
+      * MINMAX splits min..max to equal ranges (fast, fits dense keys)
+      * QUANTILES makes ranges with equal number of rows
+        (counts rows, fits sparse keys)
+    """
+    pk = _pk_column(cls)
+    low, high = session.execute(select(func.min(pk), func.max(pk))).one()
+    if low is None:
+        return []
+    if method == MINMAX:
+        step = max(1, -(-(high - low + 1) // shards))
+        bounds = list(range(low, high + 1, step))
+    elif method == QUANTILES:
+        count = session.execute(select(func.count(pk))).scalar()
+        bounds = [low]
+        for i in range(1, shards):
+            bound = session.execute(select(pk).order_by(pk)
+                                    .offset(count * i // shards)
+                                    .limit(1)).scalar()
+            if bound is not None and bound > bounds[-1]:
+                bounds.append(bound)
+    else:
+        raise ValueError('Unknown shard method `{}`'.format(method))
+    return [Shard(i, lo, hi) for i, (lo, hi) in
+            enumerate(zip(bounds, bounds[1:] + [high + 1]))]
+
+
+class Checkpoint(object):
+    """
+    Scan state in JSON file: shards, and last primary key read by every
+    shard. Scan with the same checkpoint continues where it stopped
+    (shards are taken from the file, not recalculated).
+    File is written atomically after every batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.shards, self.last, self.done = None, {}, set()
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.shards = [Shard(*shard) for shard in state['shards']]
+            self.last = {int(k): v for k, v in state['last'].items()}
+            self.done = set(state['done'])
+
+    def start(self, shards):
+        with self._lock:
+            self.shards = shards
+            self._save()
+
+    def advance(self, number, last_pk):
+        with self._lock:
+            self.last[number] = last_pk
+            self._save()
+
+    def finish(self, number):
+        with self._lock:
+            self.done.add(number)
+            self._save()
+
+    @property
+    def finished(self):
+        return self.shards is not None and \
+            len(self.done) == len(self.shards)
+
+    def _save(self):
+        state = {'shards': [list(shard) for shard in self.shards],
+                 'last': self.last, 'done': sorted(self.done)}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+
+def _batch_query(cls, query, shard, after, filters, schema, batch_size):
+    pk = _pk_key(cls)
+    bounds = {pk + ('__gt' if after is not None else '__ge'):
+              shard.lo if after is None else after,
+              pk + '__lt': shard.hi}
+    filters = {and_: [filters, bounds]} if filters else bounds
+    return _smartquery.smart_query(query, filters, [pk], schema) \
+        .limit(batch_size)
+
+
+def _scan_shard(cls, session, shard, after, filters, schema, batch_size,
+                fn, on_batch):
+    """Reads shard in batches after primary key `after`"""
+    pk = _pk_key(cls)
+    results = []
+    while True:
+        batch = _batch_query(cls, session.query(cls), shard, after,
+                             filters, schema, batch_size).all()
+        if not batch:
+            break
+        results.append(fn(batch))
+        after = getattr(batch[-1], pk)
+        on_batch(shard, after, len(batch))
+        if len(batch) < batch_size:
+            break
+    return results
+
+
+def _is_memory_database(url):
+    """Whether URL is SQLite database living in memory of one process"""
+    if url.get_backend_name() != 'sqlite':
+        return False
+    database = url.database or ''
+    return database in ('', ':memory:') or \
+        database.startswith('file::memory:') or \
+        url.query.get('mode') == 'memory'
+
+
+def _process_engine_factory(engine):
+    """
+    Picklable function creating engine like `engine` in worker process.
+    Only URL is passed (with password), not other engine options
+    """
+    if _is_memory_database(engine.url):
+        raise ValueError('In-memory database {} cant be scanned by '
+                         'processes, use THREAD mode'.format(engine.url))
+    return partial(create_engine,
+                   engine.url.render_as_string(hide_password=False))
+
+
+def _scan_shard_process(cls, engine_factory, shard, after, filters, schema,
+                        batch_size, fn):
+    engine = engine_factory()
+    rows = []
+
+    def on_batch(shard, last_pk, count):
+        rows.append(count)
+
+    try:
+        with Session(engine) as session:
+            results = _scan_shard(cls, session, shard, after, filters,
+                                  schema, batch_size, fn, on_batch)
+    finally:
+        engine.dispose()
+    return results, sum(rows)
+
+
+class _Scan(object):
+    """Shards to scan and bookkeeping shared by workers"""
+
+    def __init__(self, shards, checkpoint, progress):
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.shards = shards
+        self.done = len(checkpoint.done) if checkpoint else 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def pending(self):
+        """(shard, primary key to continue after) for unfinished shards"""
+        for shard in self.shards:
+            if self.checkpoint and shard.number in self.checkpoint.done:
+                continue
+            after = self.checkpoint.last.get(shard.number) \
+                if self.checkpoint else None
+            yield shard, after
+
+    def on_batch(self, shard, last_pk, count):
+        if self.checkpoint:
+            self.checkpoint.advance(shard.number, last_pk)
+        self._report(rows=count)
+
+    def on_shard(self, shard, rows=0):
+        if self.checkpoint:
+            self.checkpoint.finish(shard.number)
+        self._report(rows, shards=1)
+
+    def _report(self, rows, shards=0):
+        with self._lock:
+            self.rows += rows
+            self.done += shards
+            if self.progress is not None:
+                self.progress(ScanProgress(len(self.shards), self.done,
+                                           self.rows))
+
+
+def _prepare(cls, session, shards, method, checkpoint, progress):
+    if isinstance(checkpoint, str):
+        checkpoint = Checkpoint(checkpoint)
+    if checkpoint is not None and checkpoint.shards is not None:
+        shard_list = checkpoint.shards
+    else:
+        shard_list = make_shards(cls, session, shards, method)
+        if checkpoint is not None:
+            checkpoint.start(shard_list)
+    return _Scan(shard_list, checkpoint, progress)
+
+
+def parallel_scan(cls, fn, filters=None, workers=4, mode=THREAD,
+                  batch_size=1000, shards=None, method=MINMAX,
+                  checkpoint=None, progress=None, schema=None,
+                  engine=None, engine_factory=None):
+    """
+    Calls fn(batch) for objects matching smart_query() filters, reading
+    primary key ranges in parallel, each by its own session.
+    Returns results of fn in primary key order.
+
+    :param workers: number of threads or processes
+    :param mode: THREAD or PROCESS. In PROCESS mode, fn and its results
+     should be picklable, and checkpoint and progress are updated
+     per shard (not batch)
+    :param shards: number of shards, `workers` by default
+    :param method: MINMAX or QUANTILES, see make_shards()
+    :param checkpoint: Checkpoint or its file path to resume the scan.
+     Resumed scan calls fn only for batches after the checkpoint and
+     returns their results only, so fn should store its results itself
+     (side effects, say, writes or files). In PROCESS mode unfinished
+     shards are read from the start again, so fn is called again with
+     batches it got before the failure and should be idempotent
+    :param progress: called with ScanProgress after each batch
+     (after each shard in PROCESS mode)
+    :param engine: engine to read from, bind of cls.session by default
+    :param engine_factory: picklable function returning engine for
+     PROCESS mode workers. By default, they create engines from URL of
+     `engine` (with password, without other engine options). In-memory
+     SQLite databases can't be scanned by processes
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown scan mode `{}`'.format(mode))
+    if engine is None:
+        engine = cls.session.get_bind(mapper=cls.__mapper__)
+    if mode == PROCESS and engine_factory is None:
+        engine_factory = _process_engine_factory(engine)
+    with Session(engine) as session:
+        scan = _prepare(cls, session, shards or workers, method,
+                        checkpoint, progress)
+
+    if mode == THREAD:
+        def run(shard, after):
+            with Session(engine) as session:
+                results = _scan_shard(cls, session, shard, after, filters,
+                                      schema, batch_size, fn, scan.on_batch)
+            scan.on_shard(shard)
+            return results
+        executor = ThreadPoolExecutor(workers)
+    else:
+        executor = ProcessPoolExecutor(workers)
+
+    with executor:
+        futures = []
+        for shard, after in scan.pending():
+            if mode == THREAD:
+                futures.append(executor.submit(run, shard, after))
+            else:
+                future = executor.submit(_scan_shard_process, cls,
+                                         engine_factory, shard, after,
+                                         filters, schema, batch_size, fn)
+                future.add_done_callback(
+                    lambda f, shard=shard: f.exception() is None and
+                    scan.on_shard(shard, f.result()[1]))
+                futures.append(future)
+        results = []
+        for future in futures:
+            result = future.result()
+            results.extend(result if mode == THREAD else result[0])
+    return results
+
+
+async def parallel_scan_async(cls, fn, filters=None, workers=4,
+                              batch_size=1000, shards=None, method=MINMAX,
+                              checkpoint=None, progress=None, schema=None,
+                              engine=None):
+    """
+    Async version of parallel_scan(): shards are read by asyncio tasks
+    (no more than `workers` at once), each with its own AsyncSession.
+    fn may be a coroutine function.
+
+    :param engine: AsyncEngine, bind of cls.session by default
+    """
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    if engine is None:
+        engine = getattr(cls.session, 'bind', None) or \
+            getattr(cls.session, 'kw', {}).get('bind')
+        if engine is None:
+            raise ValueError('No engine to scan {}'.format(cls.__name__))
+    async with AsyncSession(engine) as session:
+        scan = await session.run_sync(
+            lambda sync_session: _prepare(cls, sync_session,
+                                          shards or workers, method,
+                                          checkpoint, progress))
+
+    semaphore = asyncio.Semaphore(workers)
+    pk = _pk_key(cls)
+
+    async def run(shard, after):
+        results = []
+        async with semaphore, AsyncSession(engine) as session:
+            while True:
+                stmt = _batch_query(cls, select(cls), shard, after,
+                                    filters, schema, batch_size)
+                batch = (await session.execute(stmt)).scalars().all()
+                if not batch:
+                    break
+                result = fn(batch)
+                if _inspect.isawaitable(result):
+                    result = await result
+                results.append(result)
+                after = getattr(batch[-1], pk)
+                scan.on_batch(shard, after, len(batch))
+                if len(batch) < batch_size:
+                    break
+        scan.on_shard(shard)
+        return results
+
+    results = []
+    for shard_results in await asyncio.gather(
+            *[run(shard, after) for shard, after in scan.pending()]):
+        results.extend(shard_results)
+    return results
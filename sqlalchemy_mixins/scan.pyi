@@ -0,0 +1,77 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, \
+    Type, Union
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+THREAD: str
+PROCESS: str
+MODES: tuple
+MINMAX: str
+QUANTILES: str
+
+
+class Shard(NamedTuple):
+    number: int
+    lo: int
+    hi: int
+
+
+class ScanProgress(NamedTuple):
+    shards: int
+    done: int
+    rows: int
+
+
+def make_shards(cls: Type[Any], session: Session, shards: int,
+                method: str = MINMAX) -> List[Shard]: ...
+
+
+class Checkpoint:
+    path: str
+    shards: Optional[List[Shard]]
+    last: Dict[int, int]
+    done: Set[int]
+
+    def __init__(self, path: str) -> None: ...
+
+    def start(self, shards: List[Shard]) -> None: ...
+
+    def advance(self, number: int, last_pk: int) -> None: ...
+
+    def finish(self, number: int) -> None: ...
+
+    @property
+    def finished(self) -> bool: ...
+
+
+def parallel_scan(
+        cls: Type[Any],
+        fn: Callable[[List[Any]], Any],
+        filters: Optional[Union[dict, list]] = None,
+        workers: int = 4,
+        mode: str = THREAD,
+        batch_size: int = 1000,
+        shards: Optional[int] = None,
+        method: str = MINMAX,
+        checkpoint: Optional[Union[Checkpoint, str]] = None,
+        progress: Optional[Callable[[ScanProgress], Any]] = None,
+        schema: Optional[Union[dict, str]] = None,
+        engine: Optional[Engine] = None,
+        engine_factory: Optional[Callable[[], Engine]] = None
+) -> List[Any]: ...
+
+async def parallel_scan_async(
+        cls: Type[Any],
+        fn: Callable[[List[Any]], Any],
+        filters: Optional[Union[dict, list]] = None,
+        workers: int = 4,
+        batch_size: int = 1000,
+        shards: Optional[int] = None,
+        method: str = MINMAX,
+        checkpoint: Optional[Union[Checkpoint, str]] = None,
+        progress: Optional[Callable[[ScanProgress], Any]] = None,
+        schema: Optional[Union[dict, str]] = None,
+        engine: Optional[AsyncEngine] = None
+) -> List[Any]: ...
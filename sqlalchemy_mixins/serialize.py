@@ -1,7 +1,180 @@
+import json
+import os
+from array import array
+from collections import deque
 from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from multiprocessing import shared_memory
+from uuid import UUID
+
+from sqlalchemy import inspect, select
 
 from .inspection import InspectionMixin
 
+# number of rows below which batches are serialized in-process,
+# as starting worker processes costs more
+PARALLEL_THRESHOLD = 50000
+BATCH_SIZE = 10000
+
+# column buffers passed through shared memory: array typecode by value type
+_SHARED_TYPES = {int: 'q', float: 'd'}
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError('Object of type {} is not JSON serializable'
+                    .format(type(value).__name__))
+
+
+def _encode_rows(keys, columns):
+    """Rows (given as columns) as JSON objects separated by commas"""
+    rows = [dict(zip(keys, values)) for values in zip(*columns)]
+    return json.dumps(rows, default=_json_default, separators=(',', ':'),
+                      ensure_ascii=False)[1:-1].encode('utf-8')
+
+
+def _share_column(values):
+    """
+    Column as ('shm', SharedMemory, typecode) if all values are of
+    one type from _SHARED_TYPES (no copy is pickled to workers),
+    else ('list', values)
+    """
+    typecode = _SHARED_TYPES.get(type(values[0]))
+    if typecode is None or \
+            any(type(value) is not type(values[0]) for value in values) or \
+            typecode == 'q' and not (_INT64[0] <= min(values) and
+                                     max(values) <= _INT64[1]):
+        return 'list', values
+    buffer = array(typecode, values)
+    memory = shared_memory.SharedMemory(create=True,
+                                        size=max(1, buffer.itemsize *
+                                                 len(buffer)))
+    memory.buf[:buffer.itemsize * len(buffer)] = buffer.tobytes()
+    return 'shm', memory, typecode
+
+
+def _encode_shared(keys, length, columns):
+    """Worker side of _encode_rows() for columns made by _share_column()"""
+    values = []
+    for column in columns:
+        if column[0] == 'list':
+            values.append(column[1])
+            continue
+        memory = shared_memory.SharedMemory(name=column[1])
+        try:
+            view = memory.buf.cast(column[2])
+            values.append(view[:length].tolist())
+            view.release()
+        finally:
+            memory.close()
+    return _encode_rows(keys, values)
+
+
+def _submit(executor, keys, batch):
+    columns = [_share_column(list(values)) for values in zip(*batch)]
+    shared = [c[1] for c in columns if c[0] == 'shm']
+    args = [('shm', c[1].name, c[2]) if c[0] == 'shm' else c
+            for c in columns]
+    try:
+        return executor.submit(_encode_shared, keys, len(batch), args), \
+            shared
+    except BaseException:
+        _release(shared)
+        raise
+
+
+def _release(shared):
+    for memory in shared:
+        memory.close()
+        memory.unlink()
+
+
+def serialize_batches(keys, batches, processes=None,
+                      threshold=PARALLEL_THRESHOLD, executor=None):
+    """
+    JSON array of rows as chunks of bytes (one per batch, in order),
+    concatenated they give [{"id":1,"name":"Bob"},...].
+
+    Batches are encoded in-process until `threshold` rows are fetched,
+    then in a process pool. Integer and float columns are handed to
+    workers through shared memory, others are pickled.
+
+    :param keys: names of row values (JSON object keys)
+    :param batches: iterable of lists of row tuples
+    :param processes: size of the pool made if no executor given,
+     or number of workers of `executor`. Number of CPUs by default
+    :param executor: ProcessPoolExecutor to use (left running)
+    """
+    prefix = b'['
+    buffered, count = [], 0
+    batches = iter(batches)
+    for batch in batches:
+        if not batch:
+            continue
+        buffered.append(batch)
+        count += len(batch)
+        if count >= threshold:
+            break
+    else:
+        # small result, not worth starting processes
+        for batch in buffered:
+            yield prefix + _encode_rows(keys, list(zip(*batch)))
+            prefix = b','
+        yield b']' if prefix == b',' else b'[]'
+        return
+
+    processes = processes or os.cpu_count() or 1
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(processes)
+    # batches submitted ahead, to keep all workers busy
+    window = processes * 2
+    pending = deque()
+    try:
+        for batch in _chain(buffered, batches):
+            if not batch:
+                continue
+            pending.append(_submit(executor, keys, batch))
+            while len(pending) >= window or \
+                    pending and pending[0][0].done():
+                future, shared = pending.popleft()
+                try:
+                    yield prefix + future.result()
+                finally:
+                    _release(shared)
+                prefix = b','
+        while pending:
+            future, shared = pending.popleft()
+            try:
+                yield prefix + future.result()
+            finally:
+                _release(shared)
+            prefix = b','
+        yield b']'
+    finally:
+        for future, shared in pending:
+            future.cancel()
+            try:
+                future.exception()
+            except BaseException:
+                pass
+            _release(shared)
+        if own_executor:
+            executor.shutdown()
+
+
+def _chain(buffered, batches):
+    yield from buffered
+    yield from batches
+
 
 class SerializeMixin(InspectionMixin):
     """Mixin to make model serializable."""
@@ -16,6 +189,10 @@ class SerializeMixin(InspectionMixin):
         :param hybrid_attributes: flag to include hybrid attributes if true
         :type: bool
         :return: dict
+
+        Columns deferred by query options (see load_only/defer and
+        COLUMNS, DEFERRED eager load schema keys) are skipped, not
+        refreshed. Columns deferred by mapper (deferred()) are loaded.
         """
         result = dict()
 
@@ -24,6 +201,15 @@ class SerializeMixin(InspectionMixin):
         else :
              view_cols = filter(lambda e: e not in exclude, self.columns)
 
+        state = inspect(self)
+        if state.has_identity:
+            # unloaded, but not expired (i.e. not refreshed on commit)
+            not_loaded = state.unloaded - state.expired_attributes
+            if not_loaded:
+                attrs = state.mapper.attrs
+                view_cols = [key for key in view_cols
+                             if key not in not_loaded or attrs[key].deferred]
+
         for key in view_cols :
             result[key] = getattr(self, key)
 
@@ -44,3 +230,49 @@ class SerializeMixin(InspectionMixin):
                     ]
 
         return result
+
+    @classmethod
+    def serialize_keys(cls, hybrid_attributes=False, exclude=None):
+        """Keys of to_dict() without relationships"""
+        keys = [key for key in cls.columns
+                if exclude is None or key not in exclude]
+        if hybrid_attributes:
+            keys += cls.hybrid_properties
+        return keys
+
+    @classmethod
+    def to_json_chunks(cls, *criteria, session=None, hybrid_attributes=False,
+                       exclude=None, batch_size=BATCH_SIZE, processes=None,
+                       threshold=PARALLEL_THRESHOLD, executor=None):
+        """
+        Objects matching SQL criteria as JSON array (same keys as
+        to_dict() without relationships), in chunks of bytes:
+            with open('users.json', 'wb') as f:
+                for chunk in User.to_json_chunks(User.active == True):
+                    f.write(chunk)
+
+        Only columns are fetched (no objects are made) in batches,
+        ordered by primary key. Large results are serialized by
+        process pool, see serialize_batches().
+
+        Hybrid attributes are selected by their SQL expressions.
+
+        :param session: session to use, cls.session by default
+        """
+        if session is None:
+            session = getattr(cls, 'session', None)
+            if session is None:
+                raise ValueError('No session to query {}'.format(cls))
+        keys = cls.serialize_keys(hybrid_attributes, exclude)
+        stmt = select(*[getattr(cls, key).label(key) for key in keys]) \
+            .where(*criteria) \
+            .order_by(*[getattr(cls, pk) for pk in cls.primary_keys])
+        result = session.execute(
+            stmt, execution_options={'yield_per': batch_size})
+        try:
+            yield from serialize_batches(
+                keys, (list(map(tuple, batch))
+                       for batch in result.partitions(batch_size)),
+                processes, threshold, executor)
+        finally:
+            result.close()
@@ -1,6 +1,39 @@
+from concurrent.futures import Executor
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
 from sqlalchemy_mixins.inspection import InspectionMixin
-from typing import Optional , List
+
+PARALLEL_THRESHOLD: int
+BATCH_SIZE: int
+
+
+def serialize_batches(
+        keys: Sequence[str],
+        batches: Iterable[List[Tuple[Any, ...]]],
+        processes: Optional[int] = None,
+        threshold: int = PARALLEL_THRESHOLD,
+        executor: Optional[Executor] = None
+) -> Iterator[bytes]: ...
 
 class SerializeMixin(InspectionMixin):
 
     def to_dict(self, nested: bool = False, hybrid_attributes: bool = False, exclude: Optional[List[str]] = None) -> dict: ...
+
+    @classmethod
+    def serialize_keys(cls, hybrid_attributes: bool = False,
+                       exclude: Optional[List[str]] = None) -> List[str]: ...
+
+    @classmethod
+    def to_json_chunks(
+            cls,
+            *criteria: Any,
+            session: Optional[Session] = None,
+            hybrid_attributes: bool = False,
+            exclude: Optional[List[str]] = None,
+            batch_size: int = BATCH_SIZE,
+            processes: Optional[int] = None,
+            threshold: int = PARALLEL_THRESHOLD,
+            executor: Optional[Executor] = None
+    ) -> Iterator[bytes]: ...
@@ -1,6 +1,14 @@
-from sqlalchemy.orm import Session, scoped_session, Query
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy.orm import Session, scoped_session, sessionmaker, Query
+from .routing import RoutingSession, DEFAULT_STICKY_SECONDS
 from .utils import classproperty
 
+# sessions set by SessionMixin.using_session() in current context
+# (thread or asyncio task): tuple of (class, session), innermost last
+_session_overrides = ContextVar('sqlalchemy_mixins_sessions', default=())
+
 
 class NoSessionError(RuntimeError):
     pass
@@ -8,19 +16,84 @@ class NoSessionError(RuntimeError):
 
 class SessionMixin:
     _session = None
+    # read engine policy of session made by set_engines()
+    _routing_policy = None
 
     @classmethod
     def set_session(cls, session):
         """
         :type session: scoped_session | Session
         """
+        # replaced read engines are not measured anymore
+        policy = cls.__dict__.get('_routing_policy')
+        if policy is not None and hasattr(policy, 'unwatch'):
+            policy.unwatch()
+        cls._routing_policy = None
         cls._session = session
 
+    @classmethod
+    def set_engines(cls, writer, readers=(), policy=None,
+                    sticky_seconds=DEFAULT_STICKY_SECONDS, **kwargs):
+        """
+        Sets session which reads from `readers` (replicas) and writes
+        to `writer`, see RoutingSession. Read engines are chosen by
+        the policy: RoundRobin (default) or LeastLatency.
+
+        For sync engines, it's scoped_session.
+        For async engines (ActiveRecordMixinAsync), it's async_sessionmaker.
+
+        Example:
+            BaseModel.set_engines(primary, [replica1, replica2],
+                                  policy=LeastLatency())
+
+        :param sticky_seconds: read from the writer for that time after
+         commit of changes, so session sees its own writes
+        :param kwargs: other sessionmaker arguments
+        """
+        if hasattr(writer, 'sync_engine'):
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+            session = async_sessionmaker(
+                writer, sync_session_class=RoutingSession,
+                readers=[r.sync_engine for r in readers], policy=policy,
+                sticky_seconds=sticky_seconds, **kwargs)
+        else:
+            session = scoped_session(sessionmaker(
+                writer, class_=RoutingSession, readers=readers,
+                policy=policy, sticky_seconds=sticky_seconds, **kwargs))
+        cls.set_session(session)
+        cls._routing_policy = policy
+        return session
+
+    @classmethod
+    @contextmanager
+    def using_session(cls, session):
+        """
+        Use the session for this class (and its subclasses) in current
+        context only. It's stored in a contextvar, so it's visible only
+        to the current thread or asyncio task (and tasks it creates).
+
+        Example:
+            with BaseModel.using_session(Session(engine)) as session:
+                User.create(name='Bob')
+                session.commit()
+
+        :type session: scoped_session | Session | AsyncSession
+        """
+        token = _session_overrides.set(
+            _session_overrides.get() + ((cls, session),))
+        try:
+            yield session
+        finally:
+            _session_overrides.reset(token)
+
     @classproperty
     def session(cls):
         """
         :rtype: scoped_session | Session
         """
+        for owner, session in reversed(_session_overrides.get()):
+            if issubclass(cls, owner):
+                return session
         if cls._session is not None:
             return cls._session
         else:
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, ContextManager, Iterable, Optional, TypeVar
 
 from sqlalchemy.orm import Session, Query
 
@@ -6,12 +6,31 @@ from sqlalchemy_mixins.utils import classproperty
 
 
 
+_S = TypeVar('_S')
+
+
+class NoSessionError(RuntimeError): ...
+
+
 class SessionMixin:
     _session: Optional[Session]
 
     @classmethod
     def set_session(cls, session: Session) -> None: ...
 
+    @classmethod
+    def set_engines(
+            cls,
+            writer: Any,
+            readers: Iterable[Any] = (),
+            policy: Optional[Any] = None,
+            sticky_seconds: float = ...,
+            **kwargs: Any
+    ) -> Any: ...
+
+    @classmethod
+    def using_session(cls, session: _S) -> ContextManager[_S]: ...
+
     @classproperty
     def session(cls) -> Session: ...
 
@@ -5,23 +5,208 @@ except ImportError:  # pragma: no cover
     pass
 
 from collections import abc, OrderedDict
+from datetime import MAXYEAR, date, datetime
 
 
-from sqlalchemy import asc, desc, inspect
+from sqlalchemy import asc, desc, inspect, and_, or_, any_, all_, \
+    bindparam, false, func, select, ARRAY, Boolean, Date, Enum, Integer, String
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import aliased, contains_eager
 from sqlalchemy.orm.util import AliasedClass
 from sqlalchemy.sql import operators, extract
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
 
+from . import cache as _cache
+from .counts import is_count_path, count_expr
 # noinspection PyProtectedMember
-from .eagerload import EagerLoadMixin, _eager_expr_from_schema
+from .eagerload import EagerLoadMixin, eager_expr
+from .fulltext import fulltext_index, search_op, match_op
 from .inspection import InspectionMixin
-from .utils import classproperty
-
-RELATION_SPLITTER = '___'
-OPERATOR_SPLITTER = '__'
+from .instrumentation import tag
+from .normalize import RELATION_SPLITTER, OPERATOR_SPLITTER
+from . import scan as _scan
+from . import spec as _spec
+from .utils import classproperty, relation_graph, resolve_path
 
 DESC_PREFIX = '-'
 
+# `in`/`notin` value lists longer than this are compiled by _LargeIn
+LARGE_IN_THRESHOLD = 1000
+# max number of values in one IN list (Oracle doesn't allow more than 1000)
+IN_CHUNK_SIZE = 1000
+
+
+class _LargeIn(ColumnElement):
+    """
+    IN / NOT IN for huge value lists, e.g. 50k ids. Compiles to
+      * `col = ANY(:array)` / `col != ALL(:array)` on PostgreSQL:
+        one bound parameter, fast statement compilation
+      * `(col IN (<chunk 1>) OR col IN (<chunk 2>) ...)` on other dialects
+        with values rendered as literals at execution time, so there's no
+        bound parameter per value (SQLite has a variable limit).
+        Statement is still cached (per number of chunks).
+    """
+    __visit_name__ = 'large_in'
+    inherit_cache = True
+    _is_implicitly_boolean = True
+    type = Boolean()
+
+    _traverse_internals = [
+        ('column', InternalTraversal.dp_clauseelement),
+        ('chunks', InternalTraversal.dp_clauseelement_tuple),
+        ('array', InternalTraversal.dp_clauseelement),
+        ('negate', InternalTraversal.dp_boolean),
+    ]
+
+    def __init__(self, column, values, negate=False):
+        if hasattr(column, '__clause_element__'):
+            column = column.__clause_element__()
+        values = list(values)
+        self.column = column
+        self.negate = negate
+        self.chunks = tuple(
+            bindparam(None, values[i:i + IN_CHUNK_SIZE],
+                      expanding=True, literal_execute=True)
+            for i in range(0, len(values), IN_CHUNK_SIZE)
+        )
+        self.array = bindparam(None, values, type_=ARRAY(column.type))
+
+
+@compiles(_LargeIn)
+def _compile_large_in(element, compiler, **kw):
+    if element.negate:
+        expr = and_(*[element.column.not_in(c) for c in element.chunks])
+    else:
+        expr = or_(*[element.column.in_(c) for c in element.chunks])
+    return compiler.process(expr.self_group(), **kw)
+
+
+@compiles(_LargeIn, 'postgresql')
+def _compile_large_in_postgresql(element, compiler, **kw):
+    if element.negate:
+        expr = element.column != all_(element.array)
+    else:
+        expr = element.column == any_(element.array)
+    return compiler.process(expr, **kw)
+
+
+def _is_large_list(column, value):
+    """
+    Whether IN list should be compiled by _LargeIn. Its values are
+    rendered as literals, which is safe for integers and strings only
+    (e.g. bytes are rendered as text), so other types use in_()
+    """
+    if not isinstance(value, (list, tuple, set, frozenset)) \
+            or len(value) <= LARGE_IN_THRESHOLD:
+        return False
+    type_ = getattr(column, 'type', None)
+    return isinstance(type_, (Integer, String)) \
+        and not isinstance(type_, Enum)
+
+
+def _in_op(column, value):
+    if _is_large_list(column, value):
+        return _LargeIn(column, value)
+    return operators.in_op(column, value)
+
+
+def _notin_op(column, value):
+    if _is_large_list(column, value):
+        return _LargeIn(column, value, negate=True)
+    return operators.notin_op(column, value)
+
+
+class Operator(object):
+    """
+    Filter operator, e.g. `gt` in `rating__gt=5`.
+    Called with (column, value), returns SQL expression.
+
+    index_friendly tells whether database can use an index on the column
+    for this expression. It's either bool or callable (value) -> bool
+    for operators like `like` where it depends on the value.
+    See SmartQueryMixin.lint_filters
+    """
+
+    def __init__(self, fn, index_friendly=True):
+        self.fn = fn
+        self.index_friendly = index_friendly
+
+    def __call__(self, column, value):
+        return self.fn(column, value)
+
+    def is_index_friendly(self, value):
+        if callable(self.index_friendly):
+            return self.index_friendly(value)
+        return self.index_friendly
+
+
+def _year_range(column, year):
+    """
+    [start, end) of the year, of type matching the column, so
+    `year=2020` compiles to `2020-01-01 <= col AND col < 2021-01-01`
+    which (unlike `EXTRACT(year FROM col) = 2020`) can use an index on col.
+    End of the last year (9999) can't be represented, so it's None
+    """
+    year = int(year)
+    cls = date if isinstance(getattr(column, 'type', None), Date) \
+        else datetime
+    return cls(year, 1, 1), cls(year + 1, 1, 1) if year < MAXYEAR else None
+
+
+def _year_op(column, value):
+    start, end = _year_range(column, value)
+    if end is None:
+        return column >= start
+    return and_(column >= start, column < end)
+
+
+def _year_ne_op(column, value):
+    start, end = _year_range(column, value)
+    if end is None:
+        return column < start
+    return or_(column < start, column >= end)
+
+
+def _year_gt_op(column, value):
+    end = _year_range(column, value)[1]
+    return false() if end is None else column >= end
+
+
+def _year_le_op(column, value):
+    end = _year_range(column, value)[1]
+    return column.isnot(None) if end is None else column < end
+
+
+def _ilike_op(column, pattern):
+    # lower(col) LIKE lower(pattern) can use a functional index on lower(col)
+    return func.lower(column).like(func.lower(pattern))
+
+
+def _is_prefix_pattern(pattern):
+    return not str(pattern).startswith(('%', '_'))
+
+
+def _flatten_filter_items(filters):
+    """
+    Same as _flatten_filter_keys, but yields (key, value) pairs
+    """
+    if isinstance(filters, abc.Mapping):
+        for key, value in filters.items():
+            if callable(key):
+                yield from _flatten_filter_items(value)
+            else:
+                yield key, value
+
+    elif isinstance(filters, abc.Sequence):
+        for f in filters:
+            yield from _flatten_filter_items(f)
+
+    else:
+        raise TypeError(
+            "Unsupported type (%s) in filters: %r", (type(filters), filters)
+        )
+
 
 def _flatten_filter_keys(filters):
     """
@@ -48,21 +233,8 @@ def _flatten_filter_keys(filters):
     ]}
     """
 
-    if isinstance(filters, abc.Mapping):
-        for key, value in filters.items():
-            if callable(key):
-                yield from _flatten_filter_keys(value)
-            else:
-                yield key
-
-    elif isinstance(filters, abc.Sequence):
-        for f in filters:
-            yield from _flatten_filter_keys(f)
-
-    else:
-        raise TypeError(
-            "Unsupported type (%s) in filters: %r", (type(filters), filters)
-        )
+    for key, _ in _flatten_filter_items(filters):
+        yield key
 
 
 def _parse_path_and_make_aliases(entity, entity_path, attrs, aliases):
@@ -86,6 +258,10 @@ def _parse_path_and_make_aliases(entity, entity_path, attrs, aliases):
         # relationship name ('product') and nested attribute ('grade__order')
         if RELATION_SPLITTER in attr:
             relation_name, nested_attr = attr.split(RELATION_SPLITTER, 1)
+            # counts like 'comments___count' are subqueries, not joins
+            if is_count_path(inspect(entity).mapper.class_,
+                             relation_name, nested_attr):
+                continue
             if relation_name in relations:
                 relations[relation_name].append(nested_attr)
             else:
@@ -97,13 +273,14 @@ def _parse_path_and_make_aliases(entity, entity_path, attrs, aliases):
             if entity_path
             else relation_name
         )
-        if relation_name not in entity.relations:
+        edge = relation_graph(entity).get(relation_name)
+        if edge is None:
             raise KeyError(
                 "Incorrect path `{}`: "
                 "{} doesnt have `{}` relationship ".format(path, entity, relation_name)
             )
         relationship = getattr(entity, relation_name)
-        alias = aliased(relationship.property.mapper.class_)
+        alias = aliased(edge.mapper.class_)
         aliases[path] = alias, relationship
         _parse_path_and_make_aliases(alias, path, nested_attrs, aliases)
 
@@ -119,6 +296,195 @@ def _get_root_cls(query):
     raise ValueError('Cannot get a root class from`{}`'
                      .format(query))
 
+def _count_path(root_cls, aliases, path):
+    """
+    For count paths like 'post___comments___count__gt' returns
+    (count subquery, operator name or None), otherwise None
+    """
+    if RELATION_SPLITTER not in path:
+        return None
+    head, leaf = path.rsplit(RELATION_SPLITTER, 1)
+    if RELATION_SPLITTER in head:
+        owner_path, relation_name = head.rsplit(RELATION_SPLITTER, 1)
+        entity = aliases[owner_path][0]
+    else:
+        entity, relation_name = root_cls, head
+    if not is_count_path(inspect(entity).mapper.class_, relation_name, leaf):
+        return None
+    op_name = leaf.split(OPERATOR_SPLITTER, 1)[1] \
+        if OPERATOR_SPLITTER in leaf else None
+    return count_expr(entity, relation_name), op_name
+
+
+def _filter_expressions(root_cls, aliases, filters):
+    """
+    Filter expressions for filters like {'user___name': 'Bob'},
+    with relation paths resolved to aliases made by
+    _parse_path_and_make_aliases
+    """
+    if isinstance(filters, abc.Mapping):
+        for attr, value in filters.items():
+            if callable(attr):
+                # E.g. or_, and_, or other sqlalchemy expression
+                yield attr(*_filter_expressions(root_cls, aliases, value))
+                continue
+            count = _count_path(root_cls, aliases, attr)
+            if count is not None:
+                yield _count_filter_expr(root_cls, attr, value, *count)
+                continue
+            if RELATION_SPLITTER in attr:
+                parts = attr.rsplit(RELATION_SPLITTER, 1)
+                entity, attr_name = aliases[parts[0]][0], parts[1]
+            else:
+                entity, attr_name = root_cls, attr
+            try:
+                yield from entity.filter_expr(**{attr_name: value})
+            except KeyError as e:
+                raise KeyError("Incorrect filter path `{}`: {}".format(attr, e))
+
+    elif isinstance(filters, abc.Sequence):
+        for f in filters:
+            yield from _filter_expressions(root_cls, aliases, f)
+
+
+def _count_filter_expr(root_cls, attr, value, expr, op_name):
+    if op_name is None:
+        return expr == value
+    if op_name not in root_cls._operators:
+        raise KeyError('Incorrect filter path `{}`: unknown operator `{}`'
+                       .format(attr, op_name))
+    return root_cls._operators[op_name](expr, value)
+
+
+def _path_column(root_cls, aliases, path):
+    """
+    Column for path like 'user___name' or 'comments___count',
+    for sorting, grouping and aggregation
+    """
+    count = _count_path(root_cls, aliases, path)
+    if count is not None:
+        if count[1] is not None:
+            raise KeyError('Incorrect path `{}`: operators are not allowed '
+                           'here'.format(path))
+        return count[0]
+    if RELATION_SPLITTER in path:
+        relation_path, attr = path.rsplit(RELATION_SPLITTER, 1)
+        entity = aliases[relation_path][0]
+        cls = inspect(entity).mapper.class_
+    else:
+        entity = cls = root_cls
+        attr = path
+    if attr not in cls.sortable_attributes:
+        raise KeyError('Incorrect path `{}`: {} doesnt have `{}` column'
+                       .format(path, cls, attr))
+    return getattr(entity, attr)
+
+
+_aggregates = {
+    'count': func.count,
+    'count_distinct': lambda c: func.count(c.distinct()),
+    'sum': func.sum,
+    'avg': func.avg,
+    'min': func.min,
+    'max': func.max,
+}
+
+
+def _parse_metric(metric):
+    """
+    'count' -> ('count', None), ('avg', 'rating') -> ('avg', 'rating')
+    """
+    if isinstance(metric, str):
+        fn_name, path = metric, None
+    else:
+        fn_name, path = metric
+    if fn_name not in _aggregates:
+        raise KeyError('Unknown aggregate function `{}`'.format(fn_name))
+    if path is None and fn_name != 'count':
+        raise ValueError('Aggregate function `{}` needs a column'
+                         .format(fn_name))
+    return fn_name, path
+
+
+def aggregate_expr(root_cls, filters=None, group_by=None, metrics=None,
+                   sort_attrs=None):
+    """
+    Builds single SELECT ... GROUP BY statement with Django-ish
+    relation paths, e.g.
+        aggregate_expr(Post,
+                       filters={'rating__gt': 1},
+                       group_by=['user___name'],
+                       metrics={'n': 'count',
+                                'avg_rating': ('avg', 'comments___rating')},
+                       sort_attrs=['-n'])
+    Result columns are labeled with group_by paths and metric names.
+
+    Note that joins to collections multiply rows: use
+    ('count_distinct', 'id') to count root objects in such case.
+
+    :param root_cls: model class
+    :param filters: dict|list, same as in smart_query
+    :param group_by: List[str], column paths
+    :param metrics: dict, name -> 'count' | (function, column path).
+      Functions are count, count_distinct, sum, avg, min and max
+    :param sort_attrs: List[str], group_by paths or metric names,
+     '-' prefix for DESC
+    """
+    filters = filters or {}
+    group_by = list(group_by or [])
+    metrics = metrics or {}
+    sort_attrs = sort_attrs or []
+    metrics = OrderedDict((name, _parse_metric(metric))
+                          for name, metric in metrics.items())
+
+    attrs = list(_flatten_filter_keys(filters)) + group_by + \
+        [path for _, path in metrics.values() if path] + \
+        [s.lstrip(DESC_PREFIX) for s in sort_attrs
+         if s.lstrip(DESC_PREFIX) not in metrics]
+    aliases = OrderedDict({})
+    _parse_path_and_make_aliases(root_cls, '', attrs, aliases)
+
+    columns = OrderedDict()
+    for path in group_by:
+        columns[path] = _path_column(root_cls, aliases, path).label(path)
+    for name, (fn_name, path) in metrics.items():
+        if path is None:
+            expr = func.count()
+        else:
+            expr = _aggregates[fn_name](
+                _path_column(root_cls, aliases, path))
+        columns[name] = expr.label(name)
+
+    stmt = select(*columns.values()).select_from(root_cls)
+    for alias, relationship in aliases.values():
+        stmt = stmt.outerjoin(alias, relationship)
+    stmt = stmt.where(*_filter_expressions(root_cls, aliases, filters))
+    if group_by:
+        stmt = stmt.group_by(*[columns[path] for path in group_by])
+
+    for attr in sort_attrs:
+        fn, attr = (desc, attr[1:]) if attr.startswith(DESC_PREFIX) \
+            else (asc, attr)
+        if attr in columns:
+            stmt = stmt.order_by(fn(columns[attr]))
+        else:
+            stmt = stmt.order_by(fn(_path_column(root_cls, aliases, attr)))
+    return stmt
+
+
+def aggregate_result(result, as_columns=False):
+    """
+    Rows of executed aggregate_expr() as list of dicts or,
+    if as_columns=True, as dict of lists (one list per column)
+    """
+    keys = list(result.keys())
+    rows = result.all()
+    if as_columns:
+        return OrderedDict((key, [row[i] for row in rows])
+                           for i, key in enumerate(keys))
+    return [dict(zip(keys, row)) for row in rows]
+
+
 def smart_query(query, filters=None, sort_attrs=None, schema=None):
     """
     Does magic Django-ish joins like post___user___name__startswith='Bob'
@@ -130,7 +496,7 @@ def smart_query(query, filters=None, sort_attrs=None, schema=None):
     :param query: sqlalchemy.orm.query.Query
     :param filters: dict
     :param sort_attrs: List[basestring]
-    :param schema: dict
+    :param schema: dict|str (name of registered schema)
     """
     if not filters:
         filters = {}
@@ -158,30 +524,14 @@ def smart_query(query, filters=None, sort_attrs=None, schema=None):
         query = query.outerjoin(al[0], al[1])
         loaded_paths.append(relationship_path)
 
-    def recurse_filters(_filters):
-        if isinstance(_filters, abc.Mapping):
-            for attr, value in _filters.items():
-                if callable(attr):
-                    # E.g. or_, and_, or other sqlalchemy expression
-                    yield attr(*recurse_filters(value))
-                    continue
-                if RELATION_SPLITTER in attr:
-                    parts = attr.rsplit(RELATION_SPLITTER, 1)
-                    entity, attr_name = aliases[parts[0]][0], parts[1]
-                else:
-                    entity, attr_name = root_cls, attr
-                try:
-                    yield from entity.filter_expr(**{attr_name: value})
-                except KeyError as e:
-                    raise KeyError("Incorrect filter path `{}`: {}".format(attr, e))
-
-        elif isinstance(_filters, abc.Sequence):
-            for f in _filters:
-                yield from recurse_filters(f)
-
-    query = query.filter(*recurse_filters(filters))
+    query = query.filter(*_filter_expressions(root_cls, aliases, filters))
 
     for attr in sort_attrs:
+        fn, path = (desc, attr[1:]) if attr.startswith(DESC_PREFIX) \
+            else (asc, attr)
+        if _count_path(root_cls, aliases, path) is not None:
+            query = query.order_by(fn(_path_column(root_cls, aliases, path)))
+            continue
         if RELATION_SPLITTER in attr:
             prefix = ''
             if attr.startswith(DESC_PREFIX):
@@ -197,7 +547,7 @@ def smart_query(query, filters=None, sort_attrs=None, schema=None):
             raise KeyError("Incorrect order path `{}`: {}".format(attr, e))
 
     if schema:
-        query = query.options(*_eager_expr_from_schema(schema))
+        query = query.options(*eager_expr(schema, root_cls))
 
     return query
 
@@ -205,50 +555,150 @@ def smart_query(query, filters=None, sort_attrs=None, schema=None):
 class SmartQueryMixin(InspectionMixin, EagerLoadMixin):
     __abstract__ = True
 
+    # result cache of *_cached() methods, see set_cache()
+    _cache = None
+
     _operators = {
-        'isnull': lambda c, v: (c == None) if v else (c != None),
-        'exact': operators.eq,
-        'ne': operators.ne,  # not equal or is not (for None)
-
-        'gt': operators.gt,  # greater than , >
-        'ge': operators.ge,  # greater than or equal, >=
-        'lt': operators.lt,  # lower than, <
-        'le': operators.le,  # lower than or equal, <=
-
-        'in': operators.in_op,
-        'notin': operators.notin_op,
-        'between': lambda c, v: c.between(v[0], v[1]),
-
-        'like': operators.like_op,
-        'ilike': operators.ilike_op,
-        'startswith': operators.startswith_op,
-        'istartswith': lambda c, v: c.ilike(v + '%'),
-        'endswith': operators.endswith_op,
-        'iendswith': lambda c, v: c.ilike('%' + v),
-        'contains': lambda c, v: c.ilike('%{v}%'.format(v=v)),
-
-        'year': lambda c, v: extract('year', c) == v,
-        'year_ne': lambda c, v: extract('year', c) != v,
-        'year_gt': lambda c, v: extract('year', c) > v,
-        'year_ge': lambda c, v: extract('year', c) >= v,
-        'year_lt': lambda c, v: extract('year', c) < v,
-        'year_le': lambda c, v: extract('year', c) <= v,
-
-        'month': lambda c, v: extract('month', c) == v,
-        'month_ne': lambda c, v: extract('month', c) != v,
-        'month_gt': lambda c, v: extract('month', c) > v,
-        'month_ge': lambda c, v: extract('month', c) >= v,
-        'month_lt': lambda c, v: extract('month', c) < v,
-        'month_le': lambda c, v: extract('month', c) <= v,
-
-        'day': lambda c, v: extract('day', c) == v,
-        'day_ne': lambda c, v: extract('day', c) != v,
-        'day_gt': lambda c, v: extract('day', c) > v,
-        'day_ge': lambda c, v: extract('day', c) >= v,
-        'day_lt': lambda c, v: extract('day', c) < v,
-        'day_le': lambda c, v: extract('day', c) <= v,
+        'isnull': Operator(lambda c, v: (c == None) if v else (c != None)),
+        'exact': Operator(operators.eq),
+        'ne': Operator(operators.ne),  # not equal or is not (for None)
+
+        'gt': Operator(operators.gt),  # greater than , >
+        'ge': Operator(operators.ge),  # greater than or equal, >=
+        'lt': Operator(operators.lt),  # lower than, <
+        'le': Operator(operators.le),  # lower than or equal, <=
+
+        'in': Operator(_in_op),
+        'notin': Operator(_notin_op),
+        'between': Operator(lambda c, v: c.between(v[0], v[1])),
+
+        # patterns starting with a wildcard can't use an index
+        'like': Operator(operators.like_op, _is_prefix_pattern),
+        'ilike': Operator(_ilike_op, _is_prefix_pattern),
+        'startswith': Operator(operators.startswith_op,
+                               _is_prefix_pattern),
+        'istartswith': Operator(lambda c, v: _ilike_op(c, v + '%'),
+                                _is_prefix_pattern),
+        'endswith': Operator(operators.endswith_op, False),
+        'iendswith': Operator(lambda c, v: _ilike_op(c, '%' + v), False),
+        'contains': Operator(
+            lambda c, v: _ilike_op(c, '%{v}%'.format(v=v)), False),
+
+        # full-text search, see fulltext_index()
+        'search': Operator(search_op),
+        'match': Operator(match_op),
+
+        # year filters are ranges on the column itself
+        'year': Operator(_year_op),
+        'year_ne': Operator(_year_ne_op),
+        'year_gt': Operator(_year_gt_op),
+        'year_ge': Operator(lambda c, v: c >= _year_range(c, v)[0]),
+        'year_lt': Operator(lambda c, v: c < _year_range(c, v)[0]),
+        'year_le': Operator(_year_le_op),
+
+        # month and day aren't ranges, so they need EXTRACT
+        'month': Operator(lambda c, v: extract('month', c) == v, False),
+        'month_ne': Operator(lambda c, v: extract('month', c) != v, False),
+        'month_gt': Operator(lambda c, v: extract('month', c) > v, False),
+        'month_ge': Operator(lambda c, v: extract('month', c) >= v, False),
+        'month_lt': Operator(lambda c, v: extract('month', c) < v, False),
+        'month_le': Operator(lambda c, v: extract('month', c) <= v, False),
+
+        'day': Operator(lambda c, v: extract('day', c) == v, False),
+        'day_ne': Operator(lambda c, v: extract('day', c) != v, False),
+        'day_gt': Operator(lambda c, v: extract('day', c) > v, False),
+        'day_ge': Operator(lambda c, v: extract('day', c) >= v, False),
+        'day_lt': Operator(lambda c, v: extract('day', c) < v, False),
+        'day_le': Operator(lambda c, v: extract('day', c) <= v, False),
     }
 
+    @classmethod
+    def register_operator(cls, name, fn=None, index_friendly=True):
+        """
+        Adds filter operator to this model and its subclasses
+        (other models are not affected).
+
+        Example 1:
+            Post.register_operator('len_gt',
+                                   lambda c, v: func.length(c) > v,
+                                   index_friendly=False)
+            Post.where(body__len_gt=100)
+
+        Example 2 (as decorator):
+            @Post.register_operator('ieq')
+            def ieq(column, value):
+                return func.lower(column) == func.lower(value)
+
+        :param fn: callable (column, value) -> expression or Operator
+        :param index_friendly: bool or callable (value) -> bool,
+         see Operator
+        """
+        if OPERATOR_SPLITTER in name:
+            raise ValueError('Operator name `{}` can\'t contain `{}`'
+                             .format(name, OPERATOR_SPLITTER))
+
+        def register(fn):
+            # copy on write: don't change operators of parent classes
+            if '_operators' not in cls.__dict__:
+                cls._operators = dict(cls._operators)
+            cls._operators[name] = fn if isinstance(fn, Operator) \
+                else Operator(fn, index_friendly)
+            return fn
+
+        if fn is None:
+            return register
+        register(fn)
+
+    @classmethod
+    def fulltext_index(cls, *columns, **kwargs):
+        """
+        Declares full-text index on text columns, which enables
+        `search` (plain text) and `match` (raw dialect syntax) operators:
+            Post.fulltext_index('title', 'body')
+            Post.where(body__search='sqlalchemy mixins')
+
+        Index is created with the table (metadata.create_all()).
+        On SQLite it's FTS5 table `<table>_fts` kept in sync by triggers,
+        on PostgreSQL it's GIN index on to_tsvector(config, column),
+        on MySQL it's FULLTEXT index.
+
+        :param columns: column names
+        :param config: PostgreSQL text search configuration,
+         'english' by default
+        """
+        fulltext_index(cls, *columns, **kwargs)
+
+    @classmethod
+    def lint_filters(cls, filters):
+        """
+        Returns filter keys which can't use an index on the filtered column,
+        like `body__contains` or `created_at__month`, e.g.
+            Post.lint_filters({'user___name__contains': 'Bi', 'rating': 5})
+            # ['user___name__contains']
+
+        Hybrid methods are not checked because their SQL is unknown.
+
+        :param filters: dict|list, same as in smart_query
+        """
+        slow = []
+        for key, value in _flatten_filter_items(filters):
+            path, _, attr = key.rpartition(RELATION_SPLITTER)
+            edges = resolve_path(cls, path, RELATION_SPLITTER)
+            entity = edges[-1].mapper.class_ if edges else cls
+
+            if attr in entity.hybrid_methods \
+                    or OPERATOR_SPLITTER not in attr:
+                continue
+            op_name = attr.rsplit(OPERATOR_SPLITTER, 1)[1]
+            if op_name not in entity._operators:
+                raise KeyError('Expression `{}` has incorrect '
+                               'operator `{}`'.format(key, op_name))
+            op = entity._operators[op_name]
+            # operators can also be plain functions
+            if isinstance(op, Operator) and not op.is_index_friendly(value):
+                slow.append(key)
+        return slow
+
     @classproperty
     def filterable_attributes(cls):
         return cls.relations + cls.columns + \
@@ -392,7 +842,141 @@ class SmartQueryMixin(InspectionMixin, EagerLoadMixin):
         :param sort_attrs: List[basestring]
         :param schema: dict
         """
-        return smart_query(cls.query, filters, sort_attrs, schema)
+        return tag(smart_query(cls.query, filters, sort_attrs, schema),
+                   cls, 'smart_query', filters)
+
+    @classmethod
+    def aggregate(cls, filters=None, group_by=None, metrics=None,
+                  sort_attrs=None, as_columns=False):
+        """
+        Groups and aggregates in one SQL statement, with Django-ish joins:
+            Post.aggregate(group_by=['user___name'],
+                           metrics={'n': 'count',
+                                    'max_rating': ('max', 'rating')},
+                           sort_attrs=['-n'])
+            # [{'user___name': 'Bob', 'n': 2, 'max_rating': 5}, ...]
+
+        :param as_columns: return dict of lists instead of list of dicts
+        :see: aggregate_expr() for other params
+        """
+        stmt = aggregate_expr(cls, filters, group_by, metrics, sort_attrs)
+        stmt = tag(stmt, cls, 'aggregate', filters)
+        return aggregate_result(cls.session.execute(stmt), as_columns)
+
+    @classmethod
+    def parallel_scan(cls, fn, filters=None, workers=4, mode=_scan.THREAD,
+                      batch_size=1000, shards=None, method=_scan.MINMAX,
+                      checkpoint=None, progress=None, schema=None,
+                      engine=None, engine_factory=None):
+        """
+        Calls fn(batch) for objects matching filters, reading primary key
+        ranges (shards) in parallel, each on its own connection.
+        Returns list of fn results in primary key order:
+            def backfill(users):
+                ...
+
+            User.parallel_scan(backfill, {'email__isnull': True},
+                               workers=8, checkpoint='backfill.json',
+                               progress=print)
+
+        Scan with the same checkpoint file continues where it stopped
+        and returns results of the rest only, so fn of resumable scans
+        should store its results itself.
+
+        :see: sqlalchemy_mixins.scan.parallel_scan
+        """
+        return _scan.parallel_scan(cls, fn, filters, workers, mode,
+                                   batch_size, shards, method, checkpoint,
+                                   progress, schema, engine, engine_factory)
+
+    @classmethod
+    def validate_spec(cls, spec, max_limit=None):
+        """
+        Problems of JSON query spec (see sqlalchemy_mixins.spec),
+        empty list if it's valid
+        """
+        return _spec.validate_spec(cls, spec, max_limit)
+
+    @classmethod
+    def compile_spec(cls, spec, max_limit=None):
+        """
+        JSON query spec compiled to reusable (and picklable) form:
+            compiled = Post.compile_spec({
+                'filters': {'$or': {'rating__gt': 3, 'user___name': 'Bob'}},
+                'sort': ['-rating'], 'schema': {'user': 'joined'},
+                'limit': 20})
+            posts, next_cursor = compiled.page(cursor)
+
+        Raises SpecError (ValueError) if the spec is invalid.
+
+        :rtype: sqlalchemy_mixins.spec.CompiledSpec
+        """
+        return _spec.compile_spec(cls, spec, max_limit)
+
+    @classmethod
+    def query_spec(cls, spec, max_limit=None):
+        """
+        Objects of the page requested by JSON query spec and
+        cursor of the next page (None if it's the last one)
+
+        :see: compile_spec()
+        """
+        return cls.compile_spec(spec, max_limit).page(spec.get('cursor'))
+
+    @classmethod
+    def set_cache(cls, cache):
+        """
+        Enables result cache of smart_query_cached() and where_cached()
+        for this model and its subclasses. Cached results are invalidated
+        when their tables are changed by any session: on flush, bulk
+        UPDATE/DELETE and commit/rollback.
+
+        Example:
+            BaseModel.set_cache(MemoryCache(maxsize=1000, ttl=60))
+            Country.where_cached(code='US')
+
+        :type cache: sqlalchemy_mixins.cache.Cache | None
+        """
+        cls._cache = cache
+        if cache is not None:
+            _cache.register(cache)
+
+    @classmethod
+    def smart_query_cached(cls, filters=None, sort_attrs=None, schema=None,
+                           ttl=None):
+        """
+        Cached list of smart_query() results. Objects are merged into
+        the session without SQL. Without cache (see set_cache()),
+        it just loads them.
+
+        :param ttl: seconds to keep the result (default is cache ttl)
+        """
+        cache = cls._cache
+        if cache is None:
+            return cls.smart_query(filters, sort_attrs, schema).all()
+
+        session = cls.session
+        if session.autoflush:
+            # as the query would do, so pending changes invalidate cache
+            session.flush()
+        key = _cache.query_key(cls, filters, sort_attrs, schema)
+        rows = _cache.load(cache, key, session)
+        if rows is None:
+            query = cls.smart_query(filters, sort_attrs, schema)
+            snapshot = _cache.generations(
+                cache, _cache.statement_tables(query.statement))
+            rows = query.all()
+            _cache.save(cache, key, rows, snapshot, session, ttl)
+        return rows
+
+    @classmethod
+    def where_cached(cls, **filters):
+        """
+        Cached list of where() results
+
+        :see: smart_query_cached()
+        """
+        return cls.smart_query_cached(filters)
 
     @classmethod
     def where(cls, **filters):
@@ -408,7 +992,7 @@ class SmartQueryMixin(InspectionMixin, EagerLoadMixin):
         Example 3 (with joins):
           Post.where(public=True, user___name__startswith='Bi').all()
         """
-        return cls.smart_query(filters)
+        return tag(cls.smart_query(filters), cls, 'where', filters)
 
     @classmethod
     def sort(cls, *columns):
@@ -429,4 +1013,4 @@ class SmartQueryMixin(InspectionMixin, EagerLoadMixin):
         Exanple 3 (with joins):
             Post.sort('comments___rating', 'user___name').all()
         """
-        return cls.smart_query({}, columns)
+        return tag(cls.smart_query({}, columns), cls, 'sort')
@@ -1,5 +1,6 @@
 import sys
-from typing import Union, Type, List, Optional, Iterable, Dict, Any, TypeVar
+from typing import Union, Type, List, Optional, Iterable, Dict, Any, \
+    TypeVar, Callable, Tuple
 
 if sys.version_info > (3, 6):
     from typing import OrderedDict
@@ -7,14 +8,34 @@ else:
     OrderedDict = TypeVar('OrderedDict', bound=Any)
 
 
+from sqlalchemy.engine import Result
 from sqlalchemy.orm import Query
+from sqlalchemy.sql import Select
 from sqlalchemy.orm.util import AliasedClass
 
+from sqlalchemy_mixins.cache import Cache
 from sqlalchemy_mixins.eagerload import EagerLoadMixin
 from sqlalchemy_mixins.inspection import InspectionMixin
+from sqlalchemy_mixins.scan import Checkpoint, ScanProgress
+from sqlalchemy_mixins.spec import CompiledSpec
 from sqlalchemy_mixins.utils import classproperty
 
 
+class Operator:
+    fn: Callable[[Any, Any], Any]
+    index_friendly: Union[bool, Callable[[Any], bool]]
+
+    def __init__(
+            self,
+            fn: Callable[[Any, Any], Any],
+            index_friendly: Union[bool, Callable[[Any], bool]] = True
+    ) -> None: ...
+
+    def __call__(self, column: Any, value: Any) -> Any: ...
+
+    def is_index_friendly(self, value: Any) -> bool: ...
+
+
 def _parse_path_and_make_aliases(
         entity: Union[Type[InspectionMixin], AliasedClass],
         entity_path: str,
@@ -25,15 +46,45 @@ def _parse_path_and_make_aliases(
 
 def _get_root_cls(query: Query) -> Type[InspectionMixin]: ...
 
+def aggregate_expr(
+        root_cls: Type[InspectionMixin],
+        filters: Optional[Union[dict, list]] = None,
+        group_by: Optional[Iterable[str]] = None,
+        metrics: Optional[Dict[str, Any]] = None,
+        sort_attrs: Optional[Iterable[str]] = None
+) -> Select: ...
+
+
+def aggregate_result(
+        result: Result,
+        as_columns: bool = False
+) -> Union[List[Dict[str, Any]], Dict[str, List[Any]]]: ...
+
+
 def smart_query(
         query: Query,
         filters: Optional[Dict[str, Any]] = None,
         sort_attrs: Optional[Iterable[str]] = None,
-        schema: Optional[dict] = None
+        schema: Optional[Union[dict, str]] = None
 ) -> Query: ...
 
 
 class SmartQueryMixin(InspectionMixin, EagerLoadMixin):
+    _operators: Dict[str, Operator]
+
+    @classmethod
+    def register_operator(
+            cls,
+            name: str,
+            fn: Optional[Union[Callable[[Any, Any], Any], Operator]] = None,
+            index_friendly: Union[bool, Callable[[Any], bool]] = True
+    ) -> Optional[Callable]: ...
+
+    @classmethod
+    def fulltext_index(cls, *columns: str, config: str = ...) -> None: ...
+
+    @classmethod
+    def lint_filters(cls, filters: Union[dict, list]) -> List[str]: ...
 
     @classproperty
     def filterable_attributes(cls) -> List[str]: ...
@@ -52,9 +103,66 @@ class SmartQueryMixin(InspectionMixin, EagerLoadMixin):
             cls,
             filters: Optional[Dict[str, Any]] = None,
             sort_attrs: Optional[Iterable[str]] = None,
-            schema: Optional[dict] = None
+            schema: Optional[Union[dict, str]] = None
     ) -> Query: ...
 
+    @classmethod
+    def aggregate(
+            cls,
+            filters: Optional[Union[dict, list]] = None,
+            group_by: Optional[Iterable[str]] = None,
+            metrics: Optional[Dict[str, Any]] = None,
+            sort_attrs: Optional[Iterable[str]] = None,
+            as_columns: bool = False
+    ) -> Union[List[Dict[str, Any]], Dict[str, List[Any]]]: ...
+
+    @classmethod
+    def parallel_scan(
+            cls,
+            fn: Callable[[List[Any]], Any],
+            filters: Optional[Union[dict, list]] = None,
+            workers: int = 4,
+            mode: str = 'thread',
+            batch_size: int = 1000,
+            shards: Optional[int] = None,
+            method: str = 'minmax',
+            checkpoint: Optional[Union[Checkpoint, str]] = None,
+            progress: Optional[Callable[[ScanProgress], Any]] = None,
+            schema: Optional[Union[dict, str]] = None,
+            engine: Optional[Any] = None,
+            engine_factory: Optional[Callable[[], Any]] = None
+    ) -> List[Any]: ...
+
+    @classmethod
+    def validate_spec(cls, spec: Dict[str, Any],
+                      max_limit: Optional[int] = None) -> List[str]: ...
+
+    @classmethod
+    def compile_spec(cls, spec: Dict[str, Any],
+                     max_limit: Optional[int] = None) -> CompiledSpec: ...
+
+    @classmethod
+    def query_spec(
+            cls,
+            spec: Dict[str, Any],
+            max_limit: Optional[int] = None
+    ) -> Tuple[List[Any], Optional[str]]: ...
+
+    @classmethod
+    def set_cache(cls, cache: Optional[Cache]) -> None: ...
+
+    @classmethod
+    def smart_query_cached(
+            cls,
+            filters: Optional[Dict[str, Any]] = None,
+            sort_attrs: Optional[Iterable[str]] = None,
+            schema: Optional[Union[dict, str]] = None,
+            ttl: Optional[float] = None
+    ) -> List[Any]: ...
+
+    @classmethod
+    def where_cached(cls, **filters: Any) -> List[Any]: ...
+
     @classmethod
     def where(cls, **filters: Any) -> Query: ...
 
@@ -0,0 +1,384 @@
+"""
+JSON-serializable query spec for smart_query(), e.g. from HTTP params:
+    {
+        "filters": {"rating__gt": 1,
+                    "$or": {"user___name": "Bob", "id__in": [1, 2]}},
+        "sort": ["-rating", "user___name"],
+        "schema": {"user": "joined", "comments": ["selectin", {"user": "joined"}]},
+        "limit": 20,
+        "cursor": "eyJvIjogMjB9"
+    }
+"""
+import base64
+import binascii
+import json
+from collections import abc
+
+from sqlalchemy import and_, or_, not_
+
+from .counts import is_count_path, declared_counts
+from .eagerload import async_schema, JOINED, SUBQUERY, SELECTIN, RAISE, NOLOAD, \
+    IMMEDIATE, LAZY, RAISE_ON_SQL, DEFAULT, COLUMNS, DEFERRED, COUNTS
+from .normalize import RELATION_SPLITTER, OPERATOR_SPLITTER, \
+    normalize_filters
+from .utils import LRUCache, relation_graph, resolve_path
+
+# spec keys, and filter group keys replaced with sqlalchemy functions
+SPEC_KEYS = ('filters', 'sort', 'schema', 'limit', 'cursor')
+GROUPS = {'$and': and_, '$or': or_, '$not': not_}
+DESC_PREFIX = '-'
+# operators and lengths of list values they need (None: any length)
+LIST_OPERATORS = {'in': None, 'notin': None, 'between': 2}
+# operators and types of scalar values they need
+SCALAR_OPERATORS = dict(
+    [('isnull', bool)] +
+    [(op, str) for op in ('like', 'ilike', 'startswith', 'istartswith',
+                          'endswith', 'iendswith', 'contains', 'search',
+                          'match')] +
+    [(part + suffix, int) for part in ('year', 'month', 'day')
+     for suffix in ('', '_ne', '_gt', '_ge', '_lt', '_le')])
+LOADERS = (JOINED, SUBQUERY, SELECTIN, RAISE, NOLOAD, IMMEDIATE, LAZY,
+           RAISE_ON_SQL)
+
+# compiled specs by model and spec (without cursor)
+_compiled_specs = LRUCache(maxsize=1024)
+
+
+class SpecError(ValueError):
+    """Invalid query spec. `errors` lists all problems found"""
+
+    def __init__(self, errors):
+        super().__init__('Invalid query spec: ' + '; '.join(errors))
+        self.errors = errors
+
+
+def encode_cursor(offset):
+    data = json.dumps({'o': offset}).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Offset of cursor made by encode_cursor(). Raises ValueError"""
+    if cursor is None:
+        return 0
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        offset = offset['o']
+    except (AttributeError, binascii.Error, UnicodeError, KeyError,
+            TypeError, ValueError):
+        raise ValueError('Bad cursor `{}`'.format(cursor))
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Bad cursor `{}`'.format(cursor))
+    return offset
+
+
+def _resolve_path(cls, path, errors, where):
+    """Class at the end of relation path like 'post___user', or None"""
+    try:
+        edges = resolve_path(cls, path, RELATION_SPLITTER)
+    except KeyError as e:
+        errors.append('{}: {}'.format(where, e.args[0]))
+        return None
+    return edges[-1].mapper.class_ if edges else cls
+
+
+def _validate_filter_value(key, op, value, errors):
+    if op in SCALAR_OPERATORS:
+        # exact type, as bool is int too
+        if type(value) is not SCALAR_OPERATORS[op]:
+            errors.append('filter `{}`: should be {}, not {!r}'.format(
+                key, SCALAR_OPERATORS[op].__name__, value))
+        return
+    if op not in LIST_OPERATORS:
+        return
+    length = LIST_OPERATORS[op]
+    if not isinstance(value, list) or \
+            (length is not None and len(value) != length):
+        errors.append('filter `{}`: should be list{}, not {!r}'.format(
+            key, ' of {} items'.format(length) if length else '', value))
+
+
+def _validate_filter_key(cls, key, value, errors):
+    where = 'filter `{}`'.format(key)
+    path, _, attr = key.rpartition(RELATION_SPLITTER)
+    name, _, op = attr.rpartition(OPERATOR_SPLITTER)
+    if not name:
+        name, op = attr, None
+    _validate_filter_value(key, op, value, errors)
+
+    target = cls
+    if path:
+        owner_path, _, relation = path.rpartition(RELATION_SPLITTER)
+        owner = _resolve_path(cls, owner_path, errors, where)
+        if owner is None:
+            return
+        if is_count_path(owner, relation, attr):
+            # count of related objects like 'comments___count__gt',
+            # compared by root class operators
+            target = None
+        else:
+            target = _resolve_path(owner, relation, errors, where)
+            if target is None:
+                return
+    if target is not None and attr in getattr(target, 'hybrid_methods', []):
+        return
+    if op is not None and op not in (target or cls)._operators:
+        errors.append('{}: unknown operator `{}`'.format(where, op))
+    if target is not None and name not in target.filterable_attributes:
+        errors.append('{}: {} doesnt have filterable attribute `{}`'
+                      .format(where, target.__name__, name))
+
+
+def _convert_filters(cls, filters, errors):
+    """JSON filters to smart_query() filters (with validation)"""
+    if isinstance(filters, abc.Mapping):
+        result = {}
+        for key, value in filters.items():
+            if not isinstance(key, str):
+                errors.append('filter key {!r} is not a string'.format(key))
+            elif key.startswith('$'):
+                if key not in GROUPS:
+                    errors.append('unknown filter group `{}`'.format(key))
+                    continue
+                value = _convert_filters(cls, value, errors)
+                if GROUPS[key] is not_:
+                    # not_() takes one clause, so children are joined
+                    value = {and_: value}
+                result[GROUPS[key]] = value
+            else:
+                _validate_filter_key(cls, key, value, errors)
+                result[key] = value
+        return result
+    if isinstance(filters, list):
+        return [_convert_filters(cls, f, errors) for f in filters]
+    errors.append('filters should be object or list, not {!r}'
+                  .format(filters))
+    return {}
+
+
+def _convert_sort(cls, sort, errors):
+    if not isinstance(sort, list) or \
+            not all(isinstance(attr, str) for attr in sort):
+        errors.append('sort should be list of strings, not {!r}'
+                      .format(sort))
+        return []
+    for attr in sort:
+        where = 'sort `{}`'.format(attr)
+        path, _, name = attr.lstrip(DESC_PREFIX).rpartition(RELATION_SPLITTER)
+        if path:
+            owner_path, _, relation = path.rpartition(RELATION_SPLITTER)
+            owner = _resolve_path(cls, owner_path, errors, where)
+            if owner is None or is_count_path(owner, relation, name):
+                continue
+            target = _resolve_path(owner, relation, errors, where)
+        else:
+            target = cls
+        if target is not None and name not in target.sortable_attributes:
+            errors.append('{}: {} doesnt have sortable attribute `{}`'
+                          .format(where, target.__name__, name))
+    return list(sort)
+
+
+def _convert_schema(cls, schema, errors):
+    """JSON schema to eager load schema (see EagerLoadMixin.with_())"""
+    if not isinstance(schema, abc.Mapping):
+        errors.append('schema should be object, not {!r}'.format(schema))
+        return {}
+    result = {}
+    for key, value in schema.items():
+        where = 'schema `{}`'.format(key)
+        if key in (COLUMNS, DEFERRED, COUNTS):
+            names = declared_counts(cls) if key == COUNTS else cls.columns
+            if not isinstance(value, list) or \
+                    not all(name in names for name in value):
+                errors.append('{}: should be list of {} of {}, not {!r}'
+                              .format(where, 'declared counts' if key == COUNTS
+                                      else 'columns', cls.__name__, value))
+            result[key] = value
+            continue
+        if key == DEFAULT:
+            target = None
+        else:
+            target = _resolve_path(cls, key, errors, where)
+            if target is None:
+                continue
+        if isinstance(value, list) and len(value) == 2 and target is not None:
+            loader, inner = value
+            value = (loader, _convert_schema(target, inner, errors))
+        elif isinstance(value, abc.Mapping) and target is not None:
+            loader, value = JOINED, _convert_schema(target, value, errors)
+        else:
+            loader = value
+        if loader not in LOADERS:
+            errors.append('{}: unknown loading strategy {!r}'
+                          .format(where, loader))
+        result[key] = value
+    return result
+
+
+def _bind_schema(cls, schema):
+    """Schema with relation names replaced by class attributes,
+    as loader options need them"""
+    result = {}
+    for key, value in schema.items():
+        if key in (COLUMNS, DEFERRED, COUNTS, DEFAULT):
+            result[key] = value
+            continue
+        target = relation_graph(cls)[key].mapper.class_
+        if isinstance(value, tuple):
+            value = (value[0], _bind_schema(target, value[1]))
+        elif isinstance(value, abc.Mapping):
+            value = _bind_schema(target, value)
+        result[getattr(cls, key)] = value
+    return result
+
+
+def _convert_limit(limit, max_limit, errors):
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1 \
+            or max_limit is not None and limit > max_limit:
+        errors.append('limit should be integer from 1 to {}, not {!r}'
+                      .format(max_limit or 'infinity', limit))
+        return None
+    return limit
+
+
+def _compile(cls, spec, max_limit):
+    errors = []
+    if not isinstance(spec, abc.Mapping):
+        raise SpecError(['spec should be object, not {!r}'.format(spec)])
+    for key in spec:
+        if key not in SPEC_KEYS:
+            errors.append('unknown key `{}`'.format(key))
+    filters = _convert_filters(cls, spec.get('filters') or {}, errors)
+    sort = _convert_sort(cls, spec.get('sort') or [], errors)
+    schema = _convert_schema(cls, spec['schema'], errors) \
+        if spec.get('schema') else None
+    limit = _convert_limit(spec['limit'], max_limit, errors) \
+        if spec.get('limit') is not None else None
+    if spec.get('cursor') is not None:
+        try:
+            decode_cursor(spec['cursor'])
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        raise SpecError(errors)
+    return CompiledSpec(cls, normalize_filters(filters), sort, schema, limit)
+
+
+def validate_spec(cls, spec, max_limit=None):
+    """
+    Problems of the spec as list of messages (empty if it's valid):
+    unknown keys, relations, attributes (see filterable_attributes and
+    sortable_attributes), operators and loading strategies, bad limit
+    and cursor
+    """
+    try:
+        _compile(cls, spec, max_limit)
+    except SpecError as e:
+        return e.errors
+    return []
+
+
+def compile_spec(cls, spec, max_limit=None):
+    """
+    Validated spec compiled to smart_query() arguments. Compiled specs
+    are cached by spec (cursor is applied later, so all pages share one).
+    Raises SpecError if the spec is invalid.
+
+    :rtype: CompiledSpec
+    """
+    try:
+        key = (cls, max_limit, json.dumps(
+            {k: v for k, v in spec.items() if k != 'cursor'},
+            sort_keys=True))
+    except (AttributeError, TypeError, ValueError):  # not JSON
+        return _compile(cls, spec, max_limit)
+    compiled = _compiled_specs.get(key)
+    if compiled is None:
+        compiled = _compile(cls, spec, max_limit)
+        _compiled_specs.set(key, compiled)
+    return compiled
+
+
+class CompiledSpec(object):
+    """
+    Query spec compiled to smart_query() arguments.
+    It's picklable, so it can be compiled once and sent to workers.
+    """
+
+    def __init__(self, model, filters, sort_attrs, schema, limit):
+        self.model = model
+        self.filters = filters
+        self.sort_attrs = sort_attrs
+        # with relation names (picklable), see eager_schema
+        self.schema = schema
+        self.limit = limit
+        self._eager_schema = None
+        if limit is not None:
+            # pages need deterministic order
+            keys = [attr.lstrip(DESC_PREFIX) for attr in sort_attrs]
+            self.sort_attrs = sort_attrs + [pk for pk in model.primary_keys
+                                            if pk not in keys]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # class attributes can't be pickled
+        state['_eager_schema'] = None
+        return state
+
+    @property
+    def eager_schema(self):
+        """Schema for smart_query() (with class attributes)"""
+        if self._eager_schema is None and self.schema:
+            self._eager_schema = _bind_schema(self.model, self.schema)
+        return self._eager_schema
+
+    def query(self, cursor=None, limit=None):
+        """
+        smart_query() of the spec with limit and offset of the cursor
+
+        :param limit: overrides limit of the spec
+        """
+        return self._query(cursor, limit, self.eager_schema)
+
+    def _query(self, cursor, limit, schema):
+        query = self.model.smart_query(self.filters, self.sort_attrs, schema)
+        limit = limit or self.limit
+        offset = decode_cursor(cursor)
+        if limit is not None:
+            query = query.limit(limit)
+        if offset:
+            query = query.offset(offset)
+        return query
+
+    def page(self, cursor=None):
+        """
+        Objects of the page and cursor of the next page
+        (None if it's the last one)
+        """
+        if self.limit is None:
+            return self.query(cursor).all(), None
+        rows = self.query(cursor, self.limit + 1).all()
+        return self._page(rows, cursor)
+
+    async def page_async(self, cursor=None):
+        """
+        Async version of page() (for ActiveRecordMixinAsync), with
+        async-safe schema like select_async() uses
+        """
+        limit = None if self.limit is None else self.limit + 1
+        schema = async_schema(self.eager_schema or {}, self.model)
+        rows = (await self.model.select_async(
+            self._query(cursor, limit, schema))).all()
+        return self._page(rows, cursor)
+
+    def _page(self, rows, cursor):
+        if self.limit is None or len(rows) <= self.limit:
+            return rows, None
+        return rows[:self.limit], encode_cursor(decode_cursor(cursor)
+                                                + self.limit)
+
+    def __repr__(self):
+        return ('<CompiledSpec {} filters:{!r} sort:{!r} limit:{}>'
+                .format(self.model.__name__, self.filters, self.sort_attrs,
+                        self.limit))
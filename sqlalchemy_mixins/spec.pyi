@@ -0,0 +1,58 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from sqlalchemy.orm import Query
+
+from sqlalchemy_mixins.utils import LRUCache
+
+SPEC_KEYS: Tuple[str, ...]
+GROUPS: Dict[str, Callable]
+DESC_PREFIX: str
+LIST_OPERATORS: Dict[str, Optional[int]]
+SCALAR_OPERATORS: Dict[str, type]
+LOADERS: Tuple[str, ...]
+
+_compiled_specs: LRUCache
+
+
+class SpecError(ValueError):
+    errors: List[str]
+
+    def __init__(self, errors: List[str]) -> None: ...
+
+
+def encode_cursor(offset: int) -> str: ...
+
+def decode_cursor(cursor: Optional[str]) -> int: ...
+
+def validate_spec(cls: Type[Any], spec: Dict[str, Any],
+                  max_limit: Optional[int] = None) -> List[str]: ...
+
+def compile_spec(cls: Type[Any], spec: Dict[str, Any],
+                 max_limit: Optional[int] = None) -> CompiledSpec: ...
+
+
+class CompiledSpec:
+    model: Type[Any]
+    filters: Union[Dict[Any, Any], List[Dict[Any, Any]]]
+    sort_attrs: List[str]
+    schema: Optional[Dict[str, Any]]
+    limit: Optional[int]
+
+    def __init__(self,
+                 model: Type[Any],
+                 filters: Union[Dict[Any, Any], List[Dict[Any, Any]]],
+                 sort_attrs: List[str],
+                 schema: Optional[Dict[str, Any]],
+                 limit: Optional[int]) -> None: ...
+
+    @property
+    def eager_schema(self) -> Optional[Dict[Any, Any]]: ...
+
+    def query(self, cursor: Optional[str] = None,
+              limit: Optional[int] = None) -> Query: ...
+
+    def page(self, cursor: Optional[str] = None
+             ) -> Tuple[List[Any], Optional[str]]: ...
+
+    async def page_async(self, cursor: Optional[str] = None
+                         ) -> Tuple[List[Any], Optional[str]]: ...
@@ -8,6 +8,7 @@ from sqlalchemy.orm import Query, Session, DeclarativeBase, declarative_base
 
 from sqlalchemy_mixins import ActiveRecordMixin
 from sqlalchemy_mixins.activerecord import ModelNotFoundError
+from sqlalchemy_mixins.utils import classproperty
 
 class Base(DeclarativeBase):
     __abstract__ = True
@@ -207,6 +208,69 @@ class TestActiveRecord(unittest.TestCase):
         with self.assertRaises(KeyError):
             User.create(INCORRECT_ATTRUBUTE='nomatter')
 
+    def test_fill_checks_all_attributes_first(self):
+        u1 = User(name='Bill u1')
+        with self.assertRaises(KeyError) as e:
+            u1.fill(name='Bob', INCORRECT_ATTRUBUTE='nomatter')
+        self.assertIn('INCORRECT_ATTRUBUTE', str(e.exception))
+        self.assertEqual(u1.name, 'Bill u1')
+
+    def test_fill_many(self):
+        u1 = User.create(name='Bill u1')
+        posts = Post.fill_many(
+            (Post() for _ in range(3)),
+            [{'body': 'p1', 'user': u1}, {'body': 'p2', 'public': False},
+             {}])
+        self.assertEqual([(p.body, p.user, p.archived) for p in posts],
+                         [('p1', u1, None), ('p2', None, True),
+                          (None, None, None)])
+
+        with self.assertRaises(KeyError):
+            Post.fill_many([Post(), Post()], [{'body': 'p'}, {'nope': 1}])
+        with self.assertRaises(ValueError):
+            Post.fill_many([Post()], [{'body': 'p'}, {'body': 'p'}])
+
+    def test_fill_uses_settable_attributes(self):
+        class OtherBase(DeclarativeBase, ActiveRecordMixin):
+            __abstract__ = True
+
+        class Author(OtherBase):
+            __tablename__ = 'author'
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String)
+
+        class Editor(OtherBase):
+            __tablename__ = 'editor'
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String)
+
+            @classproperty
+            def settable_attributes(cls):
+                return ['name']
+
+        class Book(OtherBase):
+            __tablename__ = 'book'
+            id = sa.Column(sa.Integer, primary_key=True)
+            author_id = sa.Column(sa.Integer, sa.ForeignKey('author.id'))
+
+        # overridden settable_attributes restrict fill()
+        self.assertEqual(Editor().fill(name='Bill').name, 'Bill')
+        with self.assertRaises(KeyError):
+            Editor().fill(id=1)
+        with self.assertRaises(KeyError):
+            Editor.fill_many([Editor()], [{'id': 1}])
+
+        author = Author()
+        with self.assertRaises(KeyError):
+            Book().fill(author=author)
+
+        # setters are rebuilt when properties are added to configured mapper
+        Book.__mapper__.add_property(
+            'author', sa.orm.relationship(Author, backref='books'))
+        book = Book().fill(author=author)
+        self.assertIs(book.author, author)
+        self.assertEqual(author.fill(books=[book]).books, [book])
+
     def test_delete(self):
         u1, u2, p11, p12, p13 = self._seed()
 
@@ -271,6 +335,145 @@ class TestActiveRecord(unittest.TestCase):
             _ = User.find_or_fail(123456789)
 
 
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        sess.rollback()
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        BaseModel.set_session(sess)
+
+        self.commits = 0
+        self.flushes = 0
+
+        def count_commits(session):
+            self.commits += 1
+
+        def count_flushes(session, flush_context):
+            self.flushes += 1
+
+        sa.event.listen(sess, 'after_commit', count_commits)
+        sa.event.listen(sess, 'after_flush', count_flushes)
+        self.addCleanup(sa.event.remove, sess, 'after_commit', count_commits)
+        self.addCleanup(sa.event.remove, sess, 'after_flush', count_flushes)
+
+    def test_batch(self):
+        with User.batch(size=3) as batch:
+            users = [User.create(name='u{}'.format(i)) for i in range(7)]
+            users[0].update(name='changed')
+            Post.create(body='post', user=users[1])
+            users[2].delete()
+            # nothing is committed yet, changes are flushed by 3 calls
+            self.assertEqual(self.commits, 0)
+            self.assertEqual(self.flushes, 3)
+
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(self.flushes, 4)
+        self.assertEqual((batch.operations, batch.flushes, batch.commits),
+                         (10, 4, 1))
+        self.assertEqual(batch.saved_commits, 9)
+        self.assertEqual(batch.saved_flushes, 6)
+
+        sess.rollback()
+        self.assertEqual(sess.query(User).count(), 6)
+        self.assertEqual(sess.query(User).filter_by(name='changed').count(), 1)
+
+        # without batch, commit per call
+        User.create(name='u7')
+        self.assertEqual(self.commits, 2)
+
+    def test_rollback_on_error(self):
+        User.create(name='before')
+        with self.assertRaises(ValueError):
+            with User.batch(size=2):
+                for i in range(5):
+                    User.create(name='u{}'.format(i))
+                raise ValueError()
+        self.assertEqual([u.name for u in sess.query(User).all()], ['before'])
+
+    def test_nested_batch(self):
+        with User.batch() as outer:
+            User.create(name='u1')
+            with Post.batch() as inner:
+                self.assertIs(inner, outer)
+                Post.create(body='p1')
+            self.assertEqual(self.commits, 0)
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(outer.operations, 2)
+
+    def test_other_session_is_not_batched(self):
+        other = Session(engine)
+        with User.batch():
+            with BaseModel.using_session(other):
+                User.create(name='other')
+            self.assertEqual(other.query(User).count(), 1)
+        other.close()
+
+
+# pysqlite doesn't BEGIN before SAVEPOINT, so savepoint tests need
+# SQLAlchemy's workaround, see
+# https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl
+savepoint_engine = create_engine('sqlite:///:memory:', echo=False)
+
+
+@sa.event.listens_for(savepoint_engine, 'connect')
+def do_connect(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@sa.event.listens_for(savepoint_engine, 'begin')
+def do_begin(conn):
+    conn.exec_driver_sql('BEGIN')
+
+
+class TestSavepoint(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.drop_all(savepoint_engine)
+        Base.metadata.create_all(savepoint_engine)
+        self.sess = Session(savepoint_engine)
+        BaseModel.set_session(self.sess)
+
+    def tearDown(self):
+        self.sess.close()
+        BaseModel.set_session(sess)
+
+    def test_rolls_back_only_savepoint(self):
+        User.create(name='before', commit=False)
+        with self.assertRaises(sa.exc.IntegrityError):
+            with User.savepoint():
+                User.create(id=100, name='u100')
+                User.create(id=100, name='duplicate')
+        self.sess.commit()
+        self.assertEqual([u.name for u in self.sess.query(User).all()],
+                         ['before'])
+
+    def test_commit_is_flush_inside_savepoint(self):
+        with User.savepoint():
+            User.create(name='u1')
+            self.assertTrue(self.sess.in_nested_transaction())
+        self.sess.rollback()
+        self.assertEqual(self.sess.query(User).count(), 0)
+
+    def test_savepoints_in_batch(self):
+        errors = []
+        with User.batch(size=2) as batch:
+            for id_ in [1, 2, 1, 3, 2]:
+                with User.savepoint(collect=errors):
+                    User.create(id=id_, name='u{}'.format(id_))
+        self.assertEqual(len(errors), 2)
+        self.assertIsInstance(errors[0], sa.exc.IntegrityError)
+        self.assertEqual(batch.commits, 1)
+
+        self.sess.rollback()
+        users = self.sess.query(User).order_by(User.id).all()
+        self.assertEqual([u.id for u in users], [1, 2, 3])
+
+    def test_collect(self):
+        errors = []
+        with User.savepoint(collect=errors):
+            raise ValueError('bad row')
+        self.assertEqual([str(e) for e in errors], ['bad row'])
+
+
 class TestActiveRecordAlternative(unittest.TestCase):
     def setUp(self):
         sess.rollback()
@@ -9,7 +9,10 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from sqlalchemy_mixins.activerecord import ModelNotFoundError
-from sqlalchemy_mixins import ActiveRecordMixinAsync, SmartQueryMixin
+from sqlalchemy_mixins import ActiveRecordMixinAsync, SmartQueryMixin, \
+    SELECTIN, JOINED, SUBQUERY
+from sqlalchemy_mixins.eagerload import async_schema, DEFAULT, LAZY, \
+    RAISE_ON_SQL
 
 
 Base = declarative_base()
@@ -79,6 +82,14 @@ class TestAsyncActiveRecord(unittest.IsolatedAsyncioTestCase):
                          {'id', 'body', 'post_id', 'user_id',
                           'user', 'post'})
 
+    async def test_fill_many(self):
+        users = User.fill_many([User(), User()], [{'name': 'Bill'},
+                                                  {'id': 5, 'name': 'Bob'}])
+        self.assertEqual([(u.id, u.name) for u in users],
+                         [(None, 'Bill'), (5, 'Bob')])
+        with self.assertRaises(KeyError):
+            User.fill_many([User()], [{'posts_viewonly': []}])
+
     async def test_create_and_save_async(self):
         u1 = User(name='Bill u1')
         await u1.save_async()
@@ -206,5 +217,275 @@ class TestAsyncActiveRecord(unittest.IsolatedAsyncioTestCase):
         with self.assertRaises(ModelNotFoundError):
             await User.find_or_fail_async(3)
 
+    async def test_with_selectin_async(self):
+        u1 = await User.create_async(name='Bill', id=1)
+        await Post.create_async(body='p11', user=u1, id=11)
+
+        posts = (await Post.with_selectin_async(Post.user)).all()
+        self.assertEqual(posts[0].user.name, 'Bill')
+
+    async def test_with_async(self):
+        u1 = await User.create_async(name='Bill', id=1)
+        u2 = await User.create_async(name='Bob', id=2)
+        p11 = await Post.create_async(body='p11', user=u1, id=11)
+        await Post.create_async(body='p21', user=u2, id=21)
+        await Comment.create_async(body='c1', user=u2, post=p11, id=1)
+
+        async with self.async_session() as session:
+            with AsyncBaseModel.using_session(session):
+                users = (await User.with_async(
+                    {User.posts: {Post.comments: SELECTIN}})).all()
+                self.assertEqual(
+                    [c.body for c in users[0].posts[0].comments], ['c1'])
+                # unlisted relationship raises instead of implicit lazy load
+                with self.assertRaises(sa.exc.InvalidRequestError):
+                    users[0].posts_viewonly
+                with self.assertRaises(sa.exc.InvalidRequestError):
+                    users[0].comments
+
+        async with self.async_session() as session:
+            with AsyncBaseModel.using_session(session):
+                posts = (await Post.with_subquery_async(Post.comments)).all()
+                # many-to-one in identity map is loaded without SQL
+                self.assertEqual(posts[0].comments[0].user.name, 'Bob')
+                self.assertEqual(posts[1].user.name, 'Bob')
+                with self.assertRaises(sa.exc.InvalidRequestError):
+                    posts[0].user
+
+        posts = (await Post.with_joined_async(Post.user)).all()
+        self.assertEqual([p.user.name for p in posts], ['Bill', 'Bob'])
+
+    async def test_select_async_schema(self):
+        u1 = await User.create_async(name='Bill', id=1)
+        u2 = await User.create_async(name='Bob', id=2)
+        await Post.create_async(body='p11', user=u1, id=11)
+        await Post.create_async(body='p21', user=u2, id=21)
+
+        posts = (await Post.select_async(
+            filters={'user___name__startswith': 'B'}, sort_attrs=['-id'],
+            schema={Post.user: JOINED})).all()
+        self.assertEqual([(p.id, p.user.name) for p in posts],
+                         [(21, 'Bob'), (11, 'Bill')])
+
+        # DEFAULT key leaves unlisted relationships as is
+        users = (await User.select_async(schema={DEFAULT: LAZY,
+                                                 User.posts: SELECTIN})).all()
+        self.assertEqual(users[0].posts[0].body, 'p11')
+
+    async def test_no_schema_raises_on_lazy_load(self):
+        u1 = await User.create_async(name='Bill', id=1)
+        await Post.create_async(body='p11', user=u1, id=11)
+
+        for load in [User.select_async, lambda: User.with_async({}),
+                     User.all_async, lambda: User.where_async(name='Bill'),
+                     lambda: User.find_async(1)]:
+            async with self.async_session() as session:
+                with AsyncBaseModel.using_session(session):
+                    users = await load()
+                    user = users if isinstance(users, User) else \
+                        list(users)[0]
+                    self.assertEqual(user.posts[0].body, 'p11')
+                    with self.assertRaises(sa.exc.InvalidRequestError):
+                        user.posts_viewonly
+
+    def test_async_schema(self):
+        def names(schema):
+            return {getattr(k, 'key', k): (v[0], names(v[1]))
+                    if isinstance(v, tuple) else v
+                    for k, v in schema.items()}
+
+        self.assertEqual(
+            names(async_schema({User.posts: {Post.comments: SUBQUERY}},
+                               User)),
+            {'posts': (SELECTIN, {'comments': (SELECTIN,
+                                               {'post': RAISE_ON_SQL}),
+                                  'user': RAISE_ON_SQL}),
+             'posts_viewonly': RAISE_ON_SQL,
+             'comments': RAISE_ON_SQL})
+        self.assertEqual(names(async_schema({DEFAULT: LAZY}, User)),
+                         {DEFAULT: LAZY})
+
+    async def test_using_session_async(self):
+        async with self.async_session() as session:
+            with AsyncBaseModel.using_session(session):
+                u1 = await User.create_async(name='Bill', id=1)
+                # the session is not closed by mixin methods
+                self.assertIn(u1, session)
+                self.assertEqual((await User.find_async(1)).name, 'Bill')
+                await u1.update_async(name='Bishop')
+
+        self.assertEqual((await User.find_async(1)).name, 'Bishop')
+
+    async def test_aggregate_async(self):
+        u1 = await User.create_async(name='Bill', id=1)
+        u2 = await User.create_async(name='Bishop', id=2)
+        await Post.create_async(body='p11', user=u1, id=11)
+        await Post.create_async(body='p12', user=u1, id=12)
+        await Post.create_async(body='p21', user=u2, id=21)
+
+        res = await Post.aggregate_async(group_by=['user___name'],
+                                         metrics={'n': 'count'},
+                                         sort_attrs=['-n'])
+        self.assertEqual(res, [{'user___name': 'Bill', 'n': 2},
+                               {'user___name': 'Bishop', 'n': 1}])
+
+        res = await Post.aggregate_async(metrics={'max_id': ('max', 'id')},
+                                         as_columns=True)
+        self.assertEqual(res, {'max_id': [21]})
+
+class TestAsyncStreaming(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine('sqlite+aiosqlite:///:memory:', echo=False)
+        self.async_session = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        AsyncBaseModel.set_session(self.async_session)
+        async with self.async_session() as session:
+            session.add_all([User(id=i, name='u{}'.format(i))
+                             for i in range(1, 8)])
+            session.add(Post(id=1, body='p', user_id=2))
+            await session.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_stream_batches_async(self):
+        batches = [[u.id for u in batch] async for batch in
+                   User.stream_batches_async(sort_attrs=['-id'], size=3)]
+        self.assertEqual(batches, [[7, 6, 5], [4, 3, 2], [1]])
+
+        batches = [batch async for batch in User.stream_batches_async(
+            {'posts___body': 'p'}, schema={User.posts: 'selectin'})]
+        self.assertEqual([[u.name for u in b] for b in batches], [['u2']])
+        self.assertEqual(batches[0][0].posts[0].body, 'p')
+
+        with self.assertRaises(ValueError):
+            async for _ in User.stream_batches_async(size=0):
+                pass
+
+    async def test_stream_in_session(self):
+        async with self.async_session() as session:
+            with AsyncBaseModel.using_session(session):
+                stream = User.stream_batches_async(sort_attrs=['id'], size=5)
+                first = await stream.__anext__()
+                await stream.aclose()
+            # session passed to using_session() is left open
+            self.assertEqual(await session.get(User, 1), first[0])
+
+    async def test_pipe_batches_async(self):
+        received, fetched = [], []
+
+        async def consumer(batch):
+            # slow consumer: besides this batch, only one is queued
+            # (buffer=1) and one is waiting to be queued
+            await asyncio.sleep(0.01)
+            self.assertLessEqual(len(fetched) - len(received), 3)
+            received.append([u.id for u in batch])
+
+        stream = User.stream_batches_async
+
+        async def tracked(*args):
+            async for batch in stream(*args):
+                fetched.append(batch)
+                yield batch
+
+        User.stream_batches_async = tracked
+        try:
+            total = await User.pipe_batches_async(
+                consumer, sort_attrs=['id'], size=2)
+        finally:
+            del User.stream_batches_async
+        self.assertEqual(total, 7)
+        self.assertEqual(received, [[1, 2], [3, 4], [5, 6], [7]])
+
+    async def test_pipe_batches_async_errors(self):
+        async def failing(batch):
+            raise IOError('disk full')
+
+        closed, streams = [], []
+
+        async def batches():
+            try:
+                for i in range(10):
+                    yield [i]
+            finally:
+                closed.append(True)
+
+        def stream(*args):
+            # referenced, so it isn't closed by garbage collection
+            streams.append(batches())
+            return streams[-1]
+
+        User.stream_batches_async = stream
+        try:
+            with self.assertRaises(IOError):
+                await User.pipe_batches_async(failing, size=2)
+        finally:
+            del User.stream_batches_async
+        # stream is closed when consumer fails
+        self.assertEqual(closed, [True])
+
+        async def consumer(batch):
+            pass
+
+        with self.assertRaises(KeyError):
+            await User.pipe_batches_async(consumer, filters={'nope': 1})
+
+
+class TestAsyncSavepoint(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine('sqlite+aiosqlite:///:memory:', echo=False)
+
+        # let SQLAlchemy emit BEGIN, so SAVEPOINT works with aiosqlite
+        @sa.event.listens_for(self.engine.sync_engine, 'connect')
+        def do_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @sa.event.listens_for(self.engine.sync_engine, 'begin')
+        def do_begin(conn):
+            conn.exec_driver_sql('BEGIN')
+
+        self.async_session = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        AsyncBaseModel.set_session(self.async_session)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_savepoint_async(self):
+        errors = []
+        async with self.async_session() as session:
+            with AsyncBaseModel.using_session(session):
+                for id_ in [1, 2, 1, 3]:
+                    async with User.savepoint_async(collect=errors):
+                        await User.create_async(id=id_, name='u')
+                self.assertTrue(session.in_transaction())
+                await session.commit()
+
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], sa.exc.IntegrityError)
+        self.assertEqual([u.id for u in await User.all_async()], [1, 2, 3])
+
+    async def test_savepoint_async_raises(self):
+        async with self.async_session() as session:
+            with AsyncBaseModel.using_session(session):
+                await User.create_async(id=1, name='u1')
+                with self.assertRaises(sa.exc.IntegrityError):
+                    async with User.savepoint_async():
+                        await User.create_async(id=2, name='u2')
+                        await User.create_async(id=1, name='duplicate')
+                await session.commit()
+
+        self.assertEqual([u.name for u in await User.all_async()], ['u1'])
+
+    async def test_savepoint_async_needs_session(self):
+        with self.assertRaises(ValueError):
+            async with User.savepoint_async():
+                pass
+
+
 if __name__ == '__main__':
     asyncio.run(unittest.main())
\ No newline at end of file
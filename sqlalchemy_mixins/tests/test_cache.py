@@ -0,0 +1,422 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session
+
+from sqlalchemy_mixins import ActiveRecordMixin, ActiveRecordMixinAsync, \
+    SmartQueryMixin
+from sqlalchemy_mixins import cache as _cache
+from sqlalchemy_mixins.cache import MemoryCache, FileCache, invalidate, \
+    query_key
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+
+
+class BaseModel(Base, ActiveRecordMixin, SmartQueryMixin):
+    __abstract__ = True
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('Post', back_populates='user')
+
+
+class Post(BaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    body = sa.Column(sa.String)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('User', back_populates='posts')
+
+
+class other:
+    # models of other registry with the same names
+    class Base(DeclarativeBase, ActiveRecordMixin):
+        __abstract__ = True
+
+    class User(Base):
+        __tablename__ = 'other_user'
+        id = sa.Column(sa.Integer, primary_key=True)
+        login = sa.Column(sa.String)
+
+
+engine = create_engine('sqlite:///:memory:', echo=False)
+statements = []
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def count_statements(conn, cursor, statement, parameters, context,
+                     executemany):
+    if statement.startswith('SELECT'):
+        statements.append(statement)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        self.sess = Session(engine)
+        BaseModel.set_session(self.sess)
+        self.cache = MemoryCache()
+        BaseModel.set_cache(self.cache)
+
+        self.bill = User.create(name='Bill')
+        self.bob = User.create(name='Bob')
+        Post.create(body='p1', user=self.bill)
+        Post.create(body='p2', user=self.bob)
+        del statements[:]
+
+    def tearDown(self):
+        BaseModel.set_cache(None)
+        self.sess.close()
+
+    def names(self, **filters):
+        self.sess.expunge_all()
+        return [u.name for u in User.where_cached(**filters)]
+
+    def test_hit(self):
+        self.assertEqual(self.names(name='Bill'), ['Bill'])
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(self.names(name='Bill'), ['Bill'])
+        self.assertEqual(len(statements), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # objects are in the session, without SQL
+        user = User.where_cached(name='Bill')[0]
+        self.assertIn(user, self.sess)
+        self.assertIs(user, User.where_cached(name='Bill')[0])
+        self.assertEqual(len(statements), 1)
+
+    def test_key(self):
+        self.assertEqual(
+            query_key(User, {'name': 'Bill', sa.or_: {'id': 1, 'id__gt': 2}}),
+            query_key(User, {sa.or_: {'id__gt': 2, 'id': 1}, 'name': 'Bill'}))
+        self.assertNotEqual(query_key(User, {'id': 1}),
+                            query_key(User, {'id': '1'}))
+        self.assertNotEqual(query_key(User, {'id': 1}),
+                            query_key(Post, {'id': 1}))
+        self.assertNotEqual(query_key(User, sort_attrs=['id', 'name']),
+                            query_key(User, sort_attrs=['name', 'id']))
+        self.assertNotEqual(
+            query_key(User, schema={User.posts.and_(Post.id > 1): 'joined'}),
+            query_key(User, schema={User.posts.and_(Post.id > 2): 'joined'}))
+
+    def test_invalidated_by_mixin_writes(self):
+        self.assertEqual(self.names(name__startswith='B'), ['Bill', 'Bob'])
+        User.create(name='Bishop')
+        self.assertEqual(self.names(name__startswith='B'),
+                         ['Bill', 'Bob', 'Bishop'])
+        User.where(name='Bob').first().update(name='Bobby')
+        self.assertEqual(self.names(name__startswith='B'),
+                         ['Bill', 'Bobby', 'Bishop'])
+        User.where(name='Bishop').first().delete()
+        self.assertEqual(self.names(name__startswith='B'),
+                         ['Bill', 'Bobby'])
+
+    def test_invalidated_by_other_session(self):
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        with Session(engine) as session:
+            session.add(User(name='New'))
+            session.commit()
+        self.assertEqual(self.names(), ['Bill', 'Bob', 'New'])
+
+        with Session(engine) as session:
+            session.query(User).filter_by(name='New').delete()
+            session.commit()
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+
+        with Session(engine) as session:
+            session.execute(sa.update(User).values(name='X'))
+            session.commit()
+        self.assertEqual(self.names(), ['X', 'X'])
+
+    def test_pending_changes_and_rollback(self):
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        self.sess.add(User(name='Pending'))
+        self.assertEqual([u.name for u in User.where_cached()],
+                         ['Bill', 'Bob', 'Pending'])
+        self.sess.rollback()
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+
+    def test_not_committed_changes_are_not_shared(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        file_engine = create_engine('sqlite:///{}/cache.db'.format(tmp))
+        self.addCleanup(file_engine.dispose)
+        Base.metadata.create_all(file_engine)
+        with Session(file_engine) as session:
+            session.add(User(id=1, name='a'))
+            session.commit()
+
+        with Session(file_engine) as a, Session(file_engine) as b:
+            with BaseModel.using_session(a):
+                a.get(User, 1).name = 'DIRTY'
+                a.flush()
+                self.assertEqual([u.name for u in User.where_cached(id=1)],
+                                 ['DIRTY'])
+            with BaseModel.using_session(b):
+                self.assertEqual([u.name for u in User.where_cached(id=1)],
+                                 ['a'])
+            a.rollback()
+
+    def test_joined_tables(self):
+        self.assertEqual(self.names(posts___body='p1'), ['Bill'])
+        Post.create(body='p1', user=self.bob)
+        self.assertEqual(self.names(posts___body='p1'), ['Bill', 'Bob'])
+
+    def test_loaded_relations(self):
+        self.sess.expunge_all()
+        users = User.smart_query_cached(schema={User.posts: 'joined'},
+                                        sort_attrs=['id'])
+        self.assertEqual([p.body for p in users[0].posts], ['p1'])
+        Post.create(body='p3', user=users[0])
+        self.sess.expunge_all()
+        users = User.smart_query_cached(schema={User.posts: 'joined'},
+                                        sort_attrs=['id'])
+        self.assertEqual([p.body for p in users[0].posts], ['p1', 'p3'])
+
+    def test_manual_invalidate(self):
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        with engine.begin() as conn:
+            conn.execute(sa.text("UPDATE user SET name = 'Z'"))
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        invalidate(User)
+        self.assertEqual(self.names(), ['Z', 'Z'])
+
+    def test_ttl(self):
+        self.assertEqual(len(User.smart_query_cached(ttl=0)), 2)
+        self.assertEqual(len(User.smart_query_cached(ttl=0)), 2)
+        self.assertEqual(len(statements), 2)
+
+    def test_lru(self):
+        cache = MemoryCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')),
+                         (1, None, 3))
+        self.assertEqual(len(cache), 2)
+
+    def test_file_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        BaseModel.set_cache(FileCache(directory))
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        self.assertEqual(len(statements), 1)
+
+        # another process sees the results and invalidates them
+        other = FileCache(directory)
+        self.assertIsNotNone(other.get(query_key(User)))
+        invalidate('user')
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        self.assertEqual(len(statements), 2)
+
+        other.set('key', 'value', ttl=0)
+        self.assertIsNone(other.get('key'))
+        other.clear()
+        self.assertIsNone(other.get(query_key(User)))
+
+    def test_no_cache(self):
+        BaseModel.set_cache(None)
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        self.assertEqual(self.names(), ['Bill', 'Bob'])
+        self.assertEqual(len(statements), 2)
+
+
+class TestPkCache(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        self.sess = Session(engine)
+        BaseModel.set_session(self.sess)
+        self.cache = MemoryCache(maxsize=10)
+        User.set_pk_cache(self.cache)
+
+        self.bill = User.create(name='Bill')
+        Post.create(body='p1', user=self.bill)
+        self.sess.close()
+        del statements[:]
+
+    def tearDown(self):
+        User.set_pk_cache(None)
+        self.sess.close()
+
+    def find(self, id_=1):
+        self.sess.close()
+        return User.find(id_)
+
+    def test_hit(self):
+        self.assertEqual(self.find().name, 'Bill')
+        self.assertEqual(len(statements), 1)
+        user = self.find()
+        self.assertEqual(user.name, 'Bill')
+        self.assertEqual(len(statements), 1)
+        self.assertIn(user, self.sess)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.hit_rate, 0.5)
+
+        # relations are loaded as usual
+        self.assertEqual([p.body for p in user.posts], ['p1'])
+        # instance of the session is returned as is
+        self.assertIs(User.find(1), user)
+        self.assertEqual(self.cache.hits, 1)
+
+        # not found and other models are not cached
+        self.assertIsNone(self.find(100))
+        self.assertIsNone(self.find(100))
+        Post.find(1)
+        Post.find(1)
+        self.assertEqual(len(statements), 6)
+
+    def test_instance_is_not_shared(self):
+        self.find()
+        user = self.find()
+        user.name = 'Changed'
+        self.sess.expunge_all()
+        self.assertEqual(User.find(1).name, 'Bill')
+
+    def test_invalidated_by_writes(self):
+        self.find().update(name='Bob')
+        self.assertEqual(self.find().name, 'Bob')
+        self.find().delete()
+        self.assertIsNone(self.find())
+        User.create(id=1, name='Bishop')
+        self.assertEqual(self.find().name, 'Bishop')
+        User.destroy(1)
+        self.assertIsNone(self.find())
+
+    def test_invalidated_by_other_session(self):
+        self.find()
+        with Session(engine) as session:
+            session.get(User, 1).name = 'Bob'
+            session.commit()
+        self.assertEqual(self.find().name, 'Bob')
+
+        with Session(engine) as session:
+            session.execute(sa.update(User).values(name='X'))
+            session.commit()
+        self.assertEqual(self.find().name, 'X')
+
+    def test_not_committed_changes(self):
+        self.find()
+        user = self.find()
+        user.name = 'Pending'
+        self.sess.flush()
+        self.sess.expunge_all()
+        # loaded by the session with flushed changes, so not cached
+        self.assertEqual(User.find(1).name, 'Pending')
+        self.sess.rollback()
+        self.assertEqual(self.find().name, 'Bill')
+
+    def test_manual_invalidate(self):
+        self.find()
+        with engine.begin() as conn:
+            conn.execute(sa.text("UPDATE user SET name = 'Z'"))
+        invalidate(User)
+        self.assertEqual(self.find().name, 'Z')
+
+    def test_changed_while_loading(self):
+        save_instance = _cache.save_instance
+
+        def save_after_write(*args, **kwargs):
+            # other process commits between SELECT and saving its result
+            with engine.begin() as conn:
+                conn.execute(sa.text("UPDATE user SET name = 'Z'"))
+            invalidate(User)
+            save_instance(*args, **kwargs)
+
+        with mock.patch.object(_cache, 'save_instance', save_after_write):
+            self.assertEqual(self.find().name, 'Bill')
+        self.assertEqual(self.find().name, 'Z')
+        self.assertEqual(self.find().name, 'Z')
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_same_class_names(self):
+        User = other.User
+        other.Base.metadata.create_all(engine)
+        other.Base.set_session(self.sess)
+        User.set_pk_cache(self.cache)
+        self.addCleanup(User.set_pk_cache, None)
+        User.create(login='bill')
+        self.sess.close()
+
+        self.assertEqual(self.find().name, 'Bill')
+        self.sess.close()
+        self.assertEqual(User.find(1).login, 'bill')
+        self.sess.close()
+        self.assertEqual(User.find(1).login, 'bill')
+        self.assertEqual(self.find().name, 'Bill')
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 2))
+
+
+class AsyncBase(DeclarativeBase):
+    __abstract__ = True
+
+
+class AsyncBaseModel(AsyncBase, ActiveRecordMixinAsync, SmartQueryMixin):
+    __abstract__ = True
+
+
+class AsyncUser(AsyncBaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+
+
+class TestAsyncCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+        async with self.engine.begin() as conn:
+            await conn.run_sync(AsyncBase.metadata.create_all)
+        AsyncBaseModel.set_session(async_sessionmaker(
+            self.engine, expire_on_commit=False))
+        self.cache = MemoryCache()
+        AsyncBaseModel.set_cache(self.cache)
+
+    async def asyncTearDown(self):
+        AsyncBaseModel.set_cache(None)
+        await self.engine.dispose()
+
+    async def test_select_cached_async(self):
+        await AsyncUser.create_async(name='Bill')
+        users = await AsyncUser.select_cached_async(filters={'name': 'Bill'})
+        self.assertEqual([u.name for u in users], ['Bill'])
+        users = await AsyncUser.select_cached_async(filters={'name': 'Bill'})
+        self.assertEqual([u.name for u in users], ['Bill'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        await users[0].update_async(name='Bob')
+        self.assertEqual(
+            await AsyncUser.select_cached_async(filters={'name': 'Bill'}), [])
+
+        AsyncBaseModel.set_cache(None)
+        users = await AsyncUser.select_cached_async(filters={'name': 'Bob'})
+        self.assertEqual([u.name for u in users], ['Bob'])
+
+    async def test_find_async(self):
+        cache = MemoryCache()
+        AsyncUser.set_pk_cache(cache)
+        self.addCleanup(AsyncUser.set_pk_cache, None)
+        user = await AsyncUser.create_async(name='Bill')
+        self.assertEqual((await AsyncUser.find_async(user.id)).name, 'Bill')
+        self.assertEqual((await AsyncUser.find_async(user.id)).name, 'Bill')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        await user.update_async(name='Bob')
+        self.assertEqual((await AsyncUser.find_async(user.id)).name, 'Bob')
+        self.assertIsNone(await AsyncUser.find_async(100))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
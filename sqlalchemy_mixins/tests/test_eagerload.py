@@ -1,13 +1,18 @@
+import operator
 import unittest
 
 import sqlalchemy as sa
 from sqlalchemy import create_engine
 from sqlalchemy import event
-from sqlalchemy.orm import Query, DeclarativeBase
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Query, DeclarativeBase, aliased
 from sqlalchemy.orm import Session
 
 from sqlalchemy_mixins import EagerLoadMixin
-from sqlalchemy_mixins.eagerload import JOINED, SUBQUERY, eager_expr
+from sqlalchemy_mixins.counts import declared_counts
+from sqlalchemy_mixins.eagerload import JOINED, SUBQUERY, SELECTIN, RAISE, \
+    NOLOAD, IMMEDIATE, LAZY, DEFAULT, COLUMNS, DEFERRED, COUNTS, eager_expr, \
+    _flatten_schema, _eager_expr_from_flat_schema
 
 class Base(DeclarativeBase):
     __abstract__ = True
@@ -24,6 +29,7 @@ class BaseModel(Base, EagerLoadMixin):
 class User(BaseModel):
     __tablename__ = 'user'
     __repr_attrs__ = ['name']
+    __counts__ = ('posts',)
     id = sa.Column(sa.Integer, primary_key=True)
     name = sa.Column(sa.String)
     posts = sa.orm.relationship('Post')
@@ -31,6 +37,7 @@ class User(BaseModel):
 
 class Post(BaseModel):
     __tablename__ = 'post'
+    __counts__ = ('comments',)
     id = sa.Column(sa.Integer, primary_key=True)
     body = sa.Column(sa.String)
     user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
@@ -331,5 +338,213 @@ class TestOrmWithDict(TestEagerLoad):
         self.assertEqual(self.query_count, 2)
 
 
+class TestOtherLoadStrategies(TestEagerLoad):
+    def test_selectin(self):
+        user = User.with_({
+            User.posts: (SELECTIN, {Post.comments: SELECTIN})
+        }).get(1)
+        # user, posts and comments
+        self.assertEqual(self.query_count, 3)
+
+        _ = user.posts[0].comments[0]
+        self.assertEqual(self.query_count, 3)
+
+    def test_with_selectin(self):
+        post = Post.with_selectin(Post.comments, Post.user).get(11)
+        self.assertEqual(self.query_count, 3)
+
+        _ = post.comments[0]
+        _ = post.user
+        self.assertEqual(self.query_count, 3)
+
+    def test_raise(self):
+        post = Post.with_({Post.user: RAISE}).get(11)
+        with self.assertRaises(InvalidRequestError):
+            _ = post.user
+
+    def test_default_raise(self):
+        post = Post.with_({
+            DEFAULT: RAISE,
+            Post.comments: (SELECTIN, {DEFAULT: RAISE})
+        }).get(11)
+        self.assertEqual(self.query_count, 2)
+
+        comment = post.comments[0]
+        self.assertEqual(self.query_count, 2)
+        with self.assertRaises(InvalidRequestError):
+            _ = post.user
+        with self.assertRaises(InvalidRequestError):
+            _ = comment.user
+
+    def test_noload(self):
+        post = Post.with_({Post.user: NOLOAD}).get(11)
+        self.assertIsNone(post.user)
+        self.assertEqual(self.query_count, 1)
+
+    def test_immediate_and_lazy(self):
+        post = Post.with_({Post.user: IMMEDIATE, Post.comments: LAZY}).get(11)
+        self.assertEqual(self.query_count, 2)
+
+        _ = post.user
+        self.assertEqual(self.query_count, 2)
+        _ = post.comments[0]
+        self.assertEqual(self.query_count, 3)
+
+    def test_flat_schema(self):
+        schema = {DEFAULT: RAISE, User.posts: (SELECTIN, {Post.user: JOINED})}
+        flat_schema = _flatten_schema(schema)
+        self.assertEqual(flat_schema, {DEFAULT: RAISE, User.posts: SELECTIN,
+                                       Post.user: JOINED})
+        self.assertEqual(len(_eager_expr_from_flat_schema(flat_schema)), 3)
+
+
+class TestColumnsInSchema(TestEagerLoad):
+    def test_load_only_and_defer(self):
+        sess.expunge_all()
+        post = Post.with_({
+            COLUMNS: ['body'],
+            Post.comments: (SELECTIN, {DEFERRED: [Comment.body, 'rating']})
+        }).get(11)
+        self.assertEqual(self.query_count, 2)
+
+        self.assertEqual(post.body, '1234567890123')
+        self.assertNotIn('archived', post.__dict__)
+        comment = post.comments[0]
+        self.assertNotIn('body', comment.__dict__)
+        self.assertNotIn('rating', comment.__dict__)
+        self.assertEqual(comment.user_id, 1)
+        self.assertEqual(self.query_count, 2)
+
+    def test_aliased_target(self):
+        sess.expunge_all()
+        comment = aliased(Comment)
+        post = Post.with_({
+            Post.comments.of_type(comment): (SELECTIN, {COLUMNS: ['rating']})
+        }).get(11)
+        self.assertEqual(sorted(c.rating for c in post.comments), [1, 2])
+        self.assertNotIn('body', post.comments[0].__dict__)
+        self.assertEqual(self.query_count, 2)
+
+    def test_flat_schema_skips_columns(self):
+        schema = {COLUMNS: ['body'], Post.comments: {COLUMNS: ['body']}}
+        self.assertEqual(_flatten_schema(schema), {Post.comments: JOINED})
+
+    def test_bad_columns(self):
+        with self.assertRaises(KeyError):
+            Post.with_({COLUMNS: ['no_such_column']})
+        # entity is unknown
+        with self.assertRaises(ValueError):
+            eager_expr({COLUMNS: ['body']})
+
+
+class TestCounts(TestEagerLoad):
+    def test_with_counts(self):
+        sess.expunge_all()
+        posts = Post.with_counts(Post.comments).order_by(Post.id).all()
+        self.assertEqual(self.query_count, 1)
+        self.assertEqual([p.comments_count for p in posts], [2, 0, 1, 1])
+        # comments themselves are not loaded
+        self.assertNotIn('comments', posts[0].__dict__)
+
+        users = User.with_counts('posts').order_by(User.id).all()
+        self.assertEqual([u.posts_count for u in users], [2, 2, 0])
+        self.assertEqual(self.query_count, 2)
+
+    def test_declared_counts(self):
+        self.assertEqual(declared_counts(User), ['posts'])
+        self.assertEqual(declared_counts(Post), ['comments'])
+        self.assertEqual(declared_counts(Comment), [])
+
+    def test_counts_in_schema(self):
+        sess.expunge_all()
+        users = User.with_({
+            COUNTS: ['posts'],
+            User.posts: (SELECTIN, {COUNTS: [Post.comments]})
+        }).order_by(User.id).all()
+        self.assertEqual(self.query_count, 2)
+        self.assertEqual([u.posts_count for u in users], [2, 2, 0])
+        self.assertEqual(sorted((p.id, p.comments_count)
+                                for p in users[0].posts),
+                         [(11, 2), (12, 0)])
+
+        # joined load
+        sess.expunge_all()
+        comment = Comment.with_({
+            Comment.post: {COUNTS: ['comments']}
+        }).get(21)
+        self.assertEqual(comment.post.comments_count, 1)
+        self.assertEqual(self.query_count, 3)
+
+    def test_bad_counts(self):
+        with self.assertRaises(KeyError):
+            Post.with_counts('no_such_relation')
+        with self.assertRaises(KeyError):
+            Post.with_({COUNTS: ['body']})
+        # count is not declared in __counts__
+        with self.assertRaises(KeyError):
+            Post.with_counts('user')
+        # entity is unknown
+        with self.assertRaises(ValueError):
+            eager_expr({COUNTS: ['comments']})
+
+
+class TestCompiledSchemas(TestEagerLoad):
+    def assertSameOptions(self, first, second, same=True):
+        self.assertIsInstance(first, list)
+        self.assertEqual(
+            len(first) == len(second) and all(map(operator.is_, first,
+                                                  second)),
+            same)
+
+    def test_equal_schemas_share_options(self):
+        def make_schema():
+            return {User.posts: (SELECTIN, {Post.comments: JOINED,
+                                            COLUMNS: ['body']})}
+        options = eager_expr(make_schema(), User)
+        self.assertSameOptions(eager_expr(make_schema(), User), options)
+
+        other = {User.posts: (SUBQUERY, {Post.comments: JOINED,
+                                         COLUMNS: ['body']})}
+        self.assertSameOptions(eager_expr(other, User), options, same=False)
+
+    def test_criteria_are_part_of_key(self):
+        high = {Post.comments.and_(Comment.rating > 1): SELECTIN}
+        low = {Post.comments.and_(Comment.rating < 2): SELECTIN}
+        self.assertSameOptions(eager_expr(high, Post), eager_expr(low, Post),
+                               same=False)
+        self.assertSameOptions(eager_expr(high, Post), eager_expr(
+            {Post.comments.and_(Comment.rating > 1): SELECTIN}, Post))
+        # bound values are part of the key too
+        self.assertSameOptions(eager_expr(high, Post), eager_expr(
+            {Post.comments.and_(Comment.rating > 2): SELECTIN}, Post),
+            same=False)
+
+        post = Post.with_(high).get(11)
+        self.assertEqual([c.id for c in post.comments], [12])
+        sess.expunge_all()
+        post = Post.with_(low).get(11)
+        self.assertEqual([c.id for c in post.comments], [11])
+
+    def test_registered_schema(self):
+        User.register_schema('user_with_posts', {
+            User.posts: (SUBQUERY, {Post.comments: JOINED})
+        })
+        user = User.with_('user_with_posts').get(1)
+        self.assertEqual(self.query_count, 2)
+        _ = user.posts[0].comments[0]
+        self.assertEqual(self.query_count, 2)
+
+        # re-registering replaces compiled options
+        User.register_schema('user_with_posts', {User.posts: RAISE})
+        sess.expunge_all()
+        user = User.with_('user_with_posts').get(1)
+        with self.assertRaises(InvalidRequestError):
+            _ = user.posts
+
+    def test_unknown_schema_name(self):
+        with self.assertRaises(KeyError):
+            User.with_('no_such_schema')
+
+
 if __name__ == '__main__': # pragma: no cover
     unittest.main()
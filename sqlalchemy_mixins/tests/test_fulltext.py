@@ -0,0 +1,147 @@
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, mysql
+from sqlalchemy.orm import Session, DeclarativeBase
+
+from sqlalchemy_mixins import SmartQueryMixin
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+
+
+engine = create_engine('sqlite:///:memory:', echo=False)
+sess = Session(engine)
+
+
+class BaseModel(Base, SmartQueryMixin):
+    __abstract__ = True
+    pass
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('Post', back_populates='user')
+
+
+class Post(BaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.String)
+    body = sa.Column(sa.String)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('User', back_populates='posts')
+
+
+Post.fulltext_index('title', 'body')
+
+
+class TestFullText(unittest.TestCase):
+    def setUp(self):
+        sess.rollback()
+        BaseModel.set_session(sess)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+
+        self.u1 = User(name='Bill')
+        self.u2 = User(name='Bob')
+        self.p1 = Post(title='Mixins', body='Active record for SQLAlchemy',
+                       user=self.u1)
+        self.p2 = Post(title='Search', body='Full-text search in SQLite',
+                       user=self.u2)
+        self.p3 = Post(title='Other', body='Nothing to see here',
+                       user=self.u2)
+        sess.add_all([self.u1, self.u2, self.p1, self.p2, self.p3])
+        sess.commit()
+
+    def test_search(self):
+        self.assertEqual(Post.where(body__search='sqlalchemy').all(),
+                         [self.p1])
+        # all words should match, case-insensitive
+        self.assertEqual(Post.where(body__search='SEARCH sqlite').all(),
+                         [self.p2])
+        self.assertEqual(Post.where(body__search='search mixins').all(), [])
+        # columns are searched separately
+        self.assertEqual(Post.where(title__search='mixins').all(), [self.p1])
+        self.assertEqual(Post.where(body__search='mixins').all(), [])
+        # FTS5 syntax is searched as plain text
+        self.assertEqual(Post.where(body__search='sql*').all(), [])
+        self.assertEqual(Post.where(body__search='"record" OR').all(), [])
+
+    def test_match(self):
+        self.assertEqual(Post.where(body__match='sql*').all(),
+                         [self.p1, self.p2])
+        self.assertEqual(Post.where(body__match='record OR nothing').all(),
+                         [self.p1, self.p3])
+
+    def test_search_by_relation(self):
+        self.assertEqual(User.where(posts___body__search='see').all(),
+                         [self.u2])
+        self.assertEqual(
+            Post.smart_query(filters={sa.or_: {'title__search': 'search',
+                                               'user___name': 'Bill'}},
+                             sort_attrs=['id']).all(),
+            [self.p1, self.p2])
+
+    def test_index_is_kept_in_sync(self):
+        self.p1.body = 'Changed body'
+        sess.add(Post(title='New', body='Brand new sqlalchemy post'))
+        sess.delete(self.p2)
+        sess.commit()
+
+        self.assertEqual([p.title for p in
+                          Post.where(body__search='sqlalchemy').all()],
+                         ['New'])
+        self.assertEqual(Post.where(body__search='changed').all(), [self.p1])
+        self.assertEqual(Post.where(body__search='sqlite').all(), [])
+
+    def test_errors(self):
+        with self.assertRaises(KeyError):
+            User.where(name__search='Bob')
+        with self.assertRaises(KeyError):
+            User.fulltext_index('nothing')
+        with self.assertRaises(ValueError):
+            Post.fulltext_index('body')
+
+        class OtherBase(DeclarativeBase, SmartQueryMixin):
+            __abstract__ = True
+
+        class Tag(OtherBase):
+            __tablename__ = 'tag'
+            name = sa.Column(sa.String, primary_key=True)
+            description = sa.Column(sa.String)
+
+        # SQLite full-text table needs integer rowid
+        with self.assertRaises(ValueError):
+            Tag.fulltext_index('description')
+
+    def test_sql(self):
+        query = Post.where(body__search='full text')
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("to_tsvector('english', post.body) @@ "
+                      "plainto_tsquery('english', %(param_1)s", sql)
+        sql = str(Post.where(body__match='full & text').statement.compile(
+            dialect=postgresql.dialect()))
+        self.assertIn("to_tsquery('english', %(param_1)s", sql)
+
+        sql = str(query.statement.compile(dialect=mysql.dialect()))
+        self.assertIn('MATCH (post.body) AGAINST '
+                      '(%s IN NATURAL LANGUAGE MODE)', sql)
+
+    def test_lint_filters(self):
+        self.assertEqual(Post.lint_filters({'body__search': 'x',
+                                            'body__contains': 'x'}),
+                         ['body__contains'])
+
+    def test_drop(self):
+        Base.metadata.drop_all(engine)
+        with engine.connect() as conn:
+            self.assertFalse(sa.inspect(conn).has_table('post_fts'))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -3,9 +3,12 @@ import unittest
 import sqlalchemy as sa
 from sqlalchemy import create_engine
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, aliased
+from sqlalchemy.orm.interfaces import MANYTOONE, ONETOMANY
 
 from sqlalchemy_mixins import InspectionMixin
+from sqlalchemy_mixins.utils import relation_graph, resolve_path, \
+    path_to_relations_list
 
 class Base(DeclarativeBase):
     __abstract__ = True
@@ -96,5 +99,82 @@ class TestSessionMixin(unittest.TestCase):
     def tearDown(self):
         Base.metadata.create_all(engine)
 
+class TestRelationGraph(unittest.TestCase):
+    def test_graph(self):
+        graph = relation_graph(User)
+        self.assertEqual(list(graph), User.relations)
+        edge = graph['posts']
+        self.assertEqual((edge.key, edge.mapper.class_, edge.direction,
+                          edge.uselist),
+                         ('posts', Post, ONETOMANY, True))
+        self.assertIs(edge.property, User.posts.property)
+        self.assertIs(relation_graph(User), graph)
+        self.assertIs(relation_graph(aliased(User)), graph)
+        self.assertIs(relation_graph(User.__mapper__), graph)
+
+    def test_resolve_path(self):
+        edges = resolve_path(Post, 'user___posts___user')
+        self.assertEqual([e.key for e in edges], ['user', 'posts', 'user'])
+        self.assertEqual(edges[0].direction, MANYTOONE)
+        self.assertIs(resolve_path(Post, 'user___posts___user'), edges)
+        self.assertEqual(resolve_path(Post, ''), ())
+        self.assertEqual([e.key for e in resolve_path(User, 'posts.user',
+                                                      splitter='.')],
+                         ['posts', 'user'])
+        with self.assertRaises(KeyError):
+            resolve_path(Post, 'user___comments')
+
+        self.assertEqual(path_to_relations_list(User, 'posts.user'),
+                         [User.posts.property, Post.user.property])
+        self.assertEqual(path_to_relations_list(User, 'posts.nope'),
+                         [User.posts.property])
+
+    def test_new_backref(self):
+        class OtherBase(DeclarativeBase, InspectionMixin):
+            __abstract__ = True
+
+        class Author(OtherBase):
+            __tablename__ = 'author'
+            id = sa.Column(sa.Integer, primary_key=True)
+
+        self.assertEqual(list(relation_graph(Author)), [])
+
+        class Book(OtherBase):
+            __tablename__ = 'book'
+            id = sa.Column(sa.Integer, primary_key=True)
+            author_id = sa.Column(sa.Integer, sa.ForeignKey('author.id'))
+            author = sa.orm.relationship('Author', backref='books')
+
+        # graph is rebuilt when new mappers are configured
+        self.assertEqual(list(relation_graph(Author)), ['books'])
+        self.assertEqual(resolve_path(Book, 'author___books')[-1].mapper
+                         .class_, Book)
+
+    def test_add_property(self):
+        class OtherBase(DeclarativeBase, InspectionMixin):
+            __abstract__ = True
+
+        class Author(OtherBase):
+            __tablename__ = 'author'
+            id = sa.Column(sa.Integer, primary_key=True)
+
+        class Book(OtherBase):
+            __tablename__ = 'book'
+            id = sa.Column(sa.Integer, primary_key=True)
+            author_id = sa.Column(sa.Integer, sa.ForeignKey('author.id'))
+
+        self.assertEqual(Book.relations, [])
+        with self.assertRaises(KeyError):
+            resolve_path(Book, 'author')
+
+        # graphs are rebuilt when properties are added to configured mapper
+        Book.__mapper__.add_property(
+            'author', sa.orm.relationship(Author, backref='books'))
+        self.assertEqual(Book.relations, ['author'])
+        self.assertEqual(Author.relations, ['books'])
+        self.assertEqual(resolve_path(Book, 'author___books')[-1].mapper
+                         .class_, Book)
+
+
 if __name__ == '__main__': # pragma: no cover
     unittest.main()
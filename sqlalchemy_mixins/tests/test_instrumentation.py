@@ -0,0 +1,108 @@
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, DeclarativeBase
+
+from sqlalchemy_mixins import ActiveRecordMixin, SmartQueryMixin
+from sqlalchemy_mixins.eagerload import SUBQUERY
+from sqlalchemy_mixins.instrumentation import Instrumentation, MemorySink, \
+    CallbackSink, MixinCall, CALL_OPTION
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+engine = create_engine('sqlite:///:memory:', echo=False)
+sess = Session(engine)
+
+
+class BaseModel(Base, ActiveRecordMixin, SmartQueryMixin):
+    __abstract__ = True
+    pass
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('Post', back_populates='user')
+
+
+class Post(BaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    body = sa.Column(sa.String)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('User', back_populates='posts')
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        sess.rollback()
+        BaseModel.set_session(sess)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+
+        u1 = User(name='Bill', posts=[Post(body='p1'), Post(body='p2')])
+        u2 = User(name='Bob', posts=[Post(body='p3')])
+        sess.add_all([u1, u2])
+        sess.commit()
+        sess.expunge_all()
+
+    def test_disabled_does_not_tag(self):
+        query = Post.where(body='p1')
+        self.assertNotIn(CALL_OPTION, query.get_execution_options())
+
+    def test_attributes_statements_to_mixin_calls(self):
+        sink = MemorySink()
+        with Instrumentation(sink, engine=engine):
+            Post.where(user___name='Bill').all()
+            User.with_({User.posts: SUBQUERY}).all()
+            User.find(1)
+
+        where = MixinCall('Post', 'where', ('user___name',))
+        self.assertEqual(sink.stats[where].executions, 1)
+        self.assertEqual(sink.stats[where].statements, 1)
+        self.assertEqual(sink.stats[where].rows, 2)
+
+        # eager load query is counted as a part of with_() call
+        with_ = MixinCall('User', 'with_', ())
+        self.assertEqual(sink.stats[with_].statements, 2)
+        self.assertEqual(sink.stats[with_].rows, 2)
+
+        find = MixinCall('User', 'find', ())
+        self.assertEqual(sink.stats[find].rows, 1)
+        self.assertGreater(sink.stats[find].duration, 0)
+
+    def test_filters_shape(self):
+        sink = MemorySink()
+        with Instrumentation(sink, engine=engine):
+            Post.smart_query({sa.or_: {'id__gt': 1, 'body': 'p1'}}).all()
+        call = MixinCall('Post', 'smart_query',
+                         (('or_', ('id__gt', 'body')),))
+        self.assertIn(call, sink.stats)
+
+    def test_lazy_loads_and_writes_are_not_attributed(self):
+        records = []
+        with Instrumentation(CallbackSink(records.append), engine=engine):
+            post = Post.find(1)
+            _ = post.user
+            post.body = 'new'
+            sess.commit()
+
+        self.assertEqual(records[0].call, MixinCall('Post', 'find', ()))
+        self.assertEqual([r.call for r in records[1:]], [None, None])
+        # lazy load returned one row, UPDATE affected one row
+        self.assertEqual([r.rows for r in records[1:]], [1, 1])
+
+    def test_disable(self):
+        sink = MemorySink()
+        instrumentation = Instrumentation(sink, engine=engine).enable()
+        User.all()
+        instrumentation.disable()
+        User.all()
+        self.assertEqual(sink.stats[MixinCall('User', 'all', ())].executions, 1)
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,163 @@
+import unittest
+from datetime import date
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine
+from sqlalchemy.orm import DeclarativeBase, Session
+
+from sqlalchemy_mixins import SmartQueryMixin
+from sqlalchemy_mixins.cache import query_key
+from sqlalchemy_mixins.normalize import normalize_filters, filters_hash
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+
+
+class BaseModel(Base, SmartQueryMixin):
+    __abstract__ = True
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('Post', back_populates='user')
+
+
+class Post(BaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    rating = sa.Column(sa.Integer)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('User', back_populates='posts')
+
+
+class TestNormalize(unittest.TestCase):
+    def test_operators(self):
+        self.assertEqual(normalize_filters({'id__exact': 1,
+                                            'user___name__exact': 'Bob'}),
+                         {'id': 1, 'user___name': 'Bob'})
+        self.assertEqual(normalize_filters({'id__between': [1, 5]}),
+                         {'id__ge': 1, 'id__le': 5})
+
+    def test_in_lists(self):
+        self.assertEqual(normalize_filters({'id__in': (3, 1, 3, 2)}),
+                         {'id__in': [1, 2, 3]})
+        self.assertEqual(normalize_filters({'name__notin': ['b', None, 'a']}),
+                         {'name__notin': [None, 'a', 'b']})
+
+    def test_groups(self):
+        self.assertEqual(normalize_filters({sa.and_: {'id': 1}}), {'id': 1})
+        self.assertEqual(normalize_filters({sa.or_: {'id': 1}}), {'id': 1})
+        self.assertEqual(
+            normalize_filters({sa.or_: {'id': 1, sa.or_: {'id__gt': 5}},
+                               sa.and_: [{'name': 'Bob'}, {'name': 'Bob'}]}),
+            {'name': 'Bob', sa.or_: {'id': 1, 'id__gt': 5}})
+        # groups with the same key
+        self.assertEqual(
+            normalize_filters({sa.and_: [{sa.or_: {'id': 1, 'id__gt': 5}},
+                                         {sa.or_: {'name': 'a', 'id': 2}}]}),
+            [{sa.or_: {'id': 1, 'id__gt': 5}},
+             {sa.or_: {'id': 2, 'name': 'a'}}])
+        self.assertEqual(normalize_filters({sa.not_: {'id': 1}}),
+                         {sa.not_: {'id': 1}})
+
+    def test_fold_ranges(self):
+        self.assertEqual(normalize_filters({'id__gt': 1, 'id__ge': 5,
+                                            'id__lt': 10,
+                                            sa.and_: {'id__le': 10}}),
+                         {'id__ge': 5, 'id__lt': 10})
+        self.assertEqual(normalize_filters({'id__ge': 5, 'id__le': 5}),
+                         {'id': 5})
+        self.assertEqual(normalize_filters({'id__in': [1, 5, 9],
+                                            'id__gt': 2}),
+                         {'id__in': [5, 9]})
+        self.assertEqual(normalize_filters({'id': 5, 'id__in': [1, 5],
+                                            'id__lt': 10}),
+                         {'id': 5})
+        self.assertEqual(
+            normalize_filters({'day__between': [date(2020, 1, 1),
+                                                date(2021, 1, 1)],
+                               'day__gt': date(2020, 6, 1)}),
+            {'day__gt': date(2020, 6, 1), 'day__le': date(2021, 1, 1)})
+
+    def test_contradictions(self):
+        self.assertEqual(normalize_filters({'id__gt': 10, 'id__lt': 5}),
+                         {'id__in': []})
+        self.assertEqual(normalize_filters({'id__gt': 5, 'id__le': 5,
+                                            'name': 'Bob'}),
+                         {'id__in': []})
+        self.assertEqual(normalize_filters([{'id': 1},
+                                            {'id': 2, 'id__ge': 1}]),
+                         {'id__in': []})
+        self.assertEqual(normalize_filters({'id__in': [1, 2],
+                                            'id__gt': 2}),
+                         {'id__in': []})
+        # only contradicting alternative is dropped
+        self.assertEqual(
+            normalize_filters({sa.or_: [{sa.and_: {'id__gt': 10,
+                                                   'id__lt': 5}},
+                                        {'name': 'Bob'}]}),
+            {'name': 'Bob'})
+
+    def test_not_folded(self):
+        # string order depends on database collation
+        self.assertEqual(normalize_filters({'name__gt': 'a',
+                                            'name__lt': 'B'}),
+                         {'name__gt': 'a', 'name__lt': 'B'})
+        # may be hybrid methods
+        self.assertEqual(normalize_filters([{'is_public': 1},
+                                            {'is_public': 2}]),
+                         [{'is_public': 1}, {'is_public': 2}])
+        self.assertEqual(normalize_filters({'id__gt': 1, 'id__ne': 3}),
+                         {'id__gt': 1, 'id__ne': 3})
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            normalize_filters({sa.or_: 1})
+
+    def test_hash(self):
+        self.assertEqual(filters_hash({'id__in': [1, 2], 'name': 'Bob'}),
+                         filters_hash({sa.and_: {'name__exact': 'Bob'},
+                                       'id__in': (2, 1, 2)}))
+        self.assertEqual(filters_hash({}), filters_hash(None))
+        self.assertNotEqual(filters_hash({'id': 1}), filters_hash({'id': '1'}))
+        self.assertNotEqual(filters_hash({sa.or_: {'id': 1, 'name': 'a'}}),
+                            filters_hash({sa.and_: {'id': 1, 'name': 'a'}}))
+        self.assertEqual(query_key(User, {'id': 1}),
+                         query_key(User, {'id__exact': 1}))
+
+
+class TestNormalizedQueries(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(engine)
+        self.sess = Session(engine)
+        BaseModel.set_session(self.sess)
+        bill, bob = User(name='Bill'), User(name='Bob')
+        self.sess.add_all([bill, bob] + [
+            Post(rating=r, user=u) for r, u in
+            [(1, bill), (3, bill), (5, bob), (7, bob)]])
+        self.sess.commit()
+
+    def tearDown(self):
+        self.sess.close()
+
+    def test_same_results(self):
+        for filters in [
+            {'rating__in': [7, 1, 7], 'rating__gt': 1},
+            {'rating__between': [2, 6], 'rating__ge': 3},
+            {'rating__gt': 5, 'rating__lt': 3},
+            {sa.or_: [{sa.and_: {'rating__gt': 5, 'rating__lt': 3}},
+                      {'user___name__exact': 'Bill'}]},
+            {'rating': 5, 'rating__in': [5, 7], 'user___name': 'Bob'},
+        ]:
+            expected = Post.smart_query(filters, ['id']).all()
+            normalized = normalize_filters(filters)
+            self.assertEqual(Post.smart_query(normalized, ['id']).all(),
+                             expected, filters)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
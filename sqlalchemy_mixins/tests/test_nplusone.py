@@ -0,0 +1,126 @@
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, DeclarativeBase
+
+from sqlalchemy_mixins import ActiveRecordMixin, EagerLoadMixin, \
+    SerializeMixin
+from sqlalchemy_mixins.eagerload import JOINED, SELECTIN
+from sqlalchemy_mixins.nplusone import NPlusOneDetector, NPlusOneError
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+engine = create_engine('sqlite:///:memory:', echo=False)
+sess = Session(engine)
+
+
+class BaseModel(Base, ActiveRecordMixin, EagerLoadMixin, SerializeMixin):
+    __abstract__ = True
+    pass
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('Post', back_populates='user')
+
+
+class Post(BaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    body = sa.Column(sa.String)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('User', back_populates='posts')
+
+
+class TestNPlusOneDetector(unittest.TestCase):
+    def setUp(self):
+        sess.close()
+        BaseModel.set_session(sess)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+
+        sess.add_all([
+            User(name='Bill', posts=[Post(body='p1'), Post(body='p2')]),
+            User(name='Bob', posts=[Post(body='p3')]),
+        ])
+        sess.commit()
+        sess.expunge_all()
+
+    def test_raises_on_lazy_load_storm(self):
+        with NPlusOneDetector():
+            with self.assertRaises(NPlusOneError) as context:
+                for post in Post.all():
+                    _ = post.user
+        self.assertIn('{Post.user: JOINED}', str(context.exception))
+
+    def test_serialization_storm(self):
+        with NPlusOneDetector(raise_errors=False) as detector:
+            [user.to_dict(nested=True) for user in User.all()]
+        self.assertEqual(detector.detected, [User.posts])
+        self.assertEqual(detector.suggested_schema(), {User.posts: SELECTIN})
+
+    def test_suggested_schema_fixes_storm(self):
+        with NPlusOneDetector(raise_errors=False) as detector:
+            [user.to_dict(nested=True) for user in User.all()]
+        schema = detector.suggested_schema()
+        sess.expunge_all()
+
+        with NPlusOneDetector() as detector:
+            users = User.with_(schema).all()
+            [user.to_dict(nested=True) for user in users]
+        self.assertEqual(detector.counts, {})
+
+    def test_nested_suggested_schema(self):
+        with NPlusOneDetector(raise_errors=False) as detector:
+            for post in Post.all():
+                _ = post.user.posts
+        schema = detector.suggested_schema()
+        self.assertEqual(schema, {Post.user: (JOINED, {User.posts: SELECTIN})})
+        self.assertEqual(detector.suggested_schema(Post), schema)
+        self.assertEqual(detector.suggested_schema(User), {})
+        sess.expunge_all()
+
+        with NPlusOneDetector() as detector:
+            for post in Post.with_(schema).all():
+                _ = post.user.posts
+        self.assertEqual(detector.counts, {})
+
+    def test_nested_error_message(self):
+        with self.assertRaises(NPlusOneError) as context:
+            with NPlusOneDetector():
+                for post in Post.with_({Post.user: JOINED}).all():
+                    _ = post.user.posts
+        self.assertIn('User.posts was lazy loaded 2 times, eager load it '
+                      'with schema {Post.user: (JOINED, {User.posts: '
+                      'SELECTIN})}', str(context.exception))
+
+    def test_threshold(self):
+        with NPlusOneDetector(threshold=3) as detector:
+            for post in Post.all():
+                _ = post.user
+        self.assertEqual(detector.counts, {Post.user.property: 2})
+        self.assertEqual(detector.detected, [])
+
+    def test_logs_instead_of_raising(self):
+        with self.assertLogs('sqlalchemy_mixins', 'WARNING') as logs:
+            with NPlusOneDetector(raise_errors=False):
+                for post in Post.all():
+                    _ = post.user
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Post.user was lazy loaded 2 times', logs.output[0])
+
+    def test_inactive_outside_of_context(self):
+        detector = NPlusOneDetector()
+        with detector:
+            pass
+        for post in Post.all():
+            _ = post.user
+        self.assertEqual(detector.counts, {})
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,217 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Session
+
+from sqlalchemy_mixins import ActiveRecordMixin, ActiveRecordMixinAsync, \
+    SmartQueryMixin
+from sqlalchemy_mixins.routing import RoutingSession, RoundRobin, \
+    LeastLatency
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+
+
+class BaseModel(Base, ActiveRecordMixin, SmartQueryMixin):
+    __abstract__ = True
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+
+
+class AsyncBase(DeclarativeBase):
+    __abstract__ = True
+
+
+class AsyncBaseModel(AsyncBase, ActiveRecordMixinAsync, SmartQueryMixin):
+    __abstract__ = True
+
+
+class AsyncUser(AsyncBaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+
+
+def make_databases(test, names):
+    """
+    SQLite file per name, each with user #1 named after the database,
+    so we can tell which database served a query
+    """
+    tmp = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, tmp)
+    urls = []
+    for name in names:
+        path = os.path.join(tmp, name + '.db')
+        engine = create_engine('sqlite:///' + path)
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add(User(id=1, name=name))
+            session.commit()
+        engine.dispose()
+        urls.append(path)
+    return urls
+
+
+class TestRouting(unittest.TestCase):
+    def setUp(self):
+        paths = make_databases(self, ['writer', 'r1', 'r2'])
+        self.writer, self.r1, self.r2 = \
+            [create_engine('sqlite:///' + p) for p in paths]
+        for engine in (self.writer, self.r1, self.r2):
+            self.addCleanup(engine.dispose)
+
+    def tearDown(self):
+        if BaseModel._session is not None:
+            BaseModel.session.remove()
+            BaseModel.set_session(None)
+
+    def names(self, n=4):
+        result = []
+        for _ in range(n):
+            User.session.expunge_all()
+            result.append(User.where(id=1).first().name)
+        return result
+
+    def test_round_robin(self):
+        session = BaseModel.set_engines(self.writer, [self.r1, self.r2])
+        self.assertIsInstance(session(), RoutingSession)
+        self.assertEqual(self.names(), ['r1', 'r2', 'r1', 'r2'])
+        User.session.expunge_all()
+        self.assertIn(User.find(1).name, ('r1', 'r2'))
+        User.session.expunge_all()
+        self.assertIn(User.sort('id').all()[0].name, ('r1', 'r2'))
+
+    def test_writes_go_to_writer(self):
+        BaseModel.set_engines(self.writer, [self.r1], sticky_seconds=0)
+        User.create(name='new')
+        User.session.expunge_all()
+        # not replicated to r1
+        self.assertIsNone(User.where(name='new').first())
+        with Session(self.writer) as session:
+            self.assertEqual(session.query(User).filter_by(name='new')
+                             .count(), 1)
+
+    def test_read_your_writes(self):
+        BaseModel.set_engines(self.writer, [self.r1], sticky_seconds=60)
+        User.create(name='new')
+        User.session.expunge_all()
+        self.assertEqual(User.where(name='new').first().name, 'new')
+        self.assertEqual(self.names(1), ['writer'])
+
+    def test_flushed_changes(self):
+        BaseModel.set_engines(self.writer, [self.r1], sticky_seconds=0)
+        session = User.session
+        session.add(User(name='new'))
+        session.flush()
+        # not committed changes are visible only in writer transaction
+        self.assertEqual(User.where(name='new').first().name, 'new')
+        session.rollback()
+        self.assertEqual(self.names(1), ['r1'])
+
+    def test_for_update(self):
+        BaseModel.set_engines(self.writer, [self.r1])
+        user = User.query.with_for_update().filter_by(id=1).first()
+        self.assertEqual(user.name, 'writer')
+
+    def test_no_readers(self):
+        BaseModel.set_engines(self.writer)
+        self.assertEqual(self.names(2), ['writer', 'writer'])
+
+    def test_least_latency(self):
+        policy = LeastLatency()
+        BaseModel.set_engines(self.writer, [self.r1, self.r2], policy=policy)
+        # not measured engines are tried first
+        self.assertEqual(self.names(1), ['r1'])
+        self.assertGreater(policy.latencies[self.r1], 0)
+        self.assertEqual(self.names(1), ['r2'])
+
+        policy.latencies[self.r1] = 10.0
+        policy.latencies[self.r2] = 0.0
+        self.assertEqual(self.names(2), ['r2', 'r2'])
+
+    def test_least_latency_first_sample(self):
+        durations = []
+
+        class Recording(LeastLatency):
+            def record(self, engine, duration):
+                durations.append(duration)
+                super().record(engine, duration)
+
+        policy = Recording(alpha=0.5)
+        BaseModel.set_engines(self.writer, [self.r1], policy=policy)
+        self.names(1)
+        # first measurement is taken as is, not averaged with zero
+        self.assertEqual(policy.latencies[self.r1], durations[0])
+
+    def test_least_latency_listeners_removed(self):
+        policy = LeastLatency()
+        BaseModel.set_engines(self.writer, [self.r1, self.r2], policy=policy)
+        self.names(2)
+        self.assertTrue(sa.event.contains(self.r1, 'before_cursor_execute',
+                                          policy._listeners[self.r1][0]))
+        before, after = policy._listeners[self.r1]
+
+        # engines replaced
+        BaseModel.set_engines(self.writer, [self.r2])
+        self.assertFalse(sa.event.contains(self.r1, 'before_cursor_execute',
+                                           before))
+        self.assertFalse(sa.event.contains(self.r1, 'after_cursor_execute',
+                                           after))
+        self.assertEqual(policy.latencies, {})
+
+    def test_least_latency_average(self):
+        policy = LeastLatency(alpha=0.5)
+        policy.record('e', 1.0)
+        self.assertEqual(policy.latencies['e'], 1.0)
+        policy.record('e', 3.0)
+        self.assertEqual(policy.latencies['e'], 2.0)
+
+    def test_round_robin_policy(self):
+        policy = RoundRobin()
+        self.assertEqual([policy.choose(['a', 'b', 'c']) for _ in range(4)],
+                         ['a', 'b', 'c', 'a'])
+
+
+class TestAsyncRouting(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        paths = make_databases(self, ['writer', 'r1'])
+        self.writer, self.r1 = [create_async_engine('sqlite+aiosqlite:///' + p)
+                                for p in paths]
+
+    async def asyncTearDown(self):
+        AsyncBaseModel.set_session(None)
+        await self.writer.dispose()
+        await self.r1.dispose()
+
+    async def test_routing(self):
+        AsyncBaseModel.set_engines(self.writer, [self.r1], sticky_seconds=0,
+                                   expire_on_commit=False)
+        self.assertEqual((await AsyncUser.find_async(1)).name, 'r1')
+        self.assertEqual((await AsyncUser.first_async()).name, 'r1')
+
+        # each async method uses new session, so there's nothing to stick to
+        await AsyncUser.create_async(name='new')
+        self.assertEqual((await AsyncUser.where_async(name='new')).all(), [])
+
+    async def test_read_your_writes(self):
+        AsyncBaseModel.set_engines(self.writer, [self.r1], sticky_seconds=60,
+                                   expire_on_commit=False)
+        async with AsyncBaseModel.session() as session:
+            with AsyncBaseModel.using_session(session):
+                await AsyncUser.create_async(name='new')
+                user = (await AsyncUser.where_async(name='new')).first()
+                self.assertEqual(user.name, 'new')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from functools import partial
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session, scoped_session, \
+    sessionmaker
+
+from sqlalchemy_mixins import ActiveRecordMixinAsync, SmartQueryMixin
+from sqlalchemy_mixins.scan import make_shards, Checkpoint, Shard, \
+    ScanProgress, MINMAX, QUANTILES, PROCESS
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+
+
+class BaseModel(Base, SmartQueryMixin, ActiveRecordMixinAsync):
+    __abstract__ = True
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('Post', back_populates='user')
+
+
+class Post(BaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    rating = sa.Column(sa.Integer)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('User', back_populates='posts')
+
+
+class Event(BaseModel):
+    __tablename__ = 'event'
+    # attribute name differs from column name
+    event_id = sa.Column('id', sa.Integer, primary_key=True)
+
+
+class Tag(BaseModel):
+    __tablename__ = 'tag'
+    name = sa.Column(sa.String, primary_key=True)
+
+
+def post_ids(posts):
+    return [p.id for p in posts]
+
+
+class ScanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'scan.db')
+        self.engine = create_engine('sqlite:///' + self.path)
+        Base.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            session.add_all([User(id=1, name='Bill'), User(id=2, name='Bob')])
+            # sparse keys: 1..90 and 1000..1009
+            session.add_all([Post(id=i, rating=i % 5, user_id=i % 2 + 1)
+                             for i in list(range(1, 91)) +
+                             list(range(1000, 1010))])
+            session.commit()
+        BaseModel.set_session(scoped_session(sessionmaker(self.engine)))
+
+    def tearDown(self):
+        BaseModel.session.remove()
+        self.engine.dispose()
+        shutil.rmtree(self.dir)
+
+
+class TestParallelScan(ScanTestCase):
+    def test_shards(self):
+        with Session(self.engine) as session:
+            self.assertEqual(make_shards(Post, session, 2, MINMAX),
+                             [Shard(0, 1, 506), Shard(1, 506, 1010)])
+            self.assertEqual(make_shards(Post, session, 4, QUANTILES),
+                             [Shard(0, 1, 26), Shard(1, 26, 51),
+                              Shard(2, 51, 76), Shard(3, 76, 1010)])
+            self.assertEqual(make_shards(Post, session, 200, QUANTILES)[-1],
+                             Shard(99, 1009, 1010))
+            with self.assertRaises(ValueError):
+                make_shards(Post, session, 2, 'random')
+            with self.assertRaises(ValueError):
+                make_shards(Tag, session, 2)
+            session.execute(sa.delete(Post))
+            self.assertEqual(make_shards(Post, session, 2), [])
+
+    def test_scan(self):
+        progress = []
+        results = Post.parallel_scan(post_ids, {'rating__in': [1, 2]},
+                                     workers=3, batch_size=7,
+                                     method=QUANTILES, progress=progress.append)
+        ids = [i for batch in results for i in batch]
+        self.assertEqual(ids, [p.id for p in Post.where(rating__in=[1, 2])
+                               .order_by(Post.id)])
+        self.assertTrue(all(len(batch) <= 7 for batch in results))
+        self.assertEqual(progress[-1], ScanProgress(3, 3, len(ids)))
+
+        # filters with relations and eager load schema
+        names = Post.parallel_scan(
+            lambda posts: {p.user.name for p in posts},
+            {'user___name': 'Bob', 'id__lt': 10}, workers=2,
+            schema={Post.user: 'joined'})
+        self.assertEqual(set.union(*names), {'Bob'})
+
+        with self.assertRaises(ValueError):
+            Post.parallel_scan(post_ids, mode='fiber')
+
+    def test_pk_attribute_name(self):
+        Event.session.add_all([Event(event_id=i) for i in range(1, 11)])
+        Event.session.commit()
+        results = Event.parallel_scan(
+            lambda events: [e.event_id for e in events], workers=2,
+            batch_size=3)
+        self.assertEqual([i for batch in results for i in batch],
+                         list(range(1, 11)))
+
+    def test_process_mode(self):
+        progress = []
+        results = Post.parallel_scan(len, {'rating': 0}, workers=2,
+                                     mode=PROCESS, batch_size=5,
+                                     progress=progress.append)
+        self.assertEqual(sum(results), 20)
+        self.assertEqual(progress[-1], ScanProgress(2, 2, 20))
+
+        # workers create engines with the factory
+        results = Post.parallel_scan(
+            len, workers=2, mode=PROCESS,
+            engine_factory=partial(create_engine, 'sqlite:///' + self.path))
+        self.assertEqual(sum(results), 100)
+
+    def test_process_mode_in_memory(self):
+        for url in ['sqlite://', 'sqlite:///:memory:',
+                    'sqlite:///file:scan?mode=memory&uri=true']:
+            with self.assertRaises(ValueError):
+                Post.parallel_scan(len, mode=PROCESS, engine=create_engine(
+                    url, poolclass=sa.pool.StaticPool))
+
+    def test_checkpoint(self):
+        checkpoint = os.path.join(self.dir, 'scan.json')
+        seen = []
+
+        def fail_once(posts):
+            if 50 in post_ids(posts) and not os.path.exists(
+                    checkpoint + '.failed'):
+                open(checkpoint + '.failed', 'w').close()
+                raise RuntimeError('connection lost')
+            seen.extend(post_ids(posts))
+
+        with self.assertRaises(RuntimeError):
+            Post.parallel_scan(fail_once, workers=2, batch_size=10,
+                               checkpoint=checkpoint)
+        with open(checkpoint) as f:
+            state = json.load(f)
+        self.assertEqual(state['shards'], [[0, 1, 506], [1, 506, 1010]])
+        self.assertEqual(state['last']['0'], 40)
+        self.assertEqual(state['done'], [1])
+
+        # new rows in the scanned shard are not re-read
+        Post.session.add(Post(id=5000, rating=1))
+        Post.session.commit()
+        progress = []
+        Post.parallel_scan(fail_once, workers=2, batch_size=10,
+                           checkpoint=Checkpoint(checkpoint),
+                           progress=progress.append)
+        self.assertEqual(sorted(seen),
+                         list(range(1, 91)) + list(range(1000, 1010)))
+        self.assertEqual(progress[-1], ScanProgress(2, 2, 50))
+        self.assertTrue(Checkpoint(checkpoint).finished)
+        self.assertEqual(Post.parallel_scan(post_ids, checkpoint=checkpoint),
+                         [])
+
+
+class TestParallelScanAsync(ScanTestCase, unittest.IsolatedAsyncioTestCase):
+    async def test_scan_async(self):
+        engine = create_async_engine('sqlite+aiosqlite:///' + self.path)
+        BaseModel.set_session(async_sessionmaker(engine))
+        try:
+            async def ids(posts):
+                return post_ids(posts)
+
+            results = await Post.parallel_scan_async(
+                ids, {'user___name': 'Bill'}, workers=2, batch_size=20,
+                shards=4)
+            self.assertEqual([i for batch in results for i in batch],
+                             [i for i in range(1, 91) if i % 2 == 0] +
+                             [i for i in range(1000, 1010) if i % 2 == 0])
+
+            checkpoint = os.path.join(self.dir, 'scan.json')
+            progress = []
+            results = await Post.parallel_scan_async(
+                len, workers=2, checkpoint=checkpoint,
+                progress=progress.append)
+            self.assertEqual(sum(results), 100)
+            self.assertEqual(progress[-1], ScanProgress(2, 2, 100))
+            self.assertTrue(Checkpoint(checkpoint).finished)
+        finally:
+            await engine.dispose()
+            BaseModel.set_session(scoped_session(sessionmaker(self.engine)))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
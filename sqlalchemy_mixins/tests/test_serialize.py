@@ -1,4 +1,7 @@
+import json
 import unittest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 
 import sqlalchemy as sa
 from sqlalchemy import create_engine
@@ -6,6 +9,9 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Session, DeclarativeBase
 
 from sqlalchemy_mixins import SerializeMixin
+from sqlalchemy_mixins.serialize import serialize_batches
+from sqlalchemy_mixins.eagerload import eager_expr, COLUMNS, DEFERRED, \
+    SELECTIN
 
 class Base(DeclarativeBase):
     __abstract__ = True
@@ -54,6 +60,19 @@ class Comment(BaseModel):
     post = sa.orm.relationship('Post')
 
 
+class Product(BaseModel):
+    __tablename__ = 'product'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    price = sa.Column(sa.Float)
+    added = sa.orm.deferred(sa.Column(sa.Date))
+
+    @hybrid_property
+    def double_price(self):
+        return self.price * 2
+
+
 class TestSerialize(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -178,5 +197,136 @@ class TestSerialize(unittest.TestCase):
         }
         self.assertDictEqual(result, expected)
 
+    def test_serialize_only_loaded_columns(self):
+        schema = {
+            COLUMNS: ['body', 'user_id'],
+            Post.comments: (SELECTIN, {DEFERRED: ['body', 'rating']})
+        }
+        post = self.session.query(Post)\
+                    .options(*eager_expr(schema, Post)).first()
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sa.event.listen(self.engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        result = post.to_dict(nested=True)
+        sa.event.remove(self.engine, 'before_cursor_execute',
+                        before_cursor_execute)
+
+        # only user was lazy loaded, deferred columns were not
+        self.assertEqual(len(statements), 1)
+        expected = {
+            'id': 11,
+            'body': 'Post 11 body.',
+            'user_id': 1,
+            'user': {
+                'id': 1,
+                'name': 'Bill u1',
+                'password': 'pass1'
+            },
+            'comments': [
+                {
+                    'id': 11,
+                    'user_id': 1,
+                    'post_id': 11,
+                }
+            ]
+        }
+        self.assertDictEqual(result, expected)
+
+    def test_serialize_mapper_deferred(self):
+        self.session.add(Product(id=1, name='p1', price=2.0,
+                                 added=date(2020, 1, 1)))
+        self.session.commit()
+        self.session.expunge_all()
+        product = self.session.query(Product).options(
+            sa.orm.defer(Product.price)).first()
+        # deferred by mapper is loaded, deferred by query is skipped
+        self.assertDictEqual(product.to_dict(), {
+            'id': 1,
+            'name': 'p1',
+            'added': date(2020, 1, 1)
+        })
+
+    def test_serialize_expired(self):
+        user = self.session.query(User).first()
+        self.session.commit()
+        self.assertDictEqual(user.to_dict(), {
+            'id': 1,
+            'name': 'Bill u1',
+            'password': 'pass1'
+        })
+
+class TestJsonChunks(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine('sqlite:///:memory:', echo=False)
+        Base.metadata.create_all(cls.engine)
+        cls.session = Session(cls.engine)
+        cls.session.add_all([
+            Product(id=i, name='p{}'.format(i) if i % 3 else None,
+                    price=i * 1.5, added=date(2020, 1, i % 28 + 1))
+            for i in range(1, 101)])
+        cls.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.close()
+        Base.metadata.drop_all(cls.engine)
+
+    def expected(self, **kwargs):
+        result = []
+        for p in self.session.query(Product).order_by(Product.id):
+            row = p.to_dict(**kwargs)
+            row['added'] = row['added'].isoformat()
+            result.append(row)
+        return result
+
+    def test_in_process(self):
+        chunks = list(Product.to_json_chunks(session=self.session,
+                                             batch_size=30))
+        self.assertEqual(len(chunks), 5)  # 4 batches and closing bracket
+        self.assertEqual(json.loads(b''.join(chunks)), self.expected())
+
+        chunks = Product.to_json_chunks(Product.price > 140,
+                                        session=self.session,
+                                        hybrid_attributes=True,
+                                        exclude=['added'])
+        self.assertEqual(json.loads(b''.join(chunks)), [
+            {'id': i, 'name': 'p{}'.format(i) if i % 3 else None,
+             'price': i * 1.5, 'double_price': i * 3.0}
+            for i in range(94, 101)])
+
+        chunks = Product.to_json_chunks(Product.id < 0, session=self.session)
+        self.assertEqual(b''.join(chunks), b'[]')
+
+    def test_process_pool(self):
+        chunks = Product.to_json_chunks(session=self.session, batch_size=7,
+                                        threshold=20, processes=2)
+        self.assertEqual(json.loads(b''.join(chunks)), self.expected())
+
+        with ProcessPoolExecutor(2) as executor:
+            chunks = list(serialize_batches(
+                ['n', 'x', 'big'],
+                [[(i, i / 2, 2 ** 70)] for i in range(10)] +
+                [[(None, 1, 'a'), (True, 2.5, 'b')]],
+                processes=2, threshold=0, executor=executor))
+            # executor is left running
+            self.assertEqual(executor.submit(abs, -1).result(), 1)
+        self.assertEqual(len(chunks), 12)
+        self.assertEqual(json.loads(b''.join(chunks)),
+                         [{'n': i, 'x': i / 2, 'big': 2 ** 70}
+                          for i in range(10)] +
+                         [{'n': None, 'x': 1, 'big': 'a'},
+                          {'n': True, 'x': 2.5, 'big': 'b'}])
+
+    def test_no_session(self):
+        with self.assertRaises(ValueError):
+            next(Product.to_json_chunks())
+
+
 if __name__ == '__main__':
     unittest.main()
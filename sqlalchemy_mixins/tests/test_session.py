@@ -1,4 +1,7 @@
+import asyncio
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 import sqlalchemy as sa
 from sqlalchemy import create_engine
@@ -57,6 +60,62 @@ class TestSessionMixin(unittest.TestCase):
         self.assertEqual(User.query.first(), session.query(User).first())
         self.assertEqual(Post.query.first(), session.query(Post).first())
 
+    def test_using_session(self):
+        BaseModel.set_session(session)
+        other, another = Session(engine), Session(engine)
+
+        with BaseModel.using_session(other) as s:
+            self.assertIs(s, other)
+            self.assertIs(User.session, other)
+            self.assertIs(Post.session, other)
+            self.assertIs(User.query.session, other)
+
+            # innermost override wins, but only for its class
+            with User.using_session(another):
+                self.assertIs(User.session, another)
+                self.assertIs(Post.session, other)
+            self.assertIs(User.session, other)
+
+        self.assertIs(User.session, session)
+
+    def test_using_session_without_default(self):
+        BaseModel.set_session(None)
+        other = Session(engine)
+        with User.using_session(other):
+            self.assertIs(User.session, other)
+            with self.assertRaises(NoSessionError):
+                _ = Post.session
+
+    def test_using_session_in_threads(self):
+        BaseModel.set_session(session)
+        barrier = threading.Barrier(4)
+
+        def work(i):
+            own = Session(engine)
+            with BaseModel.using_session(own):
+                # all threads are inside using_session at the same time
+                barrier.wait()
+                return User.session is own
+
+        with ThreadPoolExecutor(4) as pool:
+            self.assertEqual(list(pool.map(work, range(4))), [True] * 4)
+        self.assertIs(User.session, session)
+
+    def test_using_session_in_asyncio_tasks(self):
+        BaseModel.set_session(session)
+
+        async def work(own):
+            with BaseModel.using_session(own):
+                await asyncio.sleep(0)
+                return User.session is own
+
+        async def main():
+            return await asyncio.gather(
+                *[work(Session(engine)) for _ in range(4)])
+
+        self.assertEqual(asyncio.run(main()), [True] * 4)
+        self.assertIs(User.session, session)
+
     def tearDown(self):
         Base.metadata.create_all(engine)
 
@@ -5,9 +5,12 @@ import sqlalchemy as sa
 from sqlalchemy import create_engine
 from sqlalchemy import event
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session, DeclarativeBase
 from sqlalchemy_mixins import SmartQueryMixin, smart_query
-from sqlalchemy_mixins.eagerload import JOINED, SUBQUERY
+from sqlalchemy_mixins import smartquery
+from sqlalchemy_mixins.eagerload import JOINED, SUBQUERY, SELECTIN, COLUMNS, \
+    COUNTS
 
 class Base(DeclarativeBase):
     __abstract__ = True
@@ -27,6 +30,7 @@ class BaseModel(Base, SmartQueryMixin):
 class User(BaseModel):
     __tablename__ = 'user'
     __repr_attrs__ = ['name']
+    __counts__ = ('comments',)
     id = sa.Column(sa.Integer, primary_key=True)
     name = sa.Column(sa.String)
 
@@ -99,6 +103,13 @@ class Comment(BaseModel):
     post = sa.orm.relationship('Post')
 
 
+class Attachment(BaseModel):
+    __tablename__ = 'attachment'
+    id = sa.Column(sa.Integer, primary_key=True)
+    data = sa.Column(sa.LargeBinary)
+    duration = sa.Column(sa.Interval)
+
+
 class BaseTest(unittest.TestCase):
     def setUp(self):
         sess.rollback()
@@ -383,6 +394,305 @@ class TestFilterExpr(BaseTest):
         test(dict(created_at__year_le=2015), {cm11, cm12, cm21})
         test(dict(created_at__month_lt=10), {cm11})
 
+    def test_sargable_sql(self):
+        def sql(**filters):
+            return str(Comment.where(**filters).statement.compile(
+                compile_kwargs={'literal_binds': True}))
+
+        self.assertIn("comment.created_at >= '2014-01-01 00:00:00' "
+                      "AND comment.created_at < '2015-01-01 00:00:00'",
+                      sql(created_at__year=2014))
+        self.assertNotIn('EXTRACT', sql(created_at__year_le=2014))
+        self.assertIn("lower(comment.body) LIKE lower('cm1%')",
+                      sql(body__istartswith='cm1'))
+
+        # on dates, ranges are made of dates
+        expr = Comment._operators['year'](sa.column('day', sa.Date), 2014)
+        self.assertEqual(
+            str(expr.compile(compile_kwargs={'literal_binds': True})),
+            "day >= '2014-01-01' AND day < '2015-01-01'")
+
+    def test_more_operators(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+
+        def test(filters, expected_result):
+            result = set(Comment.where(**filters).all())
+            self.assertEqual(result, expected_result)
+
+        test(dict(created_at__year_ne=2015), {cm11, cm22})
+        test(dict(created_at__year_lt=2015), {cm11})
+        test(dict(body__contains='CM1'), {cm11, cm12})
+
+        # the last year has no upper bound
+        test(dict(created_at__year=9999), set())
+        test(dict(created_at__year_ne=9999), {cm11, cm12, cm21, cm22})
+        test(dict(created_at__year_gt=9999), set())
+        test(dict(created_at__year_le=9999), {cm11, cm12, cm21, cm22})
+        cm22.created_at = datetime.datetime(9999, 12, 31)
+        sess.flush()
+        test(dict(created_at__year=9999), {cm22})
+        test(dict(created_at__year_ge=9999), {cm22})
+        test(dict(created_at__year_lt=9999), {cm11, cm12, cm21})
+
+
+class TestOperatorRegistry(BaseTest):
+    def tearDown(self):
+        for cls in (Post, Comment):
+            if '_operators' in cls.__dict__:
+                del cls._operators
+
+    def test_register_operator(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+
+        Comment.register_operator('len_gt',
+                                  lambda c, v: sa.func.length(c) > v,
+                                  index_friendly=False)
+
+        @Comment.register_operator('ieq')
+        def ieq(column, value):
+            return sa.func.lower(column) == sa.func.lower(value)
+
+        self.assertEqual(set(Comment.where(body__len_gt=10).all()),
+                         {cm11, cm12, cm21, cm22})
+        self.assertEqual(Comment.where(body__ieq='CM12 TO P12').all(),
+                         [cm12])
+        self.assertEqual(Post.where(comments___body__ieq='CM21 to p21').all(),
+                         [p21])
+
+        # other models are not affected
+        self.assertNotIn('len_gt', Post._operators)
+        self.assertNotIn('len_gt', SmartQueryMixin._operators)
+        with self.assertRaises(KeyError):
+            Post.where(body__ieq='x')
+
+        with self.assertRaises(ValueError):
+            Comment.register_operator('a__b', lambda c, v: c == v)
+
+    def test_lint_filters(self):
+        Comment.register_operator('len_gt',
+                                  lambda c, v: sa.func.length(c) > v,
+                                  index_friendly=False)
+
+        self.assertEqual(Comment.lint_filters({
+            'rating__gt': 1,
+            'body__startswith': 'cm',
+            'body__like': 'cm%',
+            'created_at__year': 2014,
+            'created_at__year_le': 2014,
+            'post___body__in': ['a'],
+        }), [])
+
+        self.assertEqual(Comment.lint_filters({
+            'body__contains': 'cm',
+            'body__like': '%cm',
+            'body__len_gt': 5,
+            sa.or_: {
+                'created_at__month': 1,
+                'post___user___name__iendswith': 'ob',
+            }
+        }), ['body__contains', 'body__like', 'body__len_gt',
+             'created_at__month', 'post___user___name__iendswith'])
+
+    def test_lint_filters_errors(self):
+        with self.assertRaises(KeyError):
+            Comment.lint_filters({'post___nothing___name': 'x'})
+        with self.assertRaises(KeyError):
+            Comment.lint_filters({'body__nothing': 'x'})
+
+
+class TestAggregate(BaseTest):
+    def test_group_by_relation(self):
+        self._seed()
+        statements = []
+
+        def count(*args):
+            statements.append(args)
+
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            res = Comment.aggregate(
+                group_by=['post___user___name'],
+                metrics={'n': 'count', 'avg_rating': ('avg', 'rating')},
+                sort_attrs=['post___user___name'])
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(res, [
+            {'post___user___name': None, 'n': 1, 'avg_rating': None},
+            {'post___user___name': 'Alex u2', 'n': 2, 'avg_rating': 2.0},
+            {'post___user___name': 'Bill u1', 'n': 2, 'avg_rating': 1.5},
+        ])
+
+    def test_filters_and_sort_by_metric(self):
+        self._seed()
+        res = Comment.aggregate(filters={'rating__ge': 2},
+                                group_by=['user___name'],
+                                metrics={'total': ('sum', 'rating')},
+                                sort_attrs=['-total'])
+        self.assertEqual(res, [{'user___name': 'Bishop u3', 'total': 3},
+                               {'user___name': 'Alex u2', 'total': 2}])
+
+        res = User.aggregate(
+            filters={sa.or_: {'name__like': 'Al%', 'posts___id__in': [11]}},
+            group_by=['name'],
+            metrics={'posts': ('count_distinct', 'posts___id'),
+                     'comments': ('count', 'posts___comments___id')},
+            sort_attrs=['name'])
+        self.assertEqual(res, [{'name': 'Alex u2', 'posts': 2, 'comments': 2},
+                               {'name': 'Bill u1', 'posts': 1, 'comments': 1}])
+
+    def test_as_columns(self):
+        self._seed()
+        res = Comment.aggregate(metrics={'n': 'count',
+                                         'max_rating': ('max', 'rating')},
+                                as_columns=True)
+        self.assertEqual(res, {'n': [5], 'max_rating': [3]})
+
+        res = Comment.aggregate(group_by=['rating'], metrics={'n': 'count'},
+                                sort_attrs=['rating'], as_columns=True)
+        self.assertEqual(res, {'rating': [None, 1, 2, 3], 'n': [1, 2, 1, 1]})
+
+    def test_incorrect_params(self):
+        with self.assertRaises(KeyError):
+            Comment.aggregate(metrics={'n': ('median', 'rating')})
+        with self.assertRaises(ValueError):
+            Comment.aggregate(metrics={'n': 'sum'})
+        with self.assertRaises(KeyError):
+            Comment.aggregate(group_by=['post___nothing___name'])
+        with self.assertRaises(KeyError):
+            Comment.aggregate(group_by=['post___nothing'])
+        with self.assertRaises(KeyError):
+            Comment.aggregate(metrics={'n': 'count'}, sort_attrs=['nothing'])
+
+
+class TestCounts(BaseTest):
+    def test_filter_by_count(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+
+        self.assertEqual(User.where(comments___count__gt=1).all(), [u1])
+        self.assertEqual(set(User.where(comments___count=1).all()), {u2, u3})
+        self.assertEqual(User.where(posts___count=0).all(), [u3])
+        # count of related object's relation
+        self.assertEqual(
+            set(Comment.where(user___comments___count__ge=2).all()),
+            {cm11, cm21})
+        self.assertEqual(
+            set(Comment.smart_query({sa.or_: {'user___comments___count': 1,
+                                              'rating': 3}}).all()),
+            {cm12, cm22})
+
+    def test_counts_are_subqueries(self):
+        sql = str(User.where(comments___count__gt=1))
+        self.assertNotIn('OUTER JOIN', sql)
+        self.assertIn('count(*)', sql)
+
+    def test_sort_by_count(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+
+        self.assertEqual(User.sort('-comments___count', 'id').all(),
+                         [u1, u2, u3])
+        self.assertEqual(Post.sort('-user___comments___count', 'id').all(),
+                         [p11, p12, p21, p22])
+
+    def test_counts_in_schema(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+        sess.expunge_all()
+
+        users = User.smart_query(filters={'posts___count__ge': 1},
+                                 sort_attrs=['id'],
+                                 schema={COUNTS: ['comments']}).all()
+        self.assertEqual([(u.id, u.comments_count) for u in users],
+                         [(u1.id, 2), (u2.id, 1)])
+
+    def test_counts_are_not_columns(self):
+        self.assertNotIn('comments_count', User.columns)
+        self.assertNotIn('comments_count', User.sortable_attributes)
+        self.assertNotIn('comments_count', User.filterable_attributes)
+
+    def test_incorrect_count_paths(self):
+        with self.assertRaises(KeyError):
+            User.where(comments___count__nothing=1)
+        with self.assertRaises(KeyError):
+            User.sort('comments___count__gt')
+
+
+class TestLargeInLists(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self._threshold = smartquery.LARGE_IN_THRESHOLD
+        self._chunk_size = smartquery.IN_CHUNK_SIZE
+        smartquery.LARGE_IN_THRESHOLD = 2
+        smartquery.IN_CHUNK_SIZE = 2
+
+    def tearDown(self):
+        smartquery.LARGE_IN_THRESHOLD = self._threshold
+        smartquery.IN_CHUNK_SIZE = self._chunk_size
+
+    def test_in_and_notin(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+
+        res = Comment.where(id__in=[11, 12, 21, 100]).all()
+        self.assertEqual(set(res), {cm11, cm12, cm21})
+
+        res = Comment.where(id__notin=(11, 12, 21, 100)).all()
+        self.assertEqual(set(res), {cm22, cm_empty})
+
+        # small lists and relations
+        res = Comment.where(id__in=[11, 12],
+                            post___user___id__in={1, 2, 3}).all()
+        self.assertEqual(set(res), {cm11, cm12})
+
+    def test_statement_is_cached_per_number_of_chunks(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+
+        self.assertEqual(set(Comment.where(id__in=[11, 12, 21]).all()),
+                         {cm11, cm12, cm21})
+        self.assertEqual(set(Comment.where(id__in=[22, 29, 100]).all()),
+                         {cm22, cm_empty})
+
+    def test_sql(self):
+        query = Comment.where(id__in=[1, 2, 3])
+        sql = str(query.statement.compile(
+            compile_kwargs={'literal_binds': True}))
+        self.assertIn('comment.id IN (1, 2) OR comment.id IN (3)', sql)
+
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('comment.id = ANY (%(param_1)s::INTEGER[])', sql)
+
+        query = Comment.where(id__notin=[1, 2, 3])
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('comment.id != ALL (%(param_1)s::INTEGER[])', sql)
+
+    def test_other_types(self):
+        sess.add(Attachment(id=1, data=b'x',
+                            duration=datetime.timedelta(minutes=1)))
+        sess.flush()
+        # bound as usual, not rendered as literals
+        self.assertEqual(Attachment.where(data__in=[b'x'] * 5).count(), 1)
+        self.assertEqual(Attachment.where(data__notin=[b'y'] * 5).count(), 1)
+        self.assertEqual(Attachment.where(duration__in=[
+            datetime.timedelta(minutes=i) for i in range(5)]).count(), 1)
+        sql = str(Attachment.where(data__in=[b'x'] * 5).statement.compile(
+            dialect=postgresql.dialect()))
+        self.assertNotIn('ANY', sql)
+
+    def test_huge_list(self):
+        smartquery.LARGE_IN_THRESHOLD = self._threshold
+        smartquery.IN_CHUNK_SIZE = self._chunk_size
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+
+        ids = list(range(12, 50012))
+        self.assertEqual(set(Comment.where(id__in=ids).all()),
+                         {cm12, cm21, cm22, cm_empty})
 
 
 # noinspection PyUnusedLocal
@@ -717,6 +1027,36 @@ class TestFullSmartQuery(BaseTest):
             }).all()
         self.assertEqual(res, [cm12, cm21, cm22])
 
+    def test_schema_with_columns(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+        sess.expunge_all()
+
+        res = Comment.smart_query(
+            filters={'post___public': True, 'user__isnull': False},
+            sort_attrs=['user___name', '-created_at'],
+            schema={
+                COLUMNS: ['body', 'post_id'],
+                Comment.post: (SELECTIN, {COLUMNS: ['body']})
+            }).all()
+        self.assertEqual([c.id for c in res], [12, 21, 22])
+        self.assertEqual(res[0].body, 'cm12 to p12')
+        self.assertNotIn('rating', res[0].__dict__)
+        self.assertEqual(res[0].post.body, '1234567890')
+        self.assertNotIn('archived', res[0].post.__dict__)
+
+    def test_registered_schema(self):
+        u1, u2, u3, p11, p12, p21, p22, cm11, cm12, cm21, cm22, cm_empty = \
+            self._seed()
+        Comment.register_schema('comment_with_post', {
+            Comment.post: {Post.user: JOINED}
+        })
+        res = Comment.smart_query(
+            filters={'post___public': True, 'user__isnull': False},
+            sort_attrs=['user___name', '-created_at'],
+            schema='comment_with_post').all()
+        self.assertEqual(res, [cm12, cm21, cm22])
+
 
 # noinspection PyUnusedLocal
 class TestSmartQueryAutoEagerLoad(BaseTest):
@@ -0,0 +1,247 @@
+import json
+import pickle
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, \
+    async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session
+
+from sqlalchemy_mixins import ActiveRecordMixinAsync, SmartQueryMixin
+from sqlalchemy_mixins.spec import SpecError, CompiledSpec, encode_cursor, \
+    decode_cursor
+
+
+class Base(DeclarativeBase):
+    __abstract__ = True
+
+
+class BaseModel(Base, SmartQueryMixin):
+    __abstract__ = True
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('Post', back_populates='user')
+
+
+class Post(BaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    rating = sa.Column(sa.Integer)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('User', back_populates='posts')
+
+
+class TestSpec(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(engine)
+        self.sess = Session(engine)
+        BaseModel.set_session(self.sess)
+        bill, bob = User(id=1, name='Bill'), User(id=2, name='Bob')
+        self.sess.add_all([bill, bob] + [
+            Post(id=i, rating=r, user=u) for i, r, u in
+            [(1, 1, bill), (2, 3, bill), (3, 5, bob), (4, 7, bob)]])
+        self.sess.commit()
+
+    def tearDown(self):
+        self.sess.close()
+
+    def ids(self, spec):
+        posts, cursor = Post.query_spec(spec)
+        return [p.id for p in posts], cursor
+
+    def test_filters(self):
+        spec = json.loads('''{
+            "filters": {"rating__gt": 1,
+                        "$or": [{"user___name": "Bill"}, {"id__in": [4]}]},
+            "sort": ["-rating"]
+        }''')
+        self.assertEqual(self.ids(spec), ([4, 2], None))
+        self.assertEqual(self.ids({'filters': {'$not': {'user___name': 'Bob'}},
+                                   'sort': ['id']}), ([1, 2], None))
+        self.assertEqual(self.ids({'filters': {'$not': {'user___name': 'Bob',
+                                                        'rating__gt': 5}},
+                                   'sort': ['id']}), ([1, 2, 3], None))
+        self.assertEqual(self.ids({'filters': {'$not': [{'id': 1},
+                                                        {'rating': 1}]},
+                                   'sort': ['id']}), ([2, 3, 4], None))
+        self.assertEqual(self.ids({'filters': {'rating__between': [2, 5]},
+                                   'sort': ['id']}), ([2, 3], None))
+        self.assertEqual(self.ids({'filters': {'$and': [{'rating__ge': 3},
+                                                        {'rating__le': 5}]},
+                                   'sort': ['id']}), ([2, 3], None))
+        self.assertEqual(self.ids({}), ([1, 2, 3, 4], None))
+
+    def test_pages(self):
+        spec = {'filters': {'rating__gt': 1}, 'sort': ['-rating'], 'limit': 2}
+        ids, cursor = self.ids(spec)
+        self.assertEqual(ids, [4, 3])
+        spec['cursor'] = cursor
+        self.assertEqual(self.ids(spec), ([2], None))
+
+        # primary key makes order deterministic
+        compiled = Post.compile_spec({'sort': ['user___name'], 'limit': 3})
+        self.assertEqual(compiled.sort_attrs, ['user___name', 'id'])
+        posts, cursor = compiled.page()
+        self.assertEqual([p.id for p in posts], [1, 2, 3])
+        posts, cursor = compiled.page(cursor)
+        self.assertEqual(([p.id for p in posts], cursor), ([4], None))
+
+    def test_schema(self):
+        spec = {'schema': {'user': 'joined'}, 'sort': ['id']}
+        posts, _ = Post.query_spec(spec)
+        self.sess.close()
+        self.assertEqual(posts[0].user.name, 'Bill')
+
+        spec = {'schema': {'posts': ['selectin', {'user': 'joined'}]},
+                'sort': ['id']}
+        users, _ = User.query_spec(spec)
+        self.sess.close()
+        self.assertEqual([p.user.name for p in users[1].posts],
+                         ['Bob', 'Bob'])
+
+    def test_compiled_is_reused(self):
+        spec = {'filters': {'id__in': [2, 1]}, 'limit': 1}
+        compiled = Post.compile_spec(spec)
+        self.assertIs(Post.compile_spec(dict(spec, cursor=encode_cursor(1))),
+                      compiled)
+        self.assertEqual(compiled.filters, {'id__in': [1, 2]})
+
+    def test_pickle(self):
+        compiled = Post.compile_spec({
+            'filters': {'$or': {'rating__gt': 5, 'user___name': 'Bill'}},
+            'sort': ['-rating'], 'schema': {'user': 'joined'}, 'limit': 2})
+        compiled.page()
+        restored = pickle.loads(pickle.dumps(compiled))
+        self.assertIsInstance(restored, CompiledSpec)
+        posts, cursor = restored.page()
+        self.assertEqual([p.id for p in posts], [4, 2])
+        self.assertEqual([p.id for p in restored.page(cursor)[0]], [1])
+
+    def test_validate(self):
+        self.assertEqual(Post.validate_spec({
+            'filters': {'user___name__startswith': 'B',
+                        '$or': [{'id': 1}, {'user___posts___count__gt': 1}]},
+            'sort': ['-user___name', 'rating'],
+            'schema': {'user': {'posts': 'selectin'},
+                       '__columns__': ['id', 'rating']},
+            'limit': 10, 'cursor': encode_cursor(10)}), [])
+
+        errors = Post.validate_spec({
+            'filters': {'body': 1, 'user___nope': 1, 'rating__bad': 1,
+                        'users___name': 1, '$xor': {}},
+            'sort': ['-body'],
+            'schema': {'user': 'eager', 'nope': 'joined'},
+            'limit': 0, 'cursor': 'bad', 'offset': 1})
+        self.assertEqual(errors, [
+            'unknown key `offset`',
+            'filter `body`: Post doesnt have filterable attribute `body`',
+            'filter `user___nope`: User doesnt have filterable attribute '
+            '`nope`',
+            'filter `rating__bad`: unknown operator `bad`',
+            'filter `users___name`: Incorrect path `users`: Post doesnt have '
+            '`users` relationship',
+            'unknown filter group `$xor`',
+            'sort `-body`: Post doesnt have sortable attribute `body`',
+            "schema `user`: unknown loading strategy 'eager'",
+            'schema `nope`: Incorrect path `nope`: Post doesnt have `nope` '
+            'relationship',
+            'limit should be integer from 1 to infinity, not 0',
+            'Bad cursor `bad`'])
+
+        self.assertEqual(Post.validate_spec({'filters': {
+            'id__in': 1, 'user___name__notin': 'Bob',
+            'rating__between': [1], '$not': {'id__between': [1, 2, 3]}}}), [
+            'filter `id__in`: should be list, not 1',
+            "filter `user___name__notin`: should be list, not 'Bob'",
+            'filter `rating__between`: should be list of 2 items, not [1]',
+            'filter `id__between`: should be list of 2 items, not [1, 2, 3]'])
+
+        self.assertEqual(Post.validate_spec({'filters': {
+            'user___name__isnull': 'no', 'rating__isnull': False,
+            'user___name__contains': None, 'user___name__like': 'B%',
+            'rating__year': True, 'rating__month_gt': '1',
+            'rating__day': 1}}), [
+            "filter `user___name__isnull`: should be bool, not 'no'",
+            'filter `user___name__contains`: should be str, not None',
+            'filter `rating__year`: should be int, not True',
+            "filter `rating__month_gt`: should be int, not '1'"])
+
+        self.assertEqual(Post.validate_spec({'limit': 101}, max_limit=100),
+                         ['limit should be integer from 1 to 100, not 101'])
+        self.assertEqual(Post.validate_spec({'filters': 1}),
+                         ['filters should be object or list, not 1'])
+        with self.assertRaises(SpecError) as e:
+            Post.compile_spec({'sort': 'id'})
+        self.assertEqual(e.exception.errors,
+                         ["sort should be list of strings, not 'id'"])
+        with self.assertRaises(ValueError):
+            Post.query_spec([])
+
+    def test_cursor(self):
+        self.assertEqual(decode_cursor(encode_cursor(20)), 20)
+        self.assertEqual(decode_cursor(None), 0)
+        for cursor in ['', 'x', encode_cursor(-1), encode_cursor('1')]:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class AsyncBase(DeclarativeBase):
+    __abstract__ = True
+
+
+class AsyncBaseModel(AsyncBase, ActiveRecordMixinAsync, SmartQueryMixin):
+    __abstract__ = True
+
+
+class AsyncUser(AsyncBaseModel):
+    __tablename__ = 'user'
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    posts = sa.orm.relationship('AsyncPost', back_populates='user')
+
+
+class AsyncPost(AsyncBaseModel):
+    __tablename__ = 'post'
+    id = sa.Column(sa.Integer, primary_key=True)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'))
+    user = sa.orm.relationship('AsyncUser', back_populates='posts')
+
+
+class TestAsyncSpec(unittest.IsolatedAsyncioTestCase):
+    async def test_page_async(self):
+        engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+        async with engine.begin() as conn:
+            await conn.run_sync(AsyncBase.metadata.create_all)
+        AsyncBaseModel.set_session(async_sessionmaker(engine))
+        for name in ['Bill', 'Bob', 'Bishop']:
+            await AsyncUser.create_async(name=name)
+
+        compiled = AsyncUser.compile_spec({'filters': {'name__startswith': 'B'},
+                                           'sort': ['name'], 'limit': 2})
+        users, cursor = await compiled.page_async()
+        self.assertEqual([u.name for u in users], ['Bill', 'Bishop'])
+        users, cursor = await compiled.page_async(cursor)
+        self.assertEqual(([u.name for u in users], cursor), (['Bob'], None))
+
+        # relationships out of schema raise instead of lazy load
+        await AsyncPost.create_async(user_id=1)
+        compiled = AsyncPost.compile_spec(
+            {'schema': {'user': {'posts': 'joined'}}})
+        posts, _ = await compiled.page_async()
+        self.assertEqual(len(posts[0].user.posts), 1)
+        async with AsyncSession(engine) as session:
+            with AsyncBaseModel.using_session(session):
+                posts, _ = await AsyncPost.compile_spec({}).page_async()
+                with self.assertRaises(sa.exc.InvalidRequestError):
+                    posts[0].user
+        await engine.dispose()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
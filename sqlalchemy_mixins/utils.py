@@ -1,3 +1,7 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import RelationshipProperty, Mapper
 
 
@@ -15,6 +19,46 @@ class classproperty(object):
         return self.fget(owner_cls)
 
 
+class LRUCache(object):
+    """
+    Thread-safe bounded mapping, evicts least recently used items
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
 def get_relations(cls):
     if isinstance(cls, Mapper):
         mapper = cls
@@ -24,14 +68,82 @@ def get_relations(cls):
             if isinstance(c, RelationshipProperty)]
 
 
+# relationship of a model as an edge of the relation graph
+RelationEdge = namedtuple('RelationEdge',
+                          'key property mapper direction uselist')
+
+# {mapper: (mapper.attrs graph was built from, {relation name: RelationEdge})}
+_relation_graphs = {}
+# resolved relation paths by (mapper, path, splitter)
+_relation_paths = LRUCache(maxsize=1024)
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _clear_relation_graphs():
+    # new mappers may add relationships (backrefs) to existing ones
+    _relation_graphs.clear()
+    _relation_paths.clear()
+
+
+def relation_graph(cls):
+    """
+    Relationships of model (mapper or alias) by name, built once
+    per set of mapper properties:
+        {'user': RelationEdge(key='user', property=<RelationshipProperty>,
+                              mapper=<Mapper User>, direction=MANYTOONE,
+                              uselist=False)}
+    """
+    mapper = inspect(cls).mapper
+    # noinspection PyProtectedMember
+    mapper._check_configure()
+    # memoized by mapper, replaced when add_property() changes properties
+    attrs = mapper.attrs
+    built = _relation_graphs.get(mapper)
+    if built is not None and built[0] is attrs:
+        return built[1]
+    if built is not None:
+        # resolved paths may go through replaced relationships
+        _relation_paths.clear()
+    graph = OrderedDict(
+        (rel.key, RelationEdge(rel.key, rel, rel.mapper, rel.direction,
+                               rel.uselist))
+        for rel in get_relations(mapper))
+    _relation_graphs[mapper] = (attrs, graph)
+    return graph
+
+
+def resolve_path(cls, path, splitter='___'):
+    """
+    Edges of relation path like 'post___user' (tuple of RelationEdge),
+    cached. Raises KeyError if some relationship doesn't exist.
+    """
+    mapper = inspect(cls).mapper
+    key = (mapper, path, splitter)
+    edges = _relation_paths.get(key)
+    if edges is None:
+        edges = []
+        for name in path.split(splitter) if path else []:
+            edge = relation_graph(mapper).get(name)
+            if edge is None:
+                raise KeyError('Incorrect path `{}`: {} doesnt have `{}` '
+                               'relationship'.format(path,
+                                                     mapper.class_.__name__,
+                                                     name))
+            edges.append(edge)
+            mapper = edge.mapper
+        edges = tuple(edges)
+        _relation_paths.set(key, edges)
+    return edges
+
+
 def path_to_relations_list(cls, path):
-    path_as_list = path.split('.')
-    relations = get_relations(cls)
     relations_list = []
-    for item in path_as_list:
-        for rel in relations:
-            if rel.key == item:
-                relations_list.append(rel)
-                relations = get_relations(rel.entity)
-                break
-    return relations_list
\ No newline at end of file
+    # unknown relations are skipped
+    for item in path.split('.'):
+        try:
+            edge, = resolve_path(cls, item)
+        except (KeyError, ValueError):
+            continue
+        relations_list.append(edge.property)
+        cls = edge.mapper
+    return relations_list
@@ -1,6 +1,8 @@
-from typing import Callable, Any, List, Type
+from typing import Callable, Any, Hashable, List, NamedTuple, Tuple, Type, \
+    Dict, Union
 
-from sqlalchemy.orm import DeclarativeBase, RelationshipProperty
+from sqlalchemy.orm import DeclarativeBase, RelationshipProperty, Mapper
+from sqlalchemy.orm.interfaces import RelationshipDirection
 
 
 class classproperty(object):
@@ -9,4 +11,38 @@ class classproperty(object):
 
     def __get__(self, owner_self: Any, owner_cls: Any) -> Any: ...
 
+class LRUCache:
+    maxsize: int
+
+    def __init__(self, maxsize: int = 128) -> None: ...
+
+    def get(self, key: Hashable, default: Any = None) -> Any: ...
+
+    def set(self, key: Hashable, value: Any) -> None: ...
+
+    def pop(self, key: Hashable, default: Any = None) -> Any: ...
+
+    def clear(self) -> None: ...
+
+    def __contains__(self, key: Hashable) -> bool: ...
+
+    def __len__(self) -> int: ...
+
 def get_relations(cls: Type[DeclarativeBase]) -> List[RelationshipProperty]: ...
+
+def path_to_relations_list(cls: Type[DeclarativeBase],
+                           path: str) -> List[RelationshipProperty]: ...
+
+class RelationEdge(NamedTuple):
+    key: str
+    property: RelationshipProperty
+    mapper: Mapper
+    direction: RelationshipDirection
+    uselist: bool
+
+def relation_graph(
+        cls: Union[Type[DeclarativeBase], Mapper, Any]
+) -> Dict[str, RelationEdge]: ...
+
+def resolve_path(cls: Union[Type[DeclarativeBase], Mapper, Any], path: str,
+                 splitter: str = '___') -> Tuple[RelationEdge, ...]: ...